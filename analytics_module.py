@@ -1,12 +1,16 @@
 from sqlalchemy import (
     create_engine,
     Column,
+    DateTime,
     Integer,
     String,
     Float,
     Text,
     ForeignKey,
+    Index,
+    UniqueConstraint,
     inspect,
+    text,
 )
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 from config_db import ANALYTICS_DATABASE_URI
@@ -15,6 +19,10 @@ from decorators import login_required, role_required
 
 Base = declarative_base()
 
+# Rows counted as "ai" by log_rollup.classify_reason; queries must repeat it verbatim
+# for the planner to use the partial index below
+AI_REASON_PREDICATE = "upper(reason) LIKE 'AI%'"
+
 AnalyticsEngine = create_engine(
     ANALYTICS_DATABASE_URI,
     echo=True,
@@ -40,9 +48,23 @@ class AttackType(Base):
 
 class AttackLog(Base):
     __tablename__ = "attack_logs"
+    __table_args__ = (
+        # /logs keyset pages, time-range exports, retention and today's AI attacks
+        Index("ix_attack_logs_timestamp_id", "timestamp", "id"),
+        # /logs/download?status=...&from=...&to=...
+        Index("ix_attack_logs_status_timestamp_id", "status", "timestamp", "id"),
+        # Dashboard top AI attacks by score: walks only the scored AI rows
+        Index(
+            "ix_attack_logs_ai_score_timestamp",
+            "score",
+            "timestamp",
+            postgresql_where=text(AI_REASON_PREDICATE),
+            sqlite_where=text(AI_REASON_PREDICATE),
+        ),
+    )
 
     id = Column(Integer, primary_key=True)
-    timestamp = Column(String, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
     reason = Column(Text, nullable=False)
     query = Column(Text, nullable=False)
     score = Column(Float)
@@ -59,12 +81,114 @@ class AttackLog(Base):
         )
 
 
+class AttackLogRollup(Base):
+    __tablename__ = "attack_log_rollups"
+
+    hour = Column(DateTime, primary_key=True)
+    status = Column(String, primary_key=True)
+    reason_class = Column(String, primary_key=True)
+    # 0 stands for "no attack type" so the column can be part of the key
+    attack_type_id = Column(Integer, primary_key=True, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (
+            f"<AttackLogRollup(hour='{self.hour}', "
+            f"status='{self.status}', "
+            f"reason_class='{self.reason_class}', "
+            f"count={self.count})>"
+        )
+
+
+class QueryFingerprint(Base):
+    __tablename__ = "query_fingerprints"
+
+    id = Column(Integer, primary_key=True)
+    # sha1 of the fingerprint: long queries would not fit a btree key
+    fingerprint_hash = Column(String(40), unique=True, nullable=False)
+    fingerprint = Column(Text, nullable=False)
+    sample_query = Column(Text, nullable=False)
+    first_seen = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return (
+            f"<QueryFingerprint(fingerprint='{self.fingerprint}', "
+            f"count={self.count})>"
+        )
+
+
+class AttackLogWindow(Base):
+    __tablename__ = "attack_log_windows"
+    __table_args__ = (
+        UniqueConstraint(
+            "window_start",
+            "fingerprint_id",
+            "status",
+            "reason_class",
+            "source_ip",
+            "attack_type_id",
+            name="uq_attack_log_windows_key",
+        ),
+        Index("ix_attack_log_windows_last_seen_id", "last_seen", "id"),
+        Index("ix_attack_log_windows_status_last_seen_id", "status", "last_seen", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    window_start = Column(DateTime, nullable=False)
+    fingerprint_id = Column(Integer, ForeignKey("query_fingerprints.id"), nullable=False)
+    status = Column(String, nullable=False)
+    reason_class = Column(String, nullable=False)
+    reason = Column(Text, nullable=False)
+    source_ip = Column(String, nullable=False, default="127.0.0.1")
+    # 0 stands for "no attack type", as in attack_log_rollups
+    attack_type_id = Column(Integer, nullable=False, default=0)
+    max_score = Column(Float)
+    first_seen = Column(DateTime, nullable=False)
+    last_seen = Column(DateTime, nullable=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    fingerprint = relationship("QueryFingerprint")
+    attack_type = relationship(
+        "AttackType",
+        primaryjoin="foreign(AttackLogWindow.attack_type_id) == AttackType.id",
+        viewonly=True,
+    )
+
+    # Same attribute names as AttackLog so templates can render either
+    @property
+    def timestamp(self):
+        return self.last_seen
+
+    @property
+    def query(self):
+        return self.fingerprint.sample_query
+
+    @property
+    def score(self):
+        return self.max_score
+
+    def __repr__(self):
+        return (
+            f"<AttackLogWindow(window='{self.window_start}', "
+            f"status='{self.status}', "
+            f"count={self.count})>"
+        )
+
+
 @login_required
 def create_analytics_tables():
     inspector = inspect(AnalyticsEngine)
     existing_tables = inspector.get_table_names()
 
-    required_tables = {"attack_logs", "attack_types"}
+    required_tables = {
+        "attack_logs",
+        "attack_types",
+        "attack_log_rollups",
+        "query_fingerprints",
+        "attack_log_windows",
+    }
     missing_tables = required_tables - set(existing_tables)
 
     if missing_tables:
@@ -0,0 +1,290 @@
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+
+from analytics_module import (
+    AI_REASON_PREDICATE,
+    AttackLog,
+    AttackLogRollup,
+    AttackLogWindow,
+    AttackType,
+    QueryFingerprint,
+)
+from log_compaction import LOG_COMPACTION
+from log_rollup import TIMESTAMP_FORMAT, classify_reason, hour_of, next_hour
+
+ANALYTICS_CACHE_MAX_ENTRIES = 512
+# Other workers write logs too; their batches only reach this cache by expiry
+ANALYTICS_CACHE_TTL = 15
+ANALYTICS_TOP_LIMIT = 5
+
+RANGES = {
+    "hour": (timedelta(hours=1), "hour"),
+    "day": (timedelta(days=1), "hour"),
+    "week": (timedelta(weeks=1), "day"),
+}
+BUCKETS = {"hour": timedelta(hours=1), "day": timedelta(days=1)}
+SQLITE_BUCKET_FORMATS = {
+    "hour": "%Y-%m-%d %H:00:00.000000",
+    "day": "%Y-%m-%d 00:00:00.000000",
+}
+CUSTOM_HOURLY_LIMIT = timedelta(days=2)
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+
+class AggregateCache:
+    def __init__(self, max_entries=ANALYTICS_CACHE_MAX_ENTRIES, ttl=ANALYTICS_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get_or_compute(self, key, scope, compute):
+        # scope: (since, until, status, attack_type_id, ai_only), what events can change the value
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        value = compute()
+        with self._lock:
+            self._entries[key] = (value, scope, now + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def invalidate(self, touched):
+        # touched: {(hour, status, attack_type_id, is_ai)} of the flushed events;
+        # only entries whose range and filters cover one of them are dropped
+        with self._lock:
+            stale = [
+                key for key, (_, scope, _) in self._entries.items()
+                if any(_in_scope(scope, item) for item in touched)
+            ]
+            for key in stale:
+                del self._entries[key]
+            self.invalidations += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+def get_analytics_cache():
+    global _shared_cache
+
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = AggregateCache()
+        return _shared_cache
+
+
+def _in_scope(scope, item):
+    since, until, status, attack_type_id, ai_only = scope
+    hour, event_status, event_type, is_ai = item
+    if hour < since or (until is not None and hour >= until):
+        return False
+    if status and status != event_status:
+        return False
+    # 0 selects events without an attack type, as in the rollup
+    if attack_type_id is not None and attack_type_id != (event_type or 0):
+        return False
+    return is_ai or not ai_only
+
+
+def invalidate_events(events):
+    touched = {
+        (
+            hour_of(event["timestamp"]),
+            event["status"],
+            event.get("attack_type_id"),
+            classify_reason(event["reason"]) == "ai",
+        )
+        for event in events
+    }
+    if touched:
+        get_analytics_cache().invalidate(touched)
+
+
+def resolve_range(name, start=None, end=None, now=None):
+    now = now or datetime.now()
+    if name == "custom":
+        if start is None:
+            raise ValueError("A custom range needs a start")
+        # The rollup is hourly, so custom ranges are widened to whole hours
+        since = hour_of(start)
+        until = next_hour(end) if end is not None and end > since else None
+        span = (until or now) - since
+        return since, until, "hour" if span <= CUSTOM_HOURLY_LIMIT else "day"
+
+    if name not in RANGES:
+        raise ValueError(f"Unknown range: {name}")
+    span, bucket = RANGES[name]
+    # Open-ended and aligned to the bucket, so the cache key only moves once per bucket
+    since = bucket_start(now - span, bucket)
+    return since, None, bucket
+
+
+def bucket_start(timestamp: datetime, bucket: str) -> datetime:
+    start = hour_of(timestamp)
+    if bucket == "day":
+        start = start.replace(hour=0)
+    return start
+
+
+def bucket_expr(conn, column, bucket):
+    if conn.dialect.name == "postgresql":
+        return func.date_trunc(bucket, column)
+    return func.strftime(SQLITE_BUCKET_FORMATS[bucket], column)
+
+
+def _filter_rollup(stmt, since, until, status, attack_type_id):
+    stmt = stmt.where(AttackLogRollup.hour >= since)
+    if until is not None:
+        stmt = stmt.where(AttackLogRollup.hour < until)
+    if status:
+        stmt = stmt.where(AttackLogRollup.status == status)
+    if attack_type_id is not None:
+        stmt = stmt.where(AttackLogRollup.attack_type_id == attack_type_id)
+    return stmt
+
+
+def activity(conn, since, until=None, bucket="hour", status=None, attack_type_id=None):
+    key = ("activity", since, until, bucket, status, attack_type_id)
+
+    def compute():
+        column = bucket_expr(conn, AttackLogRollup.hour, bucket)
+        stmt = _filter_rollup(
+            select(column, func.sum(AttackLogRollup.count)),
+            since, until, status, attack_type_id,
+        ).group_by(column)
+        counts = {hour_of(start): int(count) for start, count in conn.execute(stmt)}
+
+        # Empty buckets are part of the chart too
+        rows = []
+        current = bucket_start(since, bucket)
+        end = until or next_hour(datetime.now())
+        while current < end:
+            rows.append((current.strftime(TIMESTAMP_FORMAT)[:16], counts.get(current, 0)))
+            current += BUCKETS[bucket]
+        return rows
+
+    scope = (since, until, status, attack_type_id, False)
+    return get_analytics_cache().get_or_compute(key, scope, compute)
+
+
+def totals(conn, since, until=None, status=None, attack_type_id=None):
+    key = ("totals", since, until, status, attack_type_id)
+
+    def compute():
+        stmt = _filter_rollup(
+            select(AttackLogRollup.reason_class, func.sum(AttackLogRollup.count)),
+            since, until, status, attack_type_id,
+        ).group_by(AttackLogRollup.reason_class)
+        return {reason_class: int(count) for reason_class, count in conn.execute(stmt)}
+
+    scope = (since, until, status, attack_type_id, False)
+    return get_analytics_cache().get_or_compute(key, scope, compute)
+
+
+def top_attacks_stmt(since, until, status, attack_type_id, limit):
+    if LOG_COMPACTION:
+        stmt = select(
+            AttackLogWindow.last_seen,
+            AttackLogWindow.reason,
+            QueryFingerprint.sample_query,
+            AttackType.code,
+            AttackLogWindow.max_score,
+        ).join(
+            QueryFingerprint, AttackLogWindow.fingerprint_id == QueryFingerprint.id
+        ).outerjoin(
+            AttackType, AttackLogWindow.attack_type_id == AttackType.id
+        ).where(
+            AttackLogWindow.reason_class == "ai",
+            AttackLogWindow.last_seen >= since,
+            AttackLogWindow.max_score.is_not(None),
+        )
+        if until is not None:
+            stmt = stmt.where(AttackLogWindow.first_seen < until)
+        if status:
+            stmt = stmt.where(AttackLogWindow.status == status)
+        if attack_type_id is not None:
+            stmt = stmt.where(AttackLogWindow.attack_type_id == attack_type_id)
+        return stmt.order_by(
+            AttackLogWindow.max_score.desc(), AttackLogWindow.last_seen.desc()
+        ).limit(limit)
+
+    stmt = select(
+        AttackLog.timestamp,
+        AttackLog.reason,
+        AttackLog.query,
+        AttackType.code,
+        AttackLog.score,
+    ).outerjoin(
+        AttackType, AttackLog.attack_type_id == AttackType.id
+    ).where(
+        AttackLog.timestamp >= since,
+        # Same text as the partial index predicate, so the planner can use it
+        text(AI_REASON_PREDICATE),
+        AttackLog.score.is_not(None),
+    )
+    if until is not None:
+        stmt = stmt.where(AttackLog.timestamp < until)
+    if status:
+        stmt = stmt.where(AttackLog.status == status)
+    if attack_type_id == 0:
+        stmt = stmt.where(AttackLog.attack_type_id.is_(None))
+    elif attack_type_id is not None:
+        stmt = stmt.where(AttackLog.attack_type_id == attack_type_id)
+    return stmt.order_by(AttackLog.score.desc(), AttackLog.timestamp.desc()).limit(limit)
+
+
+def top_attacks(conn, since, until=None, status=None, attack_type_id=None,
+                limit=ANALYTICS_TOP_LIMIT):
+    key = ("top_attacks", since, until, status, attack_type_id, limit)
+
+    def compute():
+        stmt = top_attacks_stmt(since, until, status, attack_type_id, limit)
+        return [
+            {
+                "timestamp": timestamp.strftime(TIMESTAMP_FORMAT),
+                "reason": reason,
+                "query": query,
+                "attack_type": code or "-",
+                "score": f"{score:.2f}",
+            }
+            for timestamp, reason, query, code, score in conn.execute(stmt)
+        ]
+
+    scope = (since, until, status, attack_type_id, True)
+    return get_analytics_cache().get_or_compute(key, scope, compute)
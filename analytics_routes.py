@@ -1,65 +1,101 @@
-from flask import Blueprint, render_template
-from sqlalchemy.orm import joinedload
-from analytics_module import AnalyticsSession, AttackLog, AttackType
-from collections import Counter
-from datetime import datetime
+from flask import Blueprint, jsonify, render_template, request
+
+from analytics_module import AnalyticsEngine, AnalyticsSession, AttackType
+from analytics_queries import (
+    RANGES,
+    activity,
+    get_analytics_cache,
+    resolve_range,
+    top_attacks,
+    totals,
+)
 from decorators import login_required
+from log_module import parse_log_time
+from log_rollup import TIMESTAMP_FORMAT
 
 analytics_bp = Blueprint("analytics", __name__)
 
 
+def _analytics_params(args):
+    range_name = args.get("range", "day")
+    start = parse_log_time(args.get("from"))
+    end = parse_log_time(args.get("to"))
+    if start is not None and range_name not in RANGES:
+        range_name = "custom"
+    since, until, bucket = resolve_range(range_name, start, end)
+    return {
+        "range": range_name,
+        "since": since,
+        "until": until,
+        "bucket": bucket,
+        "status": args.get("status") or None,
+        "attack_type_id": args.get("attack_type", type=int),
+    }
+
+
+def _collect(params):
+    filters = {
+        "status": params["status"],
+        "attack_type_id": params["attack_type_id"],
+    }
+    with AnalyticsEngine.connect() as conn:
+        counts = totals(conn, params["since"], params["until"], **filters)
+        return {
+            "ai_count": counts.get("ai", 0),
+            "total_count": sum(counts.values()),
+            "counts": counts,
+            "activity": activity(
+                conn, params["since"], params["until"], params["bucket"], **filters
+            ),
+            "top_queries": top_attacks(conn, params["since"], params["until"], **filters),
+        }
+
+
 @analytics_bp.route("/analytics")
 @login_required
 def analytics():
-    with AnalyticsSession() as db:
-        logs = (
-            db.query(AttackLog)
-            .options(joinedload(AttackLog.attack_type))
-            .order_by(AttackLog.timestamp.desc())
-            .all()
-        )
+    try:
+        params = _analytics_params(request.args)
+    except ValueError:
+        return "Некоректний діапазон дат, очікується YYYY-MM-DD[ HH:MM:SS]", 400
 
-        ai_count_today = 0
-        hourly_counter = Counter()
-        dangerous_queries = []
+    data = _collect(params)
+    with AnalyticsSession() as db:
+        attack_types = db.query(AttackType).order_by(AttackType.code).all()
 
-        for log in logs:
-            try:
-                ts = datetime.strptime(log.timestamp, "%Y-%m-%d %H:%M:%S")
+    return render_template(
+        "analytics.html",
+        ai_today=data["ai_count"],
+        total_count=data["total_count"],
+        hourly_data=data["activity"],
+        top_queries=data["top_queries"],
+        attack_types=attack_types,
+        params=params,
+        ranges=RANGES,
+    )
 
-                hour = ts.strftime("%H:00")
-                hourly_counter[hour] += 1
 
-                if (
-                        log.reason.upper().startswith("AI")
-                        and ts.date() == datetime.today().date()
-                ):
-                    ai_count_today += 1
-                    dangerous_queries.append(
-                        {
-                            "timestamp": ts,
-                            "reason": log.reason,
-                            "query": log.query,
-                            "attack_type": getattr(log.attack_type, "code", "-"),
-                            "score": log.score,
-                        }
-                    )
-            except Exception:
-                continue
+@analytics_bp.route("/analytics/data")
+@login_required
+def analytics_data():
+    try:
+        params = _analytics_params(request.args)
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "Некоректний діапазон дат, очікується YYYY-MM-DD[ HH:MM:SS]",
+        }), 400
 
-        top_queries = sorted(
-            dangerous_queries,
-            key=lambda x: x["timestamp"],
-            reverse=True,
-        )[:5]
+    return jsonify({
+        **_collect(params),
+        "range": params["range"],
+        "since": params["since"].strftime(TIMESTAMP_FORMAT),
+        "until": params["until"].strftime(TIMESTAMP_FORMAT) if params["until"] else None,
+        "bucket": params["bucket"],
+    })
 
-        for q in top_queries:
-            q["timestamp"] = q["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
-            q["score"] = f"{q['score']:.2f}" if q["score"] is not None else "-"
 
-    return render_template(
-        "analytics.html",
-        ai_today=ai_count_today,
-        hourly_data=sorted(hourly_counter.items()),
-        top_queries=top_queries,
-    )
+@analytics_bp.route("/analytics/cache_stats")
+@login_required
+def analytics_cache_stats():
+    return jsonify(get_analytics_cache().stats())
@@ -0,0 +1,172 @@
+import argparse
+import re
+import time
+
+from sqlalchemy import text
+
+from analytics_module import AnalyticsEngine, AttackLog
+
+BENCH_SCHEMA = "bench_attack_logs"
+LEGACY_TABLE = f"{BENCH_SCHEMA}.legacy"
+NATIVE_TABLE = f"{BENCH_SCHEMA}.native"
+
+COLUMNS_DDL = """
+    id SERIAL PRIMARY KEY,
+    timestamp {timestamp_type} NOT NULL,
+    reason TEXT NOT NULL,
+    query TEXT NOT NULL,
+    score DOUBLE PRECISION,
+    source_ip VARCHAR,
+    status VARCHAR,
+    attack_type_id INTEGER
+"""
+
+
+def create_tables(conn, rows):
+    conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+    conn.execute(text(f"CREATE SCHEMA {BENCH_SCHEMA}"))
+    conn.execute(text(
+        f"CREATE TABLE {LEGACY_TABLE} ({COLUMNS_DDL.format(timestamp_type='VARCHAR')})"
+    ))
+    conn.execute(text(
+        f"CREATE TABLE {NATIVE_TABLE} ({COLUMNS_DDL.format(timestamp_type='TIMESTAMP')})"
+    ))
+
+    # 30 days of traffic, roughly one blocked query in three
+    conn.execute(text(f"""
+        INSERT INTO {NATIVE_TABLE} (timestamp, reason, query, score, source_ip, status)
+        SELECT
+            date_trunc('second', localtimestamp) - (g * (2592000.0 / :rows)) * interval '1 second',
+            CASE g % 3
+                WHEN 0 THEN 'AI score 0.97'
+                WHEN 1 THEN 'safe'
+                ELSE 'Blocked command: DROP'
+            END,
+            'SELECT * FROM film WHERE film_id = ' || g,
+            CASE WHEN g % 3 = 0 THEN 0.97 END,
+            '10.0.' || (g % 256) || '.' || (g % 7),
+            CASE WHEN g % 3 = 1 THEN 'allowed' ELSE 'blocked' END
+        FROM generate_series(1, :rows) AS g
+    """), {"rows": rows})
+    conn.execute(text(f"""
+        INSERT INTO {LEGACY_TABLE} (timestamp, reason, query, score, source_ip, status)
+        SELECT to_char(timestamp, 'YYYY-MM-DD HH24:MI:SS'), reason, query, score, source_ip, status
+        FROM {NATIVE_TABLE} ORDER BY id
+    """))
+
+    for index in AttackLog.__table__.indexes:
+        columns = ", ".join(column.name for column in index.columns)
+        # Partial indexes keep their predicate, or the planner sees a different index
+        where = index.dialect_options["postgresql"]["where"]
+        predicate = f" WHERE {where}" if where is not None else ""
+        conn.execute(text(f"CREATE INDEX {index.name} ON {NATIVE_TABLE} ({columns}){predicate}"))
+
+    conn.execute(text(f"ANALYZE {LEGACY_TABLE}"))
+    conn.execute(text(f"ANALYZE {NATIVE_TABLE}"))
+
+
+def build_cases(conn, deep_offset):
+    day = conn.execute(text(
+        f"SELECT date_trunc('day', max(timestamp)) - interval '7 days' FROM {NATIVE_TABLE}"
+    )).scalar()
+    today = conn.execute(text(
+        f"SELECT date_trunc('day', max(timestamp)) FROM {NATIVE_TABLE}"
+    )).scalar()
+    cursor_ts, cursor_id = conn.execute(text(
+        f"SELECT timestamp, id FROM {NATIVE_TABLE} "
+        f"ORDER BY timestamp DESC, id DESC OFFSET :offset LIMIT 1"
+    ), {"offset": deep_offset - 1}).one()
+
+    day_from = day.strftime("%Y-%m-%d %H:%M:%S")
+    day_to = (day.replace(hour=23, minute=59, second=59)).strftime("%Y-%m-%d %H:%M:%S")
+    today_str = today.strftime("%Y-%m-%d %H:%M:%S")
+
+    return [
+        (
+            "/logs first page",
+            f"SELECT * FROM {LEGACY_TABLE} ORDER BY timestamp DESC LIMIT 100",
+            f"SELECT * FROM {NATIVE_TABLE} ORDER BY timestamp DESC, id DESC LIMIT 101",
+            {},
+        ),
+        (
+            f"/logs page at row {deep_offset}",
+            f"SELECT * FROM {LEGACY_TABLE} ORDER BY timestamp DESC "
+            f"OFFSET {deep_offset} LIMIT 100",
+            f"SELECT * FROM {NATIVE_TABLE} WHERE (timestamp, id) < (:cursor_ts, :cursor_id) "
+            "ORDER BY timestamp DESC, id DESC LIMIT 101",
+            {"cursor_ts": cursor_ts, "cursor_id": cursor_id},
+        ),
+        (
+            "/logs/download one day, status=blocked",
+            f"SELECT * FROM {LEGACY_TABLE} WHERE status = 'blocked' "
+            f"AND timestamp >= '{day_from}' AND timestamp <= '{day_to}' "
+            "ORDER BY timestamp DESC",
+            f"SELECT * FROM {NATIVE_TABLE} WHERE status = 'blocked' "
+            "AND timestamp >= :day_from AND timestamp <= :day_to "
+            "ORDER BY timestamp DESC, id DESC",
+            {"day_from": day, "day_to": day.replace(hour=23, minute=59, second=59)},
+        ),
+        (
+            "/analytics top-5 AI attacks today",
+            f"SELECT * FROM {LEGACY_TABLE} WHERE timestamp >= '{today_str}' "
+            "AND upper(reason) LIKE 'AI%' ORDER BY timestamp DESC LIMIT 5",
+            f"SELECT * FROM {NATIVE_TABLE} WHERE timestamp >= :today "
+            "AND upper(reason) LIKE 'AI%' ORDER BY timestamp DESC, id DESC LIMIT 5",
+            {"today": today},
+        ),
+    ]
+
+
+def explain(conn, sql, params):
+    plan = conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params).scalars().all()
+    match = re.search(r"Execution Time: ([\d.]+) ms", plan[-1])
+    return "\n".join(plan), float(match.group(1)) if match else None
+
+
+def run(rows=3_000_000, deep_offset=100_000, keep=False):
+    if AnalyticsEngine.dialect.name != "postgresql":
+        raise RuntimeError("The benchmark needs the PostgreSQL analytics database")
+
+    started = time.perf_counter()
+    with AnalyticsEngine.begin() as conn:
+        create_tables(conn, rows)
+    print(f"Generated {rows} rows in {time.perf_counter() - started:.1f} s")
+
+    results = []
+    try:
+        with AnalyticsEngine.connect() as conn:
+            for name, legacy_sql, native_sql, params in build_cases(conn, deep_offset):
+                legacy_plan, legacy_ms = explain(conn, legacy_sql, {})
+                native_plan, native_ms = explain(conn, native_sql, params)
+                results.append((name, legacy_ms, native_ms))
+
+                print(f"\n=== {name} ===")
+                print("--- before: text timestamp, no indexes ---")
+                print(legacy_plan)
+                print("--- after: TIMESTAMP column, composite indexes ---")
+                print(native_plan)
+    finally:
+        if not keep:
+            with AnalyticsEngine.begin() as conn:
+                conn.execute(text(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE"))
+
+    print("\n=== Summary (execution time) ===")
+    for name, legacy_ms, native_ms in results:
+        print(
+            f"{name:>40}: {legacy_ms:9.2f} ms -> {native_ms:8.2f} ms "
+            f"({legacy_ms / native_ms:.0f}x)"
+        )
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=3_000_000)
+    parser.add_argument("--deep-offset", type=int, default=100_000)
+    parser.add_argument(
+        "--keep",
+        action="store_true",
+        help=f"Keep the {BENCH_SCHEMA} schema after the run",
+    )
+    args = parser.parse_args()
+    run(args.rows, deep_offset=args.deep_offset, keep=args.keep)
@@ -0,0 +1,60 @@
+import argparse
+import random
+import time
+
+from queries_generator import generate_safe_queries, generate_malicious_queries
+from sql_parser import SQLRuleParser
+
+
+def build_corpus(n_safe=1000, n_malicious=1000, seed=42):
+    random.seed(seed)
+    return generate_safe_queries(n_safe) + generate_malicious_queries(n_malicious)
+
+
+def time_engine(check, corpus, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for sql in corpus:
+            check(sql)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def run(n_safe=1000, n_malicious=1000, repeat=5):
+    corpus = build_corpus(n_safe, n_malicious)
+    parser = SQLRuleParser()
+
+    mismatches = [
+        sql for sql in corpus
+        if parser.compiled.check_query(sql) != parser.check_query_sqlparse(sql)
+    ]
+
+    results = {}
+    for name, check in (
+            ("sqlparse", parser.check_query_sqlparse),
+            ("compiled", parser.compiled.check_query),
+    ):
+        elapsed = time_engine(check, corpus, repeat=repeat)
+        results[name] = elapsed
+        print(
+            f"{name:>9}: {elapsed * 1000:8.1f} ms total, "
+            f"{elapsed / len(corpus) * 1e6:7.1f} us/query"
+        )
+
+    print(f"Speedup: {results['sqlparse'] / results['compiled']:.1f}x")
+    print(f"Verdict mismatches: {len(mismatches)} of {len(corpus)}")
+    for sql in mismatches[:10]:
+        print("  ", sql)
+
+    return results, mismatches
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--safe", type=int, default=1000)
+    parser.add_argument("--malicious", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.safe, args.malicious, repeat=args.repeat)
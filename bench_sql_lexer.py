@@ -0,0 +1,131 @@
+import argparse
+import random
+import re
+import time
+
+from sqlparse import keywords, tokens as T
+
+import sql_lexer
+from queries_generator import generate_malicious_queries, generate_safe_queries
+from sql_parser import SQLRuleParser
+
+
+def build_corpus(n_safe=1000, n_malicious=1000, seed=42):
+    random.seed(seed)
+    return generate_safe_queries(n_safe) + generate_malicious_queries(n_malicious)
+
+
+def legacy_normalize_sql(sql: str) -> str:
+    # The regex normalizer train_ml.py and train_from_db.py used to carry
+    s = sql.strip()
+    s = re.sub(r"'.*?'", " VAL_STR ", s)
+    s = re.sub(r'".*?"', " VAL_STR ", s)
+    s = re.sub(r"\b\d+\b", " VAL_NUM ", s)
+    s = re.sub(r"\b0x[0-9A-Fa-f]+\b", " VAL_NUM ", s)
+    s = re.sub(r"\s+", " ", s)
+    s = s.lower()
+    return s
+
+
+def legacy_tokenize(sql: str):
+    # The rule engine's own lexer pass, as it ran before the shared stream
+    match = sql_lexer._PATTERN.match
+    actions = sql_lexer._ACTIONS
+    kwlookup = sql_lexer._KEYWORDS.get
+    pos = 0
+    end = len(sql)
+    while pos < end:
+        m = match(sql, pos)
+        if m is None:
+            yield T.Error, sql[pos]
+            pos += 1
+            continue
+        value = m.group()
+        action = actions[m.lastgroup]
+        if action is keywords.PROCESS_AS_KEYWORD:
+            yield kwlookup(value.upper(), T.Name), value
+        else:
+            yield action, value
+        pos = m.end()
+
+
+def time_per_query(work, corpus, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for sql in corpus:
+            work(sql)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(corpus)
+
+
+def run(n_safe=1000, n_malicious=1000, repeat=5):
+    corpus = build_corpus(n_safe, n_malicious)
+    rules = SQLRuleParser().compiled
+
+    def lexing_before(sql):
+        # Rules, fingerprint and ML featurizer each lexed the query on their own
+        for _ in legacy_tokenize(sql):
+            pass
+        legacy_normalize_sql(sql)
+        legacy_normalize_sql(sql)
+
+    def lexing_after(sql):
+        sql_lexer._lex(sql).normalized
+
+    def request_before(sql):
+        rules.check_query(sql, legacy_tokenize(sql))
+        legacy_normalize_sql(sql)
+        legacy_normalize_sql(sql)
+
+    def request_after(sql):
+        stream = sql_lexer._lex(sql)
+        rules.check_query(sql, stream)
+        stream.normalized
+        stream.normalized
+
+    def request_cached(sql):
+        stream = sql_lexer.lex(sql)
+        rules.check_query(sql, stream)
+        stream.normalized
+
+    results = {}
+    for name, work in (
+            ("lexing, before", lexing_before),
+            ("lexing, after", lexing_after),
+            ("request, before", request_before),
+            ("request, after", request_after),
+            ("request, repeated query", request_cached),
+    ):
+        results[name] = time_per_query(work, corpus, repeat=repeat)
+        print(f"{name:>24}: {results[name] * 1e6:7.1f} us/query")
+
+    mismatches = [
+        sql for sql in corpus
+        if rules.check_query(sql, sql_lexer._lex(sql)) != rules.check_query(sql, legacy_tokenize(sql))
+    ]
+    changed = [sql for sql in corpus if sql_lexer.normalize_sql(sql) != legacy_normalize_sql(sql)]
+    term = re.compile(r"(?u)\b\w\w+\b")
+    terms_changed = [
+        sql for sql in changed
+        if sql_lexer.lex(sql).terms != tuple(term.findall(legacy_normalize_sql(sql)))
+    ]
+    print(f"Rule verdict mismatches: {len(mismatches)} of {len(corpus)}")
+    print(f"Normalization changed: {len(changed)} of {len(corpus)}, "
+          f"TF-IDF terms changed: {len(terms_changed)}")
+    for sql in terms_changed[:10]:
+        print("  ", sql)
+        print("     before:", legacy_normalize_sql(sql))
+        print("     after: ", sql_lexer.normalize_sql(sql))
+
+    return results, mismatches, changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--safe", type=int, default=1000)
+    parser.add_argument("--malicious", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.safe, args.malicious, repeat=args.repeat)
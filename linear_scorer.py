@@ -0,0 +1,295 @@
+import argparse
+import math
+import pickle
+import time
+from functools import lru_cache
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.utils import murmurhash3_32
+
+from model_artifact import MappedLinearModel, MappedVectorizer, is_artifact, load_artifact
+from sql_lexer import lex
+
+# sklearn's default: the only pattern TokenStream.terms reproduces
+DEFAULT_TOKEN_PATTERN = r"(?u)\b\w\w+\b"
+PARITY_TOLERANCE = 1e-9
+# Memoized artifact lookups: each probe otherwise walks the mmapped hash table
+SCORER_TERM_CACHE = 65536
+
+_INT32_MIN = -2 ** 31
+
+
+def _expit(z):
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
+
+
+def _word_ngrams(tokens, ngram_range):
+    # Same order as sklearn's _VectorizerMixin._word_ngrams
+    min_n, max_n = ngram_range
+    if max_n == 1:
+        return tokens
+    original = tokens
+    if min_n == 1:
+        tokens = list(original)
+        min_n += 1
+    else:
+        tokens = []
+    for n in range(min_n, min(max_n + 1, len(original) + 1)):
+        for i in range(len(original) - n + 1):
+            tokens.append(" ".join(original[i:i + n]))
+    return tokens
+
+
+def _uses_stream_terms(params):
+    return (
+        params["analyzer"] == "word"
+        and params["token_pattern"] == DEFAULT_TOKEN_PATTERN
+        and params["strip_accents"] is None
+        and params["stop_words"] is None
+        and params.get("preprocessor") is None
+        and params.get("tokenizer") is None
+    )
+
+
+class LinearScorer:
+    def __init__(self, weights, idf, intercept, lookup, ngram_range, norm, binary, sublinear_tf,
+                 alternate_sign=False, analyzer=None, scale=None):
+        # idf * coef, so a query costs one gather and one dot product
+        self.weights = weights
+        # Quantized artifact weights stay mapped as stored: raw coef, times scale per query
+        self.scale = scale
+        self.idf = idf
+        self.intercept = intercept
+        self.lookup = lookup
+        self.ngram_range = ngram_range
+        self.norm = norm
+        self.binary = binary
+        self.sublinear_tf = sublinear_tf
+        self.alternate_sign = alternate_sign
+        # Vectorizers the token stream cannot reproduce keep their own analyzer
+        self.analyzer = analyzer
+
+    def features(self, sql, tokens=None):
+        # Screening passes the stream it already lexed; other callers only have the text
+        stream = tokens if tokens is not None else lex(sql)
+        if self.analyzer is not None:
+            terms = self.analyzer(stream.normalized)
+        else:
+            terms = _word_ngrams(stream.terms, self.ngram_range)
+
+        counts = {}
+        lookup = self.lookup
+        for term in terms:
+            col, sign = lookup(term)
+            if col >= 0:
+                counts[col] = counts.get(col, 0) + sign
+        return counts
+
+    def decision(self, sql, tokens=None) -> float:
+        counts = self.features(sql, tokens)
+        if not counts:
+            return self.intercept
+
+        cols = np.fromiter(counts, dtype=np.intp, count=len(counts))
+        tf = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        if self.binary:
+            # Hashed columns whose signs cancel still count as present, as in sklearn
+            tf = np.ones_like(tf)
+        if self.sublinear_tf:
+            tf = np.log(tf) + 1.0
+
+        x = tf * self.idf[cols] if self.idf is not None else tf
+        if self.norm == "l2":
+            scale = math.sqrt(float(x @ x))
+        elif self.norm == "l1":
+            scale = float(np.abs(x).sum())
+        else:
+            scale = 1.0
+        if self.scale is not None:
+            dot = float(x @ self.weights[cols]) * self.scale
+        else:
+            dot = float(tf @ self.weights[cols])
+        return dot / (scale or 1.0) + self.intercept
+
+    def predict_proba(self, sql, tokens=None) -> float:
+        return _expit(self.decision(sql, tokens))
+
+
+def _vocabulary_lookup(vocabulary):
+    get = vocabulary.get
+
+    def lookup(term):
+        col = get(term)
+        return (-1, 0) if col is None else (col, 1)
+
+    return lookup
+
+
+def _mapped_lookup(vocabulary):
+    find = vocabulary.lookup
+
+    @lru_cache(maxsize=SCORER_TERM_CACHE)
+    def lookup(term):
+        return find(term), 1
+
+    return lookup
+
+
+def _hashing_lookup(n_features, alternate_sign):
+    def lookup(term):
+        h = murmurhash3_32(term, seed=0, positive=False)
+        if h == _INT32_MIN:
+            col = (2 ** 31 - 1 - (n_features - 1)) % n_features
+        else:
+            col = abs(h) % n_features
+        if alternate_sign and h < 0:
+            return col, -1
+        return col, 1
+
+    return lookup
+
+
+def compile_scorer(vectorizer, model):
+    scale = None
+    if isinstance(model, MappedLinearModel):
+        coef = model.coef
+        intercept = float(model.intercept)
+        if coef.dtype != np.float64:
+            scale = model.coef_scale
+    else:
+        if not hasattr(model, "coef_") or getattr(model, "loss", "log_loss") != "log_loss":
+            return None
+        coef = np.asarray(model.coef_, dtype=np.float64)
+        if coef.shape[0] != 1:
+            return None
+        coef = coef[0]
+        intercept = float(np.ravel(model.intercept_)[0])
+    if list(getattr(model, "classes_", [0, 1])) != [0, 1]:
+        return None
+
+    if isinstance(vectorizer, MappedVectorizer):
+        idf = np.asarray(vectorizer.idf) if vectorizer.use_idf else None
+        if scale is None and idf is not None:
+            coef = coef * idf
+        return LinearScorer(
+            coef,
+            idf,
+            intercept,
+            _mapped_lookup(vectorizer.vocabulary),
+            ngram_range=None,
+            norm=vectorizer.norm,
+            binary=vectorizer.binary,
+            sublinear_tf=vectorizer.sublinear_tf,
+            analyzer=vectorizer.analyzer,
+            scale=scale,
+        )
+    if scale is not None:
+        coef = np.asarray(coef, dtype=np.float64) * scale
+
+    if not isinstance(vectorizer, (TfidfVectorizer, HashingVectorizer)):
+        return None
+    if isinstance(vectorizer, TfidfVectorizer) and not hasattr(vectorizer, "vocabulary_"):
+        return None
+    params = vectorizer.get_params()
+    if not isinstance(params["analyzer"], str):
+        return None
+    analyzer = None if _uses_stream_terms(params) else vectorizer.build_analyzer()
+
+    if isinstance(vectorizer, HashingVectorizer):
+        if coef.shape[0] != vectorizer.n_features:
+            return None
+        return LinearScorer(
+            coef,
+            None,
+            intercept,
+            _hashing_lookup(vectorizer.n_features, vectorizer.alternate_sign),
+            ngram_range=vectorizer.ngram_range,
+            norm=vectorizer.norm,
+            binary=vectorizer.binary,
+            sublinear_tf=False,
+            alternate_sign=vectorizer.alternate_sign,
+            analyzer=analyzer,
+        )
+
+    idf = np.asarray(vectorizer.idf_, dtype=np.float64) if vectorizer.use_idf else None
+    return LinearScorer(
+        coef * idf if idf is not None else coef,
+        idf,
+        intercept,
+        _vocabulary_lookup(vectorizer.vocabulary_),
+        ngram_range=vectorizer.ngram_range,
+        norm=vectorizer.norm,
+        binary=vectorizer.binary,
+        sublinear_tf=vectorizer.sublinear_tf,
+        analyzer=analyzer,
+    )
+
+
+def verify_parity(scorer, vectorizer, model, queries):
+    from sql_lexer import normalize_sql
+
+    expected = model.predict_proba(vectorizer.transform([normalize_sql(q) for q in queries]))[:, 1]
+    actual = np.array([scorer.predict_proba(q) for q in queries])
+    diff = np.abs(actual - expected)
+    worst = int(np.argmax(diff)) if len(diff) else 0
+    return {
+        "queries": len(queries),
+        "max_abs_diff": float(diff.max()) if len(diff) else 0.0,
+        "worst_query": queries[worst] if len(diff) else None,
+        "verdict_mismatches": int(((actual >= 0.5) != (expected >= 0.5)).sum()),
+    }
+
+
+def load_model(path):
+    if is_artifact(path):
+        return load_artifact(path)
+    with open(path, "rb") as f:
+        loaded = pickle.load(f)
+    if isinstance(loaded, dict):
+        # train_from_db.py checkpoint
+        return loaded["vectorizer"], loaded["model"]
+    return loaded
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="ml_model.pkl", help="Pickled model or artifact directory")
+    parser.add_argument("--csv", default="ml_sql_dataset.csv", help="Corpus with an 'sql' column")
+    parser.add_argument("--tolerance", type=float, default=PARITY_TOLERANCE)
+    args = parser.parse_args()
+
+    vectorizer, model = load_model(args.model)
+    scorer = compile_scorer(vectorizer, model)
+    if scorer is None:
+        raise SystemExit(f"No fast scorer for {type(vectorizer).__name__} + {type(model).__name__}")
+
+    queries = pd.read_csv(args.csv)["sql"].dropna().astype(str).tolist()
+    result = verify_parity(scorer, vectorizer, model, queries)
+    print(f"Parity over {result['queries']} queries: max |diff| = {result['max_abs_diff']:.3e}, "
+          f"verdict mismatches = {result['verdict_mismatches']}")
+
+    from sql_lexer import normalize_sql
+
+    sample = queries[:1000]
+    for sql in sample:
+        lex(sql)
+    started = time.perf_counter()
+    for sql in sample:
+        model.predict_proba(vectorizer.transform([normalize_sql(sql)]))
+    sklearn_us = (time.perf_counter() - started) / len(sample) * 1e6
+    started = time.perf_counter()
+    for sql in sample:
+        scorer.predict_proba(sql)
+    fast_us = (time.perf_counter() - started) / len(sample) * 1e6
+    print(f"Single-query latency: sklearn {sklearn_us:.1f} us, fast scorer {fast_us:.1f} us "
+          f"({sklearn_us / fast_us:.0f}x)")
+
+    if result["max_abs_diff"] > args.tolerance:
+        print(f"Worst query: {result['worst_query']}")
+        raise SystemExit(1)
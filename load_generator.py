@@ -0,0 +1,217 @@
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from metrics import exponential_buckets
+from queries_generator import generate_malicious_queries, generate_safe_queries
+from shared_counters import SHARED_STATE_DIR, SharedCounters, SharedHistogram
+
+LOADGEN_TARGET = "http://127.0.0.1:5000"
+LOADGEN_RATE = 50.0
+LOADGEN_CONCURRENCY = 8
+LOADGEN_MAX_CONCURRENCY = 256
+LOADGEN_MIX = 0.5
+LOADGEN_TIMEOUT = 5.0
+# Requests waiting for a free connection before new ones are dropped
+LOADGEN_MAX_BACKLOG = 1000
+LOADGEN_PROFILES = ("constant", "linear", "step")
+LOADGEN_RAMP_STEPS = 4
+LOADGEN_POLL_INTERVAL = 0.2
+LOADGEN_QUERY_POOL = 500
+# 0.1 ms .. ~100 s, ~9% wide buckets
+LOADGEN_LATENCY_BUCKETS_MS = exponential_buckets(0.1, 2 ** 0.125, 160)
+LOADGEN_COUNTERS = ("sent", "completed", "errors", "dropped", "allowed", "blocked")
+LOADGEN_CONTROL = ("runs", "finished", "stops")
+LOADGEN_STATS_PATH = os.path.join(SHARED_STATE_DIR, "loadgen_latency.bin")
+LOADGEN_CONTROL_PATH = os.path.join(SHARED_STATE_DIR, "loadgen_control.bin")
+
+SAFE_QUERIES = generate_safe_queries(LOADGEN_QUERY_POOL)
+MALICIOUS_QUERIES = generate_malicious_queries(LOADGEN_QUERY_POOL)
+
+logger = logging.getLogger(__name__)
+
+_shared_stats = None
+_shared_lock = threading.Lock()
+
+
+def request_offset(n, rate, profile="constant", ramp=0.0, steps=LOADGEN_RAMP_STEPS):
+    # Intended send time of the n-th request, in seconds from the start
+    if profile == "constant" or ramp <= 0:
+        return n / rate
+    if profile == "linear":
+        # Rate grows from 0 to `rate` over `ramp`: n(t) = rate * t^2 / (2 * ramp)
+        ramped = rate * ramp / 2
+        if n < ramped:
+            return math.sqrt(2 * ramp * n / rate)
+        return ramp + (n - ramped) / rate
+    if profile == "step":
+        step_time = ramp / steps
+        elapsed = 0.0
+        for step in range(1, steps + 1):
+            step_rate = rate * step / steps
+            in_step = step_rate * step_time
+            if n < in_step or step == steps:
+                return elapsed + n / step_rate
+            n -= in_step
+            elapsed += step_time
+    raise ValueError(f"Unknown load profile: {profile}")
+
+
+class LoadStats:
+    def __init__(self, stats_path=LOADGEN_STATS_PATH, control_path=LOADGEN_CONTROL_PATH):
+        self.latency = SharedHistogram(LOADGEN_LATENCY_BUCKETS_MS, stats_path, extra=LOADGEN_COUNTERS)
+        # Never reset: a stop must stay visible to a run started before it
+        self.control = SharedCounters(LOADGEN_CONTROL, path=control_path)
+        self._last = None
+
+    def running(self) -> bool:
+        return self.control.value("runs") > self.control.value("finished")
+
+    def request_stop(self):
+        self.control.incr("stops")
+
+    def snapshot(self):
+        latency = self.latency.snapshot()
+        counters = latency.pop("counters")
+        now = time.monotonic()
+        # Achieved rate since the previous snapshot (one caller per process: the broker)
+        last, self._last = self._last, (now, counters["completed"])
+        rps = 0.0
+        if last is not None and now > last[0]:
+            rps = max(counters["completed"] - last[1], 0) / (now - last[0])
+        return {**counters, "latency_ms": latency, "rps": round(rps, 1), "running": self.running()}
+
+
+def get_load_stats():
+    global _shared_stats
+
+    with _shared_lock:
+        if _shared_stats is None:
+            _shared_stats = LoadStats()
+        return _shared_stats
+
+
+class LoadGenerator:
+    def __init__(
+            self,
+            target=LOADGEN_TARGET,
+            rate=LOADGEN_RATE,
+            count=None,
+            duration=None,
+            concurrency=LOADGEN_CONCURRENCY,
+            mix=LOADGEN_MIX,
+            profile="constant",
+            ramp=0.0,
+            timeout=LOADGEN_TIMEOUT,
+            stats=None,
+    ):
+        if profile not in LOADGEN_PROFILES:
+            raise ValueError(f"Unknown load profile: {profile}")
+        self.url = f"{target.rstrip('/')}/check_query"
+        self.rate = rate
+        self.count = count
+        self.duration = duration
+        self.concurrency = concurrency
+        self.mix = mix
+        self.profile = profile
+        self.ramp = ramp
+        self.timeout = timeout
+        self.stats = stats or get_load_stats()
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._sessions = threading.local()
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._stops_seen = 0
+
+    def start(self):
+        self.stats.latency.reset()
+        self._stops_seen = self.stats.control.value("stops")
+        self.stats.control.incr("runs")
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def is_alive(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _stopped(self) -> bool:
+        # Polled: /simulate/stop may have landed on another worker
+        return self._stop.is_set() or self.stats.control.value("stops") > self._stops_seen
+
+    def _sleep_until(self, deadline) -> bool:
+        while True:
+            delay = deadline - time.perf_counter()
+            if delay <= 0:
+                return not self._stopped()
+            if self._stop.wait(min(delay, LOADGEN_POLL_INTERVAL)) or self._stopped():
+                return False
+
+    def _run(self):
+        executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="loadgen")
+        started = time.perf_counter()
+        n = 0
+        try:
+            while self.count is None or n < self.count:
+                offset = request_offset(n, self.rate, self.profile, self.ramp)
+                if self.duration is not None and offset >= self.duration:
+                    break
+                intended = started + offset
+                if not self._sleep_until(intended):
+                    break
+                n += 1
+                with self._pending_lock:
+                    if self._pending >= LOADGEN_MAX_BACKLOG:
+                        self.stats.latency.incr("dropped")
+                        continue
+                    self._pending += 1
+                # Open loop: the schedule never waits for responses
+                executor.submit(self._send, self._pick_query(), intended)
+        except Exception:
+            logger.exception("Генератор навантаження зупинився з помилкою")
+        finally:
+            executor.shutdown(wait=True, cancel_futures=self._stop.is_set())
+            self.stats.control.incr("finished")
+
+    def _pick_query(self):
+        if random.random() < self.mix:
+            return random.choice(MALICIOUS_QUERIES)
+        return random.choice(SAFE_QUERIES)
+
+    def _session(self):
+        session = getattr(self._sessions, "session", None)
+        if session is None:
+            # Keep-alive per pool thread: connection setup stays out of the numbers
+            session = self._sessions.session = requests.Session()
+        return session
+
+    def _send(self, sql, intended):
+        self.stats.latency.incr("sent")
+        try:
+            try:
+                body = self._session().post(self.url, json={"query": sql}, timeout=self.timeout).json()
+                verdict = body.get("verdict")
+                if verdict is not None:
+                    status = verdict["status"]
+                else:
+                    status = "allowed" if body.get("status") == "success" else "blocked"
+            except Exception:
+                status = "blocked"
+                self.stats.latency.incr("errors")
+            # From the intended send time, so queueing behind slow requests is counted
+            self.stats.latency.observe((time.perf_counter() - intended) * 1000)
+            self.stats.latency.counters.incr_many(("completed", status))
+        finally:
+            with self._pending_lock:
+                self._pending -= 1
@@ -0,0 +1,266 @@
+import argparse
+import logging
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import inspect, select
+
+from analytics_module import AnalyticsEngine, AttackLog, AttackLogWindow, AttackType, QueryFingerprint
+
+LOG_ARCHIVE_DIR = "archive"
+ARCHIVE_BATCH_SIZE = 50000
+ARCHIVE_COMPRESSION = "zstd"
+# Low-cardinality text columns stored as dictionary indexes
+ARCHIVE_DICTIONARY_COLUMNS = ("reason", "source_ip", "status", "attack_type")
+ARCHIVE_COLUMNS = ("id", "timestamp", "reason", "query", "score", "source_ip", "status",
+                   "attack_type", "count")
+
+logger = logging.getLogger(__name__)
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Parquet archives require pyarrow (pip install pyarrow)")
+    return pa, pc, pq
+
+
+def archive_schema():
+    pa, _, _ = _pyarrow()
+    text_dict = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("id", pa.int64()),
+        ("timestamp", pa.timestamp("us")),
+        ("reason", text_dict),
+        ("query", pa.string()),
+        ("score", pa.float64()),
+        ("source_ip", text_dict),
+        ("status", text_dict),
+        ("attack_type", text_dict),
+        ("count", pa.int32()),
+    ])
+
+
+def raw_stmt(start=None, end=None):
+    stmt = select(
+        AttackLog.id,
+        AttackLog.timestamp,
+        AttackLog.reason,
+        AttackLog.query,
+        AttackLog.score,
+        AttackLog.source_ip,
+        AttackLog.status,
+        AttackType.code,
+    ).outerjoin(AttackType, AttackLog.attack_type_id == AttackType.id)
+    if start:
+        stmt = stmt.where(AttackLog.timestamp >= start)
+    if end:
+        stmt = stmt.where(AttackLog.timestamp < end)
+    return stmt.order_by(AttackLog.timestamp, AttackLog.id)
+
+
+def compacted_stmt(start=None, end=None):
+    stmt = select(
+        AttackLogWindow.id,
+        AttackLogWindow.last_seen,
+        AttackLogWindow.reason,
+        QueryFingerprint.sample_query,
+        AttackLogWindow.max_score,
+        AttackLogWindow.source_ip,
+        AttackLogWindow.status,
+        AttackType.code,
+        AttackLogWindow.count,
+    ).join(
+        QueryFingerprint, AttackLogWindow.fingerprint_id == QueryFingerprint.id
+    ).outerjoin(
+        AttackType, AttackLogWindow.attack_type_id == AttackType.id
+    )
+    if start:
+        stmt = stmt.where(AttackLogWindow.last_seen >= start)
+    if end:
+        stmt = stmt.where(AttackLogWindow.last_seen < end)
+    return stmt.order_by(AttackLogWindow.last_seen, AttackLogWindow.id)
+
+
+def _to_table(rows, schema):
+    pa, _, _ = _pyarrow()
+    columns = list(zip(*rows))
+    if len(columns) == len(ARCHIVE_COLUMNS) - 1:
+        # Raw rows are single events
+        columns.append([1] * len(rows))
+    return pa.Table.from_arrays(
+        [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+        schema=schema,
+    )
+
+
+class _DayPartition:
+    # One file per source and day; a run writes a hidden temp file and swaps it in on close
+    def __init__(self, directory, source, run_id, schema, compression):
+        _, _, pq = _pyarrow()
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.source = source
+        self.schema = schema
+        self.path = os.path.join(directory, f"{source}.parquet")
+        # Leading dot: dataset readers skip it until it is renamed
+        self.tmp_path = os.path.join(directory, f".{source}-{run_id}.parquet.tmp")
+        self.writer = pq.ParquetWriter(
+            self.tmp_path,
+            schema,
+            compression=compression,
+            use_dictionary=list(ARCHIVE_DICTIONARY_COLUMNS),
+        )
+        self.ids = []
+        self.first = None
+        self.last = None
+
+    def write(self, table):
+        pa, pc, _ = _pyarrow()
+        self.writer.write_table(table)
+        self.ids.append(table["id"].combine_chunks())
+        low, high = pc.min(table["timestamp"]), pc.max(table["timestamp"])
+        self.first = low if self.first is None else pc.min_element_wise(self.first, low)
+        self.last = high if self.last is None else pc.max_element_wise(self.last, high)
+
+    def _existing(self):
+        # This run's file name first, then {source}-{first id}.parquet files of older exports
+        names = sorted(
+            name for name in os.listdir(self.directory)
+            if name.startswith(f"{self.source}-") and name.endswith(".parquet")
+        )
+        if os.path.exists(self.path):
+            names.insert(0, os.path.basename(self.path))
+        return [os.path.join(self.directory, name) for name in names]
+
+    def close(self):
+        pa, pc, pq = _pyarrow()
+        try:
+            # Rows this run exported replace their earlier copies: same id, or inside
+            # the time span just exported (rows deleted from the DB since go with them)
+            seen = pa.concat_arrays(self.ids) if self.ids else pa.array([], type=pa.int64())
+            existing = self._existing()
+            for path in existing:
+                table = pq.ParquetFile(path).read().cast(self.schema)
+                stale = pc.or_(
+                    pc.is_in(table["id"], value_set=seen),
+                    pc.and_(
+                        pc.greater_equal(table["timestamp"], self.first),
+                        pc.less_equal(table["timestamp"], self.last),
+                    ),
+                )
+                kept = table.filter(pc.invert(stale))
+                if kept.num_rows:
+                    self.writer.write_table(kept)
+                    seen = pa.concat_arrays([seen, kept["id"].combine_chunks()])
+            self.writer.close()
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self.writer.close()
+            os.remove(self.tmp_path)
+            raise
+        for path in existing:
+            if path != self.path:
+                os.remove(path)
+
+
+def export_archive(out_dir=LOG_ARCHIVE_DIR, start=None, end=None, engine=AnalyticsEngine,
+                   batch_size=ARCHIVE_BATCH_SIZE, compression=ARCHIVE_COMPRESSION):
+    pa, pc, pq = _pyarrow()
+    schema = archive_schema()
+    run_id = f"{time.time_ns()}-{os.getpid()}"
+
+    sources = [("logs", raw_stmt(start, end))]
+    if inspect(engine).has_table(AttackLogWindow.__tablename__):
+        sources.append(("windows", compacted_stmt(start, end)))
+
+    files = []
+    rows_written = 0
+    started = time.perf_counter()
+    with engine.connect() as conn:
+        for source, stmt in sources:
+            partitions = {}
+            try:
+                result = conn.execution_options(yield_per=batch_size).execute(stmt)
+                for rows in result.partitions():
+                    table = _to_table(rows, schema)
+                    days = pc.strftime(table["timestamp"], format="%Y-%m-%d")
+                    for day in pc.unique(days).to_pylist():
+                        partition = partitions.get(day)
+                        if partition is None:
+                            # Hive-style layout: readers prune whole days by path
+                            partition = _DayPartition(
+                                os.path.join(out_dir, f"date={day}"), source, run_id, schema, compression
+                            )
+                            partitions[day] = partition
+                        partition.write(table.filter(pc.equal(days, day)))
+                    rows_written += len(rows)
+                    logger.info(
+                        "%d записів, %.0f записів/с",
+                        rows_written, rows_written / (time.perf_counter() - started),
+                    )
+            except BaseException:
+                for partition in partitions.values():
+                    partition.writer.close()
+                    os.remove(partition.tmp_path)
+                raise
+            for partition in partitions.values():
+                partition.close()
+                files.append(partition.path)
+
+    return {"files": files, "rows": rows_written, "seconds": time.perf_counter() - started}
+
+
+def read_archive(path=LOG_ARCHIVE_DIR, columns=None, start=None, end=None):
+    pa, _, _ = _pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    expression = None
+    if start:
+        expression = ds.field("timestamp") >= pa.scalar(start, type=pa.timestamp("us"))
+    if end:
+        upper = ds.field("timestamp") < pa.scalar(end, type=pa.timestamp("us"))
+        expression = upper if expression is None else expression & upper
+    return dataset.to_table(columns=columns, filter=expression)
+
+
+def iter_archive_batches(path=LOG_ARCHIVE_DIR, columns=None, batch_size=ARCHIVE_BATCH_SIZE):
+    _pyarrow()
+    import pyarrow.dataset as ds
+
+    dataset = ds.dataset(path, format="parquet", partitioning="hive")
+    for batch in dataset.to_batches(columns=columns, batch_size=batch_size):
+        yield batch.to_pandas()
+
+
+def parse_time(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=LOG_ARCHIVE_DIR, help="Archive directory")
+    parser.add_argument("--from", dest="start", default=None,
+                        help="Export events at or after YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--to", dest="end", default=None,
+                        help="Export events before YYYY-MM-DD[ HH:MM:SS]")
+    parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+    parser.add_argument("--compression", default=ARCHIVE_COMPRESSION)
+    args = parser.parse_args()
+
+    # Per-batch progress goes through the logger; show it on the console here
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    result = export_archive(
+        args.out,
+        start=parse_time(args.start),
+        end=parse_time(args.end),
+        batch_size=args.batch_size,
+        compression=args.compression,
+    )
+    print(f"Експортовано {result['rows']} записів у {len(result['files'])} файлів "
+          f"за {result['seconds']:.1f} с")
@@ -0,0 +1,232 @@
+import argparse
+import hashlib
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, select, text
+
+from analytics_module import (
+    AnalyticsEngine,
+    AttackLog,
+    AttackLogWindow,
+    Base,
+    QueryFingerprint,
+)
+from log_rollup import TIMESTAMP_FORMAT, classify_reason, upsert_stmt
+from sql_lexer import normalize_sql
+
+LOG_COMPACTION = False
+# Must divide an hour so a window never spans two hourly rollup rows
+LOG_COMPACTION_WINDOW = 60
+COMPACT_EXISTING_BATCH = 10000
+
+
+def fingerprint_hash(fingerprint: str) -> str:
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()
+
+
+def window_start(timestamp: datetime, window=LOG_COMPACTION_WINDOW) -> datetime:
+    midnight = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    seconds = int((timestamp - midnight).total_seconds()) // window * window
+    return midnight + timedelta(seconds=seconds)
+
+
+def _greater(current, new):
+    return case(
+        (new.is_(None), current),
+        (current.is_(None), new),
+        (current >= new, current),
+        else_=new,
+    )
+
+
+def _lesser(current, new):
+    return case((current <= new, current), else_=new)
+
+
+def compact_events(conn, events, window=LOG_COMPACTION_WINDOW):
+    fingerprints = {}
+    windows = {}
+    for event in events:
+        timestamp = event["timestamp"]
+        if isinstance(timestamp, str):
+            timestamp = datetime.strptime(timestamp, TIMESTAMP_FORMAT)
+        fingerprint = normalize_sql(event["query"])
+        key = fingerprint_hash(fingerprint)
+
+        entry = fingerprints.get(key)
+        if entry is None:
+            fingerprints[key] = {
+                "fingerprint_hash": key,
+                "fingerprint": fingerprint,
+                "sample_query": event["query"],
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+                "count": 1,
+            }
+        else:
+            entry["first_seen"] = min(entry["first_seen"], timestamp)
+            entry["last_seen"] = max(entry["last_seen"], timestamp)
+            entry["count"] += 1
+
+        window_key = (
+            window_start(timestamp, window),
+            key,
+            event["status"],
+            classify_reason(event["reason"]),
+            event.get("source_ip") or "127.0.0.1",
+            event.get("attack_type_id") or 0,
+        )
+        score = event.get("score")
+        entry = windows.get(window_key)
+        if entry is None:
+            windows[window_key] = {
+                "reason": event["reason"],
+                "max_score": score,
+                "first_seen": timestamp,
+                "last_seen": timestamp,
+                "count": 1,
+            }
+        else:
+            if timestamp >= entry["last_seen"]:
+                entry["reason"] = event["reason"]
+                entry["last_seen"] = timestamp
+            entry["first_seen"] = min(entry["first_seen"], timestamp)
+            if score is not None and (entry["max_score"] is None or score > entry["max_score"]):
+                entry["max_score"] = score
+            entry["count"] += 1
+
+    if not fingerprints:
+        return 0
+
+    # Core tables with executemany: much cheaper to compile than multi-row VALUES
+    fingerprint_table = QueryFingerprint.__table__
+    stmt = upsert_stmt(conn, fingerprint_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["fingerprint_hash"],
+        set_={
+            "first_seen": _lesser(fingerprint_table.c.first_seen, stmt.excluded.first_seen),
+            "last_seen": _greater(fingerprint_table.c.last_seen, stmt.excluded.last_seen),
+            "count": fingerprint_table.c.count + stmt.excluded.count,
+        },
+    ).returning(fingerprint_table.c.id, fingerprint_table.c.fingerprint_hash)
+
+    # Sorted keys give every writer the same lock order
+    rows = [fingerprints[key] for key in sorted(fingerprints)]
+    ids = {key: fingerprint_id for fingerprint_id, key in conn.execute(stmt, rows)}
+
+    window_table = AttackLogWindow.__table__
+    stmt = upsert_stmt(conn, window_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[
+            "window_start",
+            "fingerprint_id",
+            "status",
+            "reason_class",
+            "source_ip",
+            "attack_type_id",
+        ],
+        set_={
+            "reason": stmt.excluded.reason,
+            "max_score": _greater(window_table.c.max_score, stmt.excluded.max_score),
+            "first_seen": _lesser(window_table.c.first_seen, stmt.excluded.first_seen),
+            "last_seen": _greater(window_table.c.last_seen, stmt.excluded.last_seen),
+            "count": window_table.c.count + stmt.excluded.count,
+        },
+    )
+
+    rows = [
+        {
+            "window_start": start,
+            "fingerprint_id": ids[key],
+            "status": status,
+            "reason_class": reason_class,
+            "source_ip": source_ip,
+            "attack_type_id": attack_type_id,
+            **values,
+        }
+        for (start, key, status, reason_class, source_ip, attack_type_id), values
+        in sorted(windows.items(), key=lambda item: (item[0][0], ids[item[0][1]], *item[0][2:]))
+    ]
+    conn.execute(stmt, rows)
+    return len(rows)
+
+
+def compact_existing(engine=AnalyticsEngine, batch_size=COMPACT_EXISTING_BATCH):
+    Base.metadata.create_all(engine)
+    columns = (
+        AttackLog.id,
+        AttackLog.timestamp,
+        AttackLog.reason,
+        AttackLog.query,
+        AttackLog.score,
+        AttackLog.source_ip,
+        AttackLog.status,
+        AttackLog.attack_type_id,
+    )
+
+    moved = 0
+    last_id = 0
+    while True:
+        # One transaction per batch: the hourly rollup is unaffected, only the
+        # storage of the events changes
+        with engine.begin() as conn:
+            rows = conn.execute(
+                select(*columns)
+                .where(AttackLog.id > last_id)
+                .order_by(AttackLog.id)
+                .limit(batch_size)
+            ).mappings().all()
+            if not rows:
+                break
+            compact_events(conn, rows)
+            last_id = rows[-1]["id"]
+            # Exact ids: a row with a lower id may still be committing
+            conn.execute(delete(AttackLog).where(AttackLog.id.in_([row["id"] for row in rows])))
+        moved += len(rows)
+        print(f"Ущільнено {moved} записів")
+    return moved
+
+
+def _relation_size(conn, size_function, table):
+    # Partitioned parents hold no data themselves, their leaves do; a plain
+    # table has no partition tree at all
+    return int(conn.execute(text(
+        f"SELECT coalesce((SELECT sum({size_function}(relid)) "
+        f"FROM pg_partition_tree(:table) WHERE isleaf), {size_function}(:table))"
+    ), {"table": table}).scalar())
+
+
+def storage_stats(engine=AnalyticsEngine):
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Storage statistics need PostgreSQL")
+
+    stats = {}
+    with engine.connect() as conn:
+        for model in (AttackLog, AttackLogWindow, QueryFingerprint):
+            table = model.__tablename__
+            stats[table] = {
+                "rows": conn.execute(text(f"SELECT count(*) FROM {table}")).scalar(),
+                "table_bytes": _relation_size(conn, "pg_table_size", table),
+                "index_bytes": _relation_size(conn, "pg_indexes_size", table),
+            }
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--compact-existing",
+        action="store_true",
+        help="Move the rows already in attack_logs into the fingerprint tables",
+    )
+    parser.add_argument("--batch-size", type=int, default=COMPACT_EXISTING_BATCH)
+    args = parser.parse_args()
+
+    if args.compact_existing:
+        compact_existing(batch_size=args.batch_size)
+    for table, info in storage_stats().items():
+        print(
+            f"{table:>20}: {info['rows']:>10} rows, "
+            f"table {info['table_bytes'] / 1024:>10.1f} KB, "
+            f"indexes {info['index_bytes'] / 1024:>10.1f} KB"
+        )
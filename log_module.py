@@ -1,53 +1,291 @@
-from flask import Blueprint, render_template, redirect, url_for, Response
+import csv
+import time
+import zlib
+from datetime import datetime
+from types import SimpleNamespace
+
+from flask import (
+    Blueprint,
+    render_template,
+    redirect,
+    url_for,
+    Response,
+    jsonify,
+    request,
+    stream_with_context,
+)
+from sqlalchemy import select, tuple_
 from sqlalchemy.orm import joinedload
-from analytics_module import AnalyticsSession, AttackLog
+from analytics_module import (
+    AnalyticsEngine,
+    AnalyticsSession,
+    AttackLog,
+    AttackLogWindow,
+    AttackType,
+    QueryFingerprint,
+)
 from io import StringIO
+from analytics_queries import get_analytics_cache
 from decorators import login_required
+from log_compaction import LOG_COMPACTION
+from log_rollup import TIMESTAMP_FORMAT, delete_all_logs
+from log_tail import LOG_TAIL_HEARTBEAT, get_recent_events
+from log_writer import get_log_writer
 
 log_bp = Blueprint("log", __name__)
 
+LOGS_PAGE_SIZE = 100
+LOGS_PAGE_SIZE_MAX = 1000
+EXPORT_BATCH_SIZE = 5000
+EXPORT_GZIP_LEVEL = 6
+EXPORT_COLUMNS = ("timestamp", "reason", "attack_type", "query", "score", "source_ip", "status")
+EXPORT_COMPACTED_COLUMNS = ("first_seen", "count")
+# The first /logs page comes from the in-process event buffer. It only sees what this
+# process wrote, so with several app processes turn it off to page from the DB only
+LOGS_FIRST_PAGE_FROM_MEMORY = True
+# Each live tail holds a request thread: it ends after this many seconds and the
+# browser's EventSource reconnects, resuming from Last-Event-ID
+LOGS_STREAM_LIFETIME = 300.0
+
 
 @log_bp.route("/logs")
 @login_required
 def view_logs():
+    try:
+        before = parse_log_time(request.args.get("before"))
+        before_id = request.args.get("before_id", type=int)
+        if (before is None) != (before_id is None):
+            raise ValueError("incomplete cursor")
+    except ValueError:
+        # Half a keyset cursor would silently restart from the first page
+        return jsonify({
+            "status": "error",
+            "message": "Курсор сторінки потребує коректних before (YYYY-MM-DD HH:MM:SS) і before_id",
+        }), 400
+    limit = min(request.args.get("limit", LOGS_PAGE_SIZE, type=int), LOGS_PAGE_SIZE_MAX)
+
+    recent = get_recent_events()
+    if LOGS_FIRST_PAGE_FROM_MEMORY and not LOG_COMPACTION and before is None and recent.can_serve(limit):
+        # First page straight from memory: no query against the analytics DB
+        events = recent.latest(limit)
+        next_page = None
+        if len(events) == limit and events[-1].get("id") is not None:
+            # Same keyset cursor as a DB page; the writer assigns ids before events reach the buffer
+            next_page = url_for(
+                "log.view_logs",
+                before=events[-1]["timestamp"],
+                before_id=events[-1]["id"],
+                limit=limit,
+            )
+        if len(events) < limit or next_page is not None:
+            logs = [event_view(recent, event) for event in events]
+            return render_template("logs.html", logs=logs, next_page=next_page, live=True)
+
+    if LOG_COMPACTION:
+        model, timestamp = AttackLogWindow, AttackLogWindow.last_seen
+        options = (joinedload(AttackLogWindow.attack_type), joinedload(AttackLogWindow.fingerprint))
+    else:
+        model, timestamp = AttackLog, AttackLog.timestamp
+        options = (joinedload(AttackLog.attack_type),)
+
     with AnalyticsSession() as db:
-        logs = db.query(AttackLog) \
-            .options(joinedload(AttackLog.attack_type)) \
-            .order_by(AttackLog.timestamp.desc()) \
-            .limit(100).all()
+        query = db.query(model).options(*options)
+        if before is not None:
+            # Keyset page: rows strictly older than the last one shown
+            query = query.filter(tuple_(timestamp, model.id) < tuple_(before, before_id))
+        logs = query.order_by(timestamp.desc(), model.id.desc()).limit(limit + 1).all()
+
+    next_page = None
+    if len(logs) > limit:
+        logs = logs[:limit]
+        next_page = url_for(
+            "log.view_logs",
+            before=logs[-1].timestamp.strftime(TIMESTAMP_FORMAT),
+            before_id=logs[-1].id,
+            limit=limit,
+        )
+
+    return render_template("logs.html", logs=logs, next_page=next_page, live=before is None)
+
+
+@log_bp.route("/logs/stream")
+@login_required
+def stream_logs():
+    recent = get_recent_events()
+    # EventSource resends the last id on reconnect; resume from the buffer
+    last_seq = request.headers.get("Last-Event-ID", type=int)
+    if last_seq is None or last_seq > recent.last_seq:
+        last_seq = recent.last_seq
+
+    def event_stream(seq):
+        yield "retry: 3000\n\n"
+        deadline = time.monotonic() + LOGS_STREAM_LIFETIME
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            seq, events = recent.since(seq, timeout=min(LOG_TAIL_HEARTBEAT, remaining))
+            for event_seq, event in events:
+                yield f"id: {event_seq}\ndata: {recent.to_json(event)}\n\n"
+            if not events:
+                # Comment line keeps proxies from closing an idle stream
+                yield ": keepalive\n\n"
+
+    return Response(
+        stream_with_context(event_stream(last_seq)),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
-    return render_template("logs.html", logs=logs)
+
+def event_view(recent, event):
+    code = recent.attack_code(event.get("attack_type_id"))
+    return SimpleNamespace(**{
+        **event,
+        "timestamp": datetime.strptime(event["timestamp"], TIMESTAMP_FORMAT),
+        "attack_type": SimpleNamespace(code=code) if code else None,
+    })
 
 
 @log_bp.route("/logs/download")
 @login_required
 def download_logs():
-    with AnalyticsSession() as db:
-        logs = db.query(AttackLog) \
-            .options(joinedload(AttackLog.attack_type)) \
-            .order_by(AttackLog.timestamp.desc()).all()
-
-    output = StringIO()
-    output.write("timestamp,reason,attack_type,query,score,source_ip,status\n")
-    for log in logs:
-        attack_type = log.attack_type.code if log.attack_type else "-"
-        score_str = f"{log.score:.2f}" if log.score is not None else "-"
-        output.write(
-            f"{log.timestamp},{log.reason},{attack_type},{log.query},{score_str},{log.source_ip},{log.status}\n"
-        )
+    try:
+        start = parse_log_time(request.args.get("from"))
+        end = parse_log_time(request.args.get("to"))
+    except ValueError:
+        return jsonify({
+            "status": "error",
+            "message": "Некоректний формат дати, очікується YYYY-MM-DD[ HH:MM:SS]",
+        }), 400
+
+    statuses = request.args.getlist("status")
+    if LOG_COMPACTION:
+        stmt = compacted_export_stmt(start, end, statuses)
+        columns = EXPORT_COLUMNS + EXPORT_COMPACTED_COLUMNS
+    else:
+        stmt = export_stmt(start, end, statuses)
+        columns = EXPORT_COLUMNS
+
+    chunks = iter_csv_chunks(stmt, columns)
+    filename = "attack_logs.csv"
+    mimetype = "text/csv"
+    if request.args.get("gzip") in ("1", "true"):
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
 
     return Response(
-        output.getvalue(),
-        mimetype="text/csv",
-        headers={"Content-Disposition": "attachment;filename=attack_logs.csv"}
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment;filename={filename}"}
     )
 
 
+def export_stmt(start, end, statuses):
+    stmt = select(
+        AttackLog.timestamp,
+        AttackLog.reason,
+        AttackType.code,
+        AttackLog.query,
+        AttackLog.score,
+        AttackLog.source_ip,
+        AttackLog.status,
+    ).outerjoin(AttackType, AttackLog.attack_type_id == AttackType.id)
+
+    if start:
+        stmt = stmt.where(AttackLog.timestamp >= start)
+    if end:
+        stmt = stmt.where(AttackLog.timestamp < end)
+    if statuses:
+        stmt = stmt.where(AttackLog.status.in_(statuses))
+    return stmt.order_by(AttackLog.timestamp.desc(), AttackLog.id.desc())
+
+
+def compacted_export_stmt(start, end, statuses):
+    stmt = select(
+        AttackLogWindow.last_seen,
+        AttackLogWindow.reason,
+        AttackType.code,
+        QueryFingerprint.sample_query,
+        AttackLogWindow.max_score,
+        AttackLogWindow.source_ip,
+        AttackLogWindow.status,
+        AttackLogWindow.first_seen,
+        AttackLogWindow.count,
+    ).join(
+        QueryFingerprint, AttackLogWindow.fingerprint_id == QueryFingerprint.id
+    ).outerjoin(
+        AttackType, AttackLogWindow.attack_type_id == AttackType.id
+    )
+
+    # A window is exported when any of its events falls inside the range
+    if start:
+        stmt = stmt.where(AttackLogWindow.last_seen >= start)
+    if end:
+        stmt = stmt.where(AttackLogWindow.first_seen < end)
+    if statuses:
+        stmt = stmt.where(AttackLogWindow.status.in_(statuses))
+    return stmt.order_by(AttackLogWindow.last_seen.desc(), AttackLogWindow.id.desc())
+
+
+def parse_log_time(value):
+    if not value:
+        return None
+    return datetime.fromisoformat(value)
+
+
+def iter_csv_chunks(stmt, columns=EXPORT_COLUMNS, batch_size=EXPORT_BATCH_SIZE):
+    buf = StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(columns)
+
+    with AnalyticsEngine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(stmt)
+        for rows in result.partitions():
+            for timestamp, reason, code, query, score, source_ip, status, *extra in rows:
+                writer.writerow((
+                    timestamp.strftime(TIMESTAMP_FORMAT),
+                    reason,
+                    code or "-",
+                    query,
+                    f"{score:.2f}" if score is not None else "-",
+                    source_ip,
+                    status,
+                    *(
+                        value.strftime(TIMESTAMP_FORMAT) if isinstance(value, datetime) else value
+                        for value in extra
+                    ),
+                ))
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
 @log_bp.route("/logs/clear")
 @login_required
 def clear_logs():
-    with AnalyticsSession() as db:
-        db.query(AttackLog).delete()
-        db.commit()
+    with AnalyticsEngine.begin() as conn:
+        delete_all_logs(conn)
+    get_analytics_cache().clear()
+    get_recent_events().clear()
 
     return redirect(url_for("log.view_logs"))
+
+
+@log_bp.route("/logs/writer_stats")
+@login_required
+def writer_stats():
+    return jsonify(get_log_writer().stats())
@@ -0,0 +1,335 @@
+import argparse
+import logging
+import re
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from analytics_module import AnalyticsEngine, AttackLog, AttackLogRollup
+from analytics_queries import get_analytics_cache
+from log_rollup import TIMESTAMP_FORMAT, delete_compacted_before, lock_rollups, purge_before
+
+LOG_PARTITION_PERIOD = "day"
+LOG_PARTITION_AHEAD = 3
+LOG_RETENTION_DAYS = None
+LOG_MAINTENANCE_INTERVAL = 3600.0
+
+PERIODS = {"day": timedelta(days=1), "week": timedelta(weeks=1)}
+BOUND_PATTERN = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+logger = logging.getLogger(__name__)
+
+_shared_maintainer = None
+_shared_lock = threading.Lock()
+
+
+def period_start(timestamp: datetime, period: str) -> datetime:
+    start = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == "week":
+        # Same boundaries as date_trunc('week', ...): weeks start on Monday
+        start -= timedelta(days=start.weekday())
+    return start
+
+
+def partition_name(start: datetime, period: str) -> str:
+    return f"{AttackLog.__tablename__}_{period[0]}{start:%Y%m%d}"
+
+
+def is_partitioned(conn) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table "
+        "WHERE partrelid = to_regclass(:table))"
+    ), {"table": AttackLog.__tablename__}).scalar()
+
+
+def list_partitions(conn):
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) "
+        "FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = to_regclass(:table)"
+    ), {"table": AttackLog.__tablename__})
+
+    partitions = []
+    for name, bound in rows:
+        match = BOUND_PATTERN.search(bound)
+        if match is None:
+            continue
+        partitions.append((
+            name,
+            datetime.fromisoformat(match.group(1)),
+            datetime.fromisoformat(match.group(2)),
+        ))
+    partitions.sort(key=lambda partition: partition[1])
+    return partitions
+
+
+def detect_period(partitions, default=LOG_PARTITION_PERIOD) -> str:
+    if not partitions:
+        return default
+    _, lower, upper = partitions[-1]
+    return "week" if upper - lower >= PERIODS["week"] else "day"
+
+
+def create_partition(conn, start: datetime, period: str, parent=AttackLog.__tablename__):
+    name = partition_name(start, period)
+    end = start + PERIODS[period]
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {parent} "
+        f"FOR VALUES FROM ('{start:{TIMESTAMP_FORMAT}}') TO ('{end:{TIMESTAMP_FORMAT}}')"
+    ))
+    return name
+
+
+def ensure_partitions(conn, start: datetime, end: datetime, period: str):
+    existing = {name for name, _, _ in list_partitions(conn)}
+    created = []
+    current = period_start(start, period)
+    while current <= end:
+        name = partition_name(current, period)
+        if name not in existing:
+            create_partition(conn, current, period)
+            created.append(name)
+        current += PERIODS[period]
+    return created
+
+
+def convert_to_partitioned(engine=AnalyticsEngine, period=LOG_PARTITION_PERIOD,
+                           ahead=LOG_PARTITION_AHEAD):
+    if engine.dialect.name != "postgresql":
+        raise RuntimeError("Partitioning is only available on PostgreSQL")
+    if period not in PERIODS:
+        raise ValueError(f"Unknown partition period: {period}")
+
+    table = AttackLog.__tablename__
+    staging = f"{table}_partitioned"
+
+    with engine.begin() as conn:
+        if is_partitioned(conn):
+            return False
+
+        conn.execute(text(f"LOCK TABLE {table} IN ACCESS EXCLUSIVE MODE"))
+        sequence = conn.execute(text(
+            "SELECT pg_get_serial_sequence(:table, 'id')"
+        ), {"table": table}).scalar()
+
+        # The partition key has to be part of the primary key
+        conn.execute(text(f"""
+            CREATE TABLE {staging} (
+                id INTEGER NOT NULL DEFAULT nextval('{sequence}'),
+                timestamp TIMESTAMP WITHOUT TIME ZONE NOT NULL,
+                reason TEXT NOT NULL,
+                query TEXT NOT NULL,
+                score DOUBLE PRECISION,
+                source_ip VARCHAR,
+                status VARCHAR,
+                attack_type_id INTEGER REFERENCES attack_types (id),
+                PRIMARY KEY (id, timestamp)
+            ) PARTITION BY RANGE (timestamp)
+        """))
+
+        starts = conn.execute(text(
+            f"SELECT DISTINCT date_trunc(:period, timestamp) FROM {table}"
+        ), {"period": period}).scalars().all()
+        now = period_start(datetime.now(), period)
+        starts = set(starts) | {now + PERIODS[period] * i for i in range(ahead + 1)}
+        for start in sorted(starts):
+            create_partition(conn, start, period, parent=staging)
+
+        conn.execute(text(
+            f"INSERT INTO {staging} (id, timestamp, reason, query, score, source_ip, "
+            f"status, attack_type_id) SELECT id, timestamp, reason, query, score, "
+            f"source_ip, status, attack_type_id FROM {table}"
+        ))
+        conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {staging}.id"))
+        conn.execute(text(f"DROP TABLE {table}"))
+        conn.execute(text(f"ALTER TABLE {staging} RENAME TO {table}"))
+        conn.execute(text(
+            f"ALTER TABLE {table} RENAME CONSTRAINT {staging}_pkey TO {table}_pkey"
+        ))
+
+    for index in AttackLog.__table__.indexes:
+        index.create(engine, checkfirst=True)
+    with engine.begin() as conn:
+        conn.execute(text(f"ANALYZE {table}"))
+    return True
+
+
+def drop_expired(conn, cutoff: datetime):
+    if not is_partitioned(conn):
+        # Plain table (or SQLite): fall back to row deletes
+        purge_before(conn, cutoff)
+        return []
+
+    expired = [
+        (name, upper) for name, _, upper in list_partitions(conn)
+        if upper <= cutoff
+    ]
+    if not expired:
+        return []
+
+    # Parent lock first, rollup second: the same order writers take them in
+    for name, _ in expired:
+        conn.execute(text(f"ALTER TABLE {AttackLog.__tablename__} DETACH PARTITION {name}"))
+    boundary = max(upper for _, upper in expired)
+    delete_compacted_before(conn, boundary)
+    lock_rollups(conn)
+    conn.execute(
+        AttackLogRollup.__table__.delete().where(AttackLogRollup.hour < boundary)
+    )
+    for name, _ in expired:
+        conn.execute(text(f"DROP TABLE {name}"))
+    return [name for name, _ in expired]
+
+
+class PartitionMaintainer:
+    def __init__(
+            self,
+            engine=AnalyticsEngine,
+            ahead=LOG_PARTITION_AHEAD,
+            retention_days=LOG_RETENTION_DAYS,
+            interval=LOG_MAINTENANCE_INTERVAL,
+    ):
+        self.engine = engine
+        self.ahead = ahead
+        self.retention_days = retention_days
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._covered = []
+        self.period = None
+        self.created = 0
+        self.dropped = 0
+        self.last_run_at = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                self.maintain()
+            except Exception:
+                logger.exception("Помилка обслуговування партицій attack_logs")
+            if self._stop.wait(self.interval):
+                break
+
+    def _refresh(self, conn):
+        partitions = list_partitions(conn)
+        self.period = detect_period(partitions)
+        self._covered = [(lower, upper) for _, lower, upper in partitions]
+
+    def maintain(self):
+        with self._lock, self.engine.begin() as conn:
+            if not is_partitioned(conn):
+                self.period = None
+                if self.retention_days is None:
+                    return
+            else:
+                self._refresh(conn)
+                now = datetime.now()
+                created = ensure_partitions(
+                    conn, now, now + PERIODS[self.period] * self.ahead, self.period
+                )
+                self.created += len(created)
+
+            if self.retention_days is not None:
+                cutoff = datetime.now() - timedelta(days=self.retention_days)
+                self.dropped += len(drop_expired(conn, cutoff))
+            if self.period is not None:
+                self._refresh(conn)
+            self.last_run_at = datetime.now()
+
+        if self.retention_days is not None:
+            # Cached aggregates may still count the rows that were just removed
+            get_analytics_cache().clear()
+
+    def _is_covered(self, timestamp):
+        return any(lower <= timestamp < upper for lower, upper in self._covered)
+
+    def ensure_for(self, batch):
+        if self.period is None:
+            return
+        timestamps = {
+            period_start(datetime.strptime(event["timestamp"], TIMESTAMP_FORMAT), self.period)
+            for event in batch
+        }
+        missing = [start for start in timestamps if not self._is_covered(start)]
+        if not missing:
+            return
+
+        # Partition DDL runs in its own short transaction, not the insert's
+        with self._lock, self.engine.begin() as conn:
+            for start in missing:
+                create_partition(conn, start, self.period)
+            self.created += len(missing)
+            self._refresh(conn)
+
+    def stats(self):
+        return {
+            "partitioned": self.period is not None,
+            "period": self.period,
+            "partitions": len(self._covered),
+            "oldest": self._covered[0][0].strftime(TIMESTAMP_FORMAT) if self._covered else None,
+            "newest": self._covered[-1][1].strftime(TIMESTAMP_FORMAT) if self._covered else None,
+            "retention_days": self.retention_days,
+            "created": self.created,
+            "dropped": self.dropped,
+            "last_run_at": self.last_run_at.strftime(TIMESTAMP_FORMAT) if self.last_run_at else None,
+        }
+
+
+def get_partition_maintainer():
+    global _shared_maintainer
+
+    with _shared_lock:
+        if _shared_maintainer is None:
+            _shared_maintainer = PartitionMaintainer()
+            _shared_maintainer.start()
+        return _shared_maintainer
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--convert",
+        action="store_true",
+        help="Rebuild attack_logs as a range-partitioned table (PostgreSQL only)",
+    )
+    parser.add_argument(
+        "--period",
+        choices=sorted(PERIODS),
+        default=LOG_PARTITION_PERIOD,
+        help="Partition width used by --convert",
+    )
+    parser.add_argument(
+        "--retention-days",
+        type=int,
+        default=LOG_RETENTION_DAYS,
+        help="Drop partitions whose data is entirely older than this many days",
+    )
+    args = parser.parse_args()
+
+    if args.convert:
+        if convert_to_partitioned(period=args.period):
+            print(f"attack_logs розбито на партиції ({args.period})")
+        else:
+            print("attack_logs вже розбита на партиції")
+
+    maintainer = PartitionMaintainer(retention_days=args.retention_days)
+    maintainer.maintain()
+    print(maintainer.stats())
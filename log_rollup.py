@@ -0,0 +1,246 @@
+import argparse
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, delete, func, inspect, select, text, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+
+from analytics_module import (
+    AnalyticsEngine,
+    AttackLog,
+    AttackLogRollup,
+    AttackLogWindow,
+    Base,
+    QueryFingerprint,
+)
+
+REASON_CLASSES = ("ai", "rule", "safe", "db_error", "other")
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def hour_of(timestamp) -> datetime:
+    if isinstance(timestamp, str):
+        timestamp = datetime.strptime(timestamp[:19], TIMESTAMP_FORMAT)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def next_hour(timestamp) -> datetime:
+    return hour_of(timestamp) + timedelta(hours=1)
+
+
+def hour_expr(conn, column):
+    if conn.dialect.name == "postgresql":
+        return func.date_trunc("hour", column)
+    return func.strftime("%Y-%m-%d %H:00:00.000000", column)
+
+
+def classify_reason(reason: str) -> str:
+    reason = reason or ""
+    if reason.upper().startswith("AI"):
+        return "ai"
+    if reason.startswith("Blocked "):
+        return "rule"
+    if reason.lower() == "safe":
+        return "safe"
+    if reason == "error_from_db":
+        return "db_error"
+    return "other"
+
+
+def reason_class_expr(reason):
+    # Must stay in step with classify_reason
+    return case(
+        (func.upper(reason).like("AI%"), "ai"),
+        (reason.like("Blocked %"), "rule"),
+        (func.lower(reason) == "safe", "safe"),
+        (reason == "error_from_db", "db_error"),
+        else_="other",
+    )
+
+
+def rollup_counts(events):
+    counts = Counter()
+    for event in events:
+        counts[(
+            hour_of(event["timestamp"]),
+            event["status"],
+            classify_reason(event["reason"]),
+            event.get("attack_type_id") or 0,
+        )] += 1
+    return counts
+
+
+def upsert_stmt(conn, model):
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(model)
+    if dialect == "sqlite":
+        return sqlite.insert(model)
+    raise NotImplementedError(f"Upsert is not supported on {dialect}")
+
+
+def apply_rollup(conn, events):
+    counts = rollup_counts(events)
+    if not counts:
+        return 0
+
+    stmt = upsert_stmt(conn, AttackLogRollup)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["hour", "status", "reason_class", "attack_type_id"],
+        set_={"count": AttackLogRollup.count + stmt.excluded.count},
+    )
+    # Sorted keys give every writer the same lock order
+    conn.execute(stmt, [
+        {
+            "hour": hour,
+            "status": status,
+            "reason_class": reason_class,
+            "attack_type_id": attack_type_id,
+            "count": count,
+        }
+        for (hour, status, reason_class, attack_type_id), count in sorted(counts.items())
+    ])
+    return len(counts)
+
+
+def lock_rollups(conn):
+    # Writers upsert rollups in the same transaction as their inserts, so they
+    # wait here until a rebuild or clear has committed
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            f"LOCK TABLE {AttackLogRollup.__tablename__} IN SHARE ROW EXCLUSIVE MODE"
+        ))
+
+
+def rebuild(conn, before=None):
+    lock_rollups(conn)
+
+    hour = hour_expr(conn, AttackLog.timestamp)
+    reason_class = reason_class_expr(AttackLog.reason)
+    attack_type_id = func.coalesce(AttackLog.attack_type_id, 0)
+    raw = select(
+        hour.label("hour"),
+        AttackLog.status.label("status"),
+        reason_class.label("reason_class"),
+        attack_type_id.label("attack_type_id"),
+        func.count().label("count"),
+    ).group_by(hour, AttackLog.status, reason_class, attack_type_id)
+
+    # Compacted events (log_compaction.py); a window never spans two hours
+    window_hour = hour_expr(conn, AttackLogWindow.window_start)
+    compacted = select(
+        window_hour.label("hour"),
+        AttackLogWindow.status,
+        AttackLogWindow.reason_class,
+        AttackLogWindow.attack_type_id,
+        func.sum(AttackLogWindow.count).label("count"),
+    ).group_by(
+        window_hour,
+        AttackLogWindow.status,
+        AttackLogWindow.reason_class,
+        AttackLogWindow.attack_type_id,
+    )
+
+    clear_stmt = delete(AttackLogRollup)
+    if before is not None:
+        end = next_hour(before)
+        clear_stmt = clear_stmt.where(AttackLogRollup.hour < end)
+        raw = raw.where(AttackLog.timestamp < end)
+        compacted = compacted.where(AttackLogWindow.window_start < end)
+
+    events = union_all(raw, compacted).subquery()
+    source = select(
+        events.c.hour,
+        events.c.status,
+        events.c.reason_class,
+        events.c.attack_type_id,
+        func.sum(events.c.count),
+    ).group_by(
+        events.c.hour,
+        events.c.status,
+        events.c.reason_class,
+        events.c.attack_type_id,
+    )
+
+    conn.execute(clear_stmt)
+    result = conn.execute(
+        AttackLogRollup.__table__.insert().from_select(
+            ["hour", "status", "reason_class", "attack_type_id", "count"],
+            source,
+        )
+    )
+    return result.rowcount
+
+
+def delete_compacted_before(conn, cutoff: datetime):
+    deleted = conn.execute(
+        delete(AttackLogWindow).where(AttackLogWindow.last_seen < cutoff)
+    ).rowcount
+    conn.execute(
+        delete(QueryFingerprint)
+        .where(QueryFingerprint.last_seen < cutoff)
+        .where(~QueryFingerprint.id.in_(select(AttackLogWindow.fingerprint_id)))
+    )
+    return deleted
+
+
+def delete_all_logs(conn):
+    if conn.dialect.name == "postgresql":
+        # Empties every partition at once; takes the attack_logs lock before the
+        # rollup lock, in the same order as writers
+        conn.execute(text(f"TRUNCATE {AttackLog.__tablename__}"))
+        conn.execute(text(
+            f"TRUNCATE {AttackLogWindow.__tablename__}, {QueryFingerprint.__tablename__}"
+        ))
+        lock_rollups(conn)
+        conn.execute(text(f"TRUNCATE {AttackLogRollup.__tablename__}"))
+    else:
+        conn.execute(delete(AttackLog))
+        conn.execute(delete(AttackLogWindow))
+        conn.execute(delete(QueryFingerprint))
+        conn.execute(delete(AttackLogRollup))
+
+
+def purge_before(conn, cutoff: datetime):
+    lock_rollups(conn)
+    deleted = conn.execute(delete(AttackLog).where(AttackLog.timestamp < cutoff)).rowcount
+    deleted += delete_compacted_before(conn, cutoff)
+    # Hours entirely before the cutoff vanish, the boundary hour is recounted
+    rebuild(conn, before=cutoff)
+    return deleted
+
+
+def backfill(engine=AnalyticsEngine):
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        return rebuild(conn)
+
+
+def ensure_rollup(engine=AnalyticsEngine):
+    if not inspect(engine).has_table(AttackLogRollup.__tablename__):
+        backfill(engine)
+    else:
+        Base.metadata.create_all(engine)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Rebuild attack_log_rollups from all rows in attack_logs",
+    )
+    parser.add_argument(
+        "--purge-before",
+        default=None,
+        help="Delete attack_logs older than this timestamp (YYYY-MM-DD[ HH:MM:SS]) "
+             "and fix up the rollup",
+    )
+    args = parser.parse_args()
+
+    if args.purge_before:
+        cutoff = datetime.fromisoformat(args.purge_before)
+        with AnalyticsEngine.begin() as conn:
+            print(f"Видалено записів: {purge_before(conn, cutoff)}")
+    if args.backfill or not args.purge_before:
+        print(f"Рядків у rollup: {backfill()}")
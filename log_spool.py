@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+LOG_SPOOL_DIR = "spool"
+LOG_SPOOL_SEGMENT_BYTES = 16 * 1024 * 1024
+LOG_SPOOL_FSYNC = True
+LOG_SPOOL_REPLAY_INTERVAL = 2.0
+LOG_SPOOL_REPLAY_BATCH = 5000
+
+SEGMENT_PREFIX = "attack_logs-"
+SEGMENT_SUFFIX = ".seg"
+# Events of a segment already written to the database, so a retry resumes after them
+OFFSET_SUFFIX = ".offset"
+# Damaged segments are moved here instead of being deleted with their unreadable tail
+QUARANTINE_DIR = "quarantine"
+# Record layout: payload length (uint32), crc32 of payload (uint32), JSON payload
+HEADER = struct.Struct(">II")
+
+logger = logging.getLogger(__name__)
+
+
+def _segment_seq(name: str) -> int:
+    return int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)])
+
+
+class LogSpool:
+    def __init__(
+            self,
+            directory=LOG_SPOOL_DIR,
+            segment_bytes=LOG_SPOOL_SEGMENT_BYTES,
+            fsync=LOG_SPOOL_FSYNC,
+    ):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._active = None
+        self._active_path = None
+
+        self.appended = 0
+        self.appended_bytes = 0
+        self.replayed = 0
+        self.corrupt = 0
+        self.quarantined = 0
+
+        os.makedirs(directory, exist_ok=True)
+        existing = self.segments()
+        self._next_seq = _segment_seq(os.path.basename(existing[-1])) + 1 if existing else 1
+
+    def segments(self):
+        names = [
+            name for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        ]
+        names.sort(key=_segment_seq)
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _open_segment(self):
+        path = os.path.join(
+            self.directory, f"{SEGMENT_PREFIX}{self._next_seq:010d}{SEGMENT_SUFFIX}"
+        )
+        self._next_seq += 1
+        self._active = open(path, "ab")
+        self._active_path = path
+
+    def _close_segment(self):
+        if self._active is not None:
+            self._active.close()
+        self._active = None
+        self._active_path = None
+
+    def append(self, events):
+        if not events:
+            return
+        buf = bytearray()
+        for event in events:
+            payload = json.dumps(event, ensure_ascii=False).encode("utf-8")
+            buf += HEADER.pack(len(payload), zlib.crc32(payload))
+            buf += payload
+
+        with self._lock:
+            if self._active is None:
+                self._open_segment()
+            self._active.write(buf)
+            self._active.flush()
+            if self.fsync:
+                os.fsync(self._active.fileno())
+            self.appended += len(events)
+            self.appended_bytes += len(buf)
+            if self._active.tell() >= self.segment_bytes:
+                self._close_segment()
+
+    def seal(self):
+        with self._lock:
+            self._close_segment()
+
+    def sealed_segments(self):
+        with self._lock:
+            active = self._active_path
+        return [path for path in self.segments() if path != active]
+
+    def read_segment(self, path):
+        # (events, intact): intact is False when a damaged record hid the rest of the file
+        events = []
+        with open(path, "rb") as f:
+            data = f.read()
+
+        pos = 0
+        while pos < len(data):
+            start = pos + HEADER.size
+            if start <= len(data):
+                length, checksum = HEADER.unpack_from(data, pos)
+                payload = data[start:start + length]
+            if start > len(data) or len(payload) < length or zlib.crc32(payload) != checksum:
+                # Torn or damaged tail: everything after it is unreadable
+                self.corrupt += 1
+                logger.error("Пошкоджений запис у %s на позиції %d", path, pos)
+                return events, False
+            events.append(json.loads(payload.decode("utf-8")))
+            pos = start + length
+        return events, True
+
+    def replay_offset(self, path) -> int:
+        try:
+            with open(path + OFFSET_SUFFIX) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def save_offset(self, path, offset):
+        tmp_path = path + OFFSET_SUFFIX + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(str(offset))
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path + OFFSET_SUFFIX)
+
+    def _drop_offset(self, path):
+        try:
+            os.remove(path + OFFSET_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+    def remove(self, path, replayed=0):
+        os.remove(path)
+        self._drop_offset(path)
+        self.replayed += replayed
+
+    def quarantine(self, path, replayed=0):
+        directory = os.path.join(self.directory, QUARANTINE_DIR)
+        os.makedirs(directory, exist_ok=True)
+        os.replace(path, os.path.join(directory, os.path.basename(path)))
+        self._drop_offset(path)
+        self.replayed += replayed
+        self.quarantined += 1
+
+    def stats(self):
+        segments = self.segments()
+        size = 0
+        oldest = None
+        for path in segments:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            size += stat.st_size
+            oldest = stat.st_mtime if oldest is None else min(oldest, stat.st_mtime)
+
+        return {
+            "directory": self.directory,
+            "segments": len(segments),
+            "bytes": size,
+            "appended": self.appended,
+            "appended_bytes": self.appended_bytes,
+            "replayed": self.replayed,
+            "pending": max(0, self.appended - self.replayed),
+            "corrupt": self.corrupt,
+            "quarantined": self.quarantined,
+            "oldest_segment_age_s": time.time() - oldest if oldest is not None else 0.0,
+        }
+
+
+class SpoolReplayer:
+    def __init__(
+            self,
+            spool,
+            sink,
+            interval=LOG_SPOOL_REPLAY_INTERVAL,
+            batch_size=LOG_SPOOL_REPLAY_BATCH,
+            on_success=None,
+            on_failure=None,
+    ):
+        self.spool = spool
+        self.sink = sink
+        self.interval = interval
+        self.batch_size = batch_size
+        self.on_success = on_success
+        self.on_failure = on_failure
+
+        self._stop = threading.Event()
+        self._thread = None
+        self.replayed = 0
+        self.failures = 0
+        self.last_replay_at = None
+        self.last_rate = 0.0
+        self.lag_seconds = 0.0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.replay_once()
+            except Exception:
+                logger.exception("Помилка відтворення spool")
+
+    def replay_once(self):
+        self.spool.seal()
+        replayed = 0
+        started = time.perf_counter()
+
+        for path in self.spool.sealed_segments():
+            events, intact = self.spool.read_segment(path)
+            done = start = min(self.spool.replay_offset(path), len(events))
+            if len(events) > done:
+                self.lag_seconds = max(0.0, time.time() - os.stat(path).st_mtime)
+            try:
+                for i in range(done, len(events), self.batch_size):
+                    chunk = events[i:i + self.batch_size]
+                    self.sink(chunk)
+                    # Committed chunks are not written again if a later one fails
+                    done = i + len(chunk)
+                    self.spool.save_offset(path, done)
+            except Exception:
+                self.failures += 1
+                logger.warning("БД аналітики недоступна, spool буде відтворено пізніше")
+                if self.on_failure is not None:
+                    self.on_failure()
+                break
+
+            if intact:
+                self.spool.remove(path, replayed=len(events))
+            else:
+                logger.error("Сегмент %s пошкоджено, перенесено до %s", path, QUARANTINE_DIR)
+                self.spool.quarantine(path, replayed=len(events))
+            replayed += len(events) - start
+            if self.on_success is not None:
+                self.on_success()
+
+        if replayed:
+            elapsed = time.perf_counter() - started
+            self.replayed += replayed
+            self.last_replay_at = time.time()
+            self.last_rate = replayed / elapsed if elapsed > 0 else 0.0
+        if not self.spool.sealed_segments():
+            self.lag_seconds = 0.0
+        return replayed
+
+    def stats(self):
+        return {
+            "running": self._thread is not None,
+            "replayed": self.replayed,
+            "failures": self.failures,
+            "lag_seconds": self.lag_seconds,
+            "last_replay_at": self.last_replay_at,
+            "last_rate_per_s": self.last_rate,
+        }
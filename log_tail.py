@@ -0,0 +1,138 @@
+import itertools
+import json
+import logging
+import threading
+from collections import deque
+
+from sqlalchemy import select
+
+from analytics_module import AnalyticsEngine, AttackLog, AttackType
+from log_rollup import TIMESTAMP_FORMAT
+
+LOG_TAIL_SIZE = 1000
+LOG_TAIL_HEARTBEAT = 15.0
+
+logger = logging.getLogger(__name__)
+
+_shared_events = None
+_shared_lock = threading.Lock()
+
+
+class RecentEvents:
+    def __init__(self, size=LOG_TAIL_SIZE):
+        self.size = size
+        self._events = deque(maxlen=size)
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._attack_codes = {}
+        self.warm = False
+        # True while the buffer still holds every row of attack_logs
+        self.complete = False
+        self.appended = 0
+
+    def __len__(self):
+        return len(self._events)
+
+    def warm_up(self, engine=AnalyticsEngine):
+        with engine.connect() as conn:
+            codes = dict(conn.execute(select(AttackType.id, AttackType.code)).all())
+            rows = conn.execute(
+                select(
+                    AttackLog.id,
+                    AttackLog.timestamp,
+                    AttackLog.reason,
+                    AttackLog.query,
+                    AttackLog.score,
+                    AttackLog.source_ip,
+                    AttackLog.status,
+                    AttackLog.attack_type_id,
+                )
+                .order_by(AttackLog.timestamp.desc(), AttackLog.id.desc())
+                .limit(self.size)
+            ).mappings().all()
+
+        with self._cond:
+            self._attack_codes = codes
+            for row in reversed(rows):
+                self._seq += 1
+                self._events.append(
+                    (self._seq, {**row, "timestamp": row["timestamp"].strftime(TIMESTAMP_FORMAT)})
+                )
+            self.complete = len(rows) < self.size
+            self.warm = True
+
+    def append(self, events):
+        with self._cond:
+            for event in events:
+                self._seq += 1
+                if len(self._events) == self.size:
+                    self.complete = False
+                self._events.append((self._seq, event))
+            self.appended += len(events)
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._events.clear()
+            self.complete = True
+
+    def can_serve(self, limit) -> bool:
+        return self.warm and (self.complete or len(self._events) >= limit)
+
+    def latest(self, limit):
+        with self._cond:
+            events = [event for _, event in self._events]
+        # Replayed spool batches arrive late, so order as /logs pages do, not by arrival
+        events.sort(key=lambda event: (event["timestamp"], event.get("id") or 0), reverse=True)
+        return events[:limit]
+
+    def since(self, seq, timeout=None):
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq > seq, timeout)
+            count = min(self._seq - seq, len(self._events))
+            return self._seq, list(itertools.islice(self._events, len(self._events) - count, None))
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def attack_code(self, attack_type_id):
+        if attack_type_id is None:
+            return None
+        code = self._attack_codes.get(attack_type_id)
+        if code is None:
+            with AnalyticsEngine.connect() as conn:
+                code = conn.execute(
+                    select(AttackType.code).where(AttackType.id == attack_type_id)
+                ).scalar()
+            if code is not None:
+                self._attack_codes[attack_type_id] = code
+        return code
+
+    def to_json(self, event):
+        return json.dumps({**event, "attack_type": self.attack_code(event.get("attack_type_id"))})
+
+    def stats(self):
+        with self._cond:
+            return {
+                "size": self.size,
+                "entries": len(self._events),
+                "warm": self.warm,
+                "complete": self.complete,
+                "appended": self.appended,
+                "last_seq": self._seq,
+            }
+
+
+def get_recent_events():
+    global _shared_events
+
+    with _shared_lock:
+        if _shared_events is None:
+            _shared_events = RecentEvents()
+            try:
+                # Before the writer starts, so no committed batch is counted twice
+                _shared_events.warm_up()
+            except Exception:
+                logger.exception("Не вдалося завантажити останні події attack_logs")
+        return _shared_events
@@ -0,0 +1,383 @@
+import atexit
+import csv
+import io
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from sqlalchemy import insert, text
+
+from analytics_module import AnalyticsEngine, AttackLog
+from analytics_queries import invalidate_events
+from log_compaction import LOG_COMPACTION, compact_events
+from log_partitions import get_partition_maintainer
+from log_rollup import TIMESTAMP_FORMAT, apply_rollup, ensure_rollup
+from log_spool import LogSpool, SpoolReplayer
+from log_tail import get_recent_events
+from metrics import Histogram, exponential_buckets
+
+LOG_WRITER_QUEUE_SIZE = 10000
+LOG_WRITER_BATCH_SIZE = 500
+LOG_WRITER_FLUSH_INTERVAL = 0.5
+LOG_WRITER_POLICY = "block"
+LOG_WRITER_BLOCK_TIMEOUT = 5.0
+LOG_WRITER_SAMPLE_EVERY = 10
+LOG_WRITER_USE_COPY = True
+LOG_WRITER_SLOW_FLUSH = 1.0
+LOG_WRITER_RETRY_BACKOFF = 5.0
+LOG_SPOOL_ENABLED = True
+
+POLICIES = ("block", "drop_oldest", "sample")
+COLUMNS = (
+    "timestamp",
+    "reason",
+    "query",
+    "score",
+    "source_ip",
+    "status",
+    "attack_type_id",
+)
+
+logger = logging.getLogger(__name__)
+
+_shared_writer = None
+_shared_lock = threading.Lock()
+
+
+def make_event(
+        query: str,
+        status: str,
+        reason: str = "",
+        score: float = 0.0,
+        source_ip: str = "127.0.0.1",
+        attack_type_id: int = None,
+):
+    return {
+        # Kept as text so events survive the JSON spool unchanged
+        "timestamp": datetime.now().strftime(TIMESTAMP_FORMAT),
+        "reason": reason or ("malicious" if status == "blocked" else "safe"),
+        "query": query,
+        "score": score,
+        "source_ip": source_ip,
+        "status": status,
+        "attack_type_id": attack_type_id,
+    }
+
+
+class AttackLogWriter:
+    def __init__(
+            self,
+            engine=AnalyticsEngine,
+            queue_size=LOG_WRITER_QUEUE_SIZE,
+            batch_size=LOG_WRITER_BATCH_SIZE,
+            flush_interval=LOG_WRITER_FLUSH_INTERVAL,
+            policy=LOG_WRITER_POLICY,
+            block_timeout=LOG_WRITER_BLOCK_TIMEOUT,
+            sample_every=LOG_WRITER_SAMPLE_EVERY,
+            use_copy=LOG_WRITER_USE_COPY,
+            spool=None,
+            maintainer=None,
+            recent=None,
+            compact=LOG_COMPACTION,
+            slow_flush=LOG_WRITER_SLOW_FLUSH,
+            retry_backoff=LOG_WRITER_RETRY_BACKOFF,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown backpressure policy: {policy}")
+
+        self.engine = engine
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.sample_every = sample_every
+        self.use_copy = use_copy and engine.dialect.name == "postgresql"
+        self.spool = spool
+        self.maintainer = maintainer
+        self.recent = recent
+        self.compact = compact
+        self.slow_flush = slow_flush
+        self.retry_backoff = retry_backoff
+        self.replayer = None
+        if spool is not None:
+            self.replayer = SpoolReplayer(
+                spool,
+                self._write_rows,
+                on_success=self._mark_available,
+                on_failure=self._mark_unavailable,
+            )
+
+        self._queue = deque()
+        # Events that found the queue full; the writer thread spools them, one fsync per batch
+        self._spill = deque()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._running = False
+        self._sample_counter = 0
+        self._db_retry_at = 0.0
+
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.spooled = 0
+        self.flushes = 0
+        self.flush_latency_ms = Histogram(exponential_buckets(0.5, 2, 14))
+        self.batch_sizes = Histogram(exponential_buckets(1, 2, 14))
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        if self.replayer is not None:
+            self.replayer.start()
+
+    def close(self, timeout=10.0):
+        with self._cond:
+            if not self._running:
+                return
+            self._running = False
+            self._cond.notify_all()
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            thread.join(timeout)
+        if self.replayer is not None:
+            self.replayer.stop()
+
+    def write(self, event) -> bool:
+        if not self._running:
+            self.start()
+
+        with self._cond:
+            if len(self._queue) >= self.queue_size * 3 // 4 and self.policy == "sample":
+                self._sample_counter += 1
+                if self._sample_counter % self.sample_every:
+                    self.dropped += 1
+                    return False
+
+            full = len(self._queue) >= self.queue_size
+            if full and self.spool is not None and len(self._spill) < self.queue_size:
+                # The database cannot keep up: the writer thread parks these on local disk
+                self._spill.append(event)
+                self._cond.notify_all()
+                return True
+
+            if full:
+                if self.policy == "drop_oldest":
+                    self._queue.popleft()
+                    self.dropped += 1
+                elif self.policy == "sample":
+                    self.dropped += 1
+                    return False
+                elif not self._cond.wait_for(
+                        lambda: len(self._queue) < self.queue_size or not self._running,
+                        timeout=self.block_timeout,
+                ):
+                    self.dropped += 1
+                    return False
+
+            self._queue.append(event)
+            self.enqueued += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _take_batch(self):
+        with self._cond:
+            self._cond.wait_for(
+                lambda: len(self._queue) >= self.batch_size or self._spill or not self._running,
+                timeout=self.flush_interval,
+            )
+            spill = list(self._spill)
+            self._spill.clear()
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            if batch or spill:
+                self._cond.notify_all()
+            return spill, batch
+
+    def _run(self):
+        while True:
+            spill, batch = self._take_batch()
+            if spill:
+                self._spool_batch(spill)
+            if batch:
+                self.flush_batch(batch)
+            elif not spill and not self._running:
+                break
+
+    def flush_batch(self, batch):
+        if self.spool is not None and not self.db_available():
+            self._spool_batch(batch)
+            return False
+
+        started = time.perf_counter()
+        try:
+            self._write_rows(batch)
+        except Exception:
+            logger.exception("Не вдалося записати %d подій в attack_logs", len(batch))
+            if self.spool is None:
+                self.failed += len(batch)
+                return False
+            self._mark_unavailable()
+            self._spool_batch(batch)
+            return False
+
+        elapsed = time.perf_counter() - started
+        self.written += len(batch)
+        self.flushes += 1
+        self.batch_sizes.observe(len(batch))
+        self.flush_latency_ms.observe(elapsed * 1000)
+        if self.spool is not None and elapsed > self.slow_flush:
+            # Stalled database: divert the next batches to the spool
+            logger.warning("Запис в attack_logs тривав %.2f с, перемикаємось на spool", elapsed)
+            self._mark_unavailable()
+        return True
+
+    def db_available(self) -> bool:
+        return time.monotonic() >= self._db_retry_at
+
+    def _mark_available(self):
+        self._db_retry_at = 0.0
+
+    def _mark_unavailable(self):
+        self._db_retry_at = time.monotonic() + self.retry_backoff
+
+    def _spool_batch(self, batch):
+        # An id from a failed attempt is not kept: if that attempt did commit, replaying
+        # the same id would fail on the primary key and hold the spool up for good
+        batch = [{key: value for key, value in event.items() if key != "id"} for event in batch]
+        try:
+            self.spool.append(batch)
+        except OSError:
+            logger.exception("Не вдалося записати %d подій у spool", len(batch))
+            with self._cond:
+                self.failed += len(batch)
+            return
+        with self._cond:
+            self.spooled += len(batch)
+
+    def _write_rows(self, batch):
+        if self.compact:
+            self._compact_rows(batch)
+        else:
+            if self.maintainer is not None:
+                self.maintainer.ensure_for(batch)
+            if self.use_copy:
+                self._copy_rows(batch)
+            else:
+                self._insert_rows(batch)
+        invalidate_events(batch)
+        if self.recent is not None:
+            self.recent.append(batch)
+
+    def _compact_rows(self, batch):
+        with self.engine.begin() as conn:
+            compact_events(conn, batch)
+            apply_rollup(conn, batch)
+
+    def _assign_ids(self, conn, batch):
+        # Ids are taken before the write so the /logs buffer can hand out keyset cursors
+        missing = [event for event in batch if event.get("id") is None]
+        if not missing or conn.dialect.name != "postgresql":
+            return
+        ids = conn.execute(
+            text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {"table": AttackLog.__tablename__, "count": len(missing)},
+        ).scalars().all()
+        for event, event_id in zip(missing, ids):
+            event["id"] = event_id
+
+    def _insert_rows(self, batch):
+        with self.engine.begin() as conn:
+            self._assign_ids(conn, batch)
+            rows = [
+                {**event, "timestamp": datetime.strptime(event["timestamp"], TIMESTAMP_FORMAT)}
+                for event in batch
+            ]
+            if all(event.get("id") is not None for event in batch):
+                conn.execute(insert(AttackLog), rows)
+            else:
+                # SQLite has no sequence to reserve from: read the ids back instead
+                rows = [{key: value for key, value in row.items() if key != "id"} for row in rows]
+                ids = conn.execute(
+                    insert(AttackLog).returning(AttackLog.id, sort_by_parameter_order=True), rows
+                ).scalars().all()
+                for event, event_id in zip(batch, ids):
+                    event["id"] = event_id
+            apply_rollup(conn, batch)
+
+    def _copy_rows(self, batch):
+        columns = ("id",) + COLUMNS
+        with self.engine.begin() as conn:
+            self._assign_ids(conn, batch)
+            buf = io.StringIO()
+            writer = csv.writer(buf, quoting=csv.QUOTE_NONNUMERIC, lineterminator="\n")
+            for event in batch:
+                writer.writerow([event[column] for column in columns])
+            buf.seek(0)
+
+            with conn.connection.cursor() as cursor:
+                cursor.copy_expert(
+                    f"COPY {AttackLog.__tablename__} ({', '.join(columns)}) "
+                    "FROM STDIN WITH (FORMAT csv, FORCE_NULL (score, attack_type_id))",
+                    buf,
+                )
+            apply_rollup(conn, batch)
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._queue)
+            spill = len(self._spill)
+        return {
+            "running": self._running,
+            "policy": self.policy,
+            "use_copy": self.use_copy,
+            "compact": self.compact,
+            "queue_depth": depth,
+            "queue_size": self.queue_size,
+            "spill_depth": spill,
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "spooled": self.spooled,
+            "db_available": self.db_available(),
+            "flushes": self.flushes,
+            "batch_size": self.batch_sizes.snapshot(),
+            "flush_latency_ms": self.flush_latency_ms.snapshot(),
+            "spool": self.spool.stats() if self.spool is not None else None,
+            "replay": self.replayer.stats() if self.replayer is not None else None,
+            "partitions": self.maintainer.stats() if self.maintainer is not None else None,
+            "recent": self.recent.stats() if self.recent is not None else None,
+        }
+
+
+def get_log_writer():
+    global _shared_writer
+
+    with _shared_lock:
+        if _shared_writer is None:
+            try:
+                ensure_rollup(AnalyticsEngine)
+            except Exception:
+                logger.exception("Не вдалося підготувати таблицю attack_log_rollups")
+            _shared_writer = AttackLogWriter(
+                spool=LogSpool() if LOG_SPOOL_ENABLED else None,
+                maintainer=get_partition_maintainer(),
+                recent=get_recent_events(),
+            )
+            _shared_writer.start()
+            atexit.register(_shared_writer.close)
+        return _shared_writer
+
+
+def log_attack(query: str, status: str, reason: str = "", score: float = 0.0, **kwargs):
+    return get_log_writer().write(make_event(query, status, reason, score, **kwargs))
@@ -0,0 +1,64 @@
+import bisect
+import threading
+
+
+def exponential_buckets(start, factor, count):
+    return [start * factor ** i for i in range(count)]
+
+
+class Histogram:
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counts = [0] * (len(self.bounds) + 1)
+            self.count = 0
+            self.total = 0.0
+            self.max = None
+
+    def observe(self, value):
+        idx = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[idx] += 1
+            self.count += 1
+            self.total += value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, q):
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q / 100 * self.count
+            seen = 0
+            for idx, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    if idx < len(self.bounds):
+                        return min(self.bounds[idx], self.max)
+                    return self.max
+            return self.max
+
+    def snapshot(self):
+        p50 = self.percentile(50)
+        p95 = self.percentile(95)
+        p99 = self.percentile(99)
+        with self._lock:
+            buckets = [
+                {"le": bound, "count": count}
+                for bound, count in zip(self.bounds, self.counts)
+            ]
+            buckets.append({"le": "+Inf", "count": self.counts[-1]})
+            return {
+                "count": self.count,
+                "sum": self.total,
+                "mean": self.total / self.count if self.count else None,
+                "max": self.max,
+                "p50": p50,
+                "p95": p95,
+                "p99": p99,
+                "buckets": buckets,
+            }
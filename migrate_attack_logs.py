@@ -0,0 +1,61 @@
+from sqlalchemy import DateTime, inspect, text
+
+from analytics_module import AnalyticsEngine, AttackLog, AttackLogRollup, Base
+
+TIMESTAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}:\d{2}"
+
+
+def _is_datetime(engine, table, column):
+    for info in inspect(engine).get_columns(table):
+        if info["name"] == column:
+            return isinstance(info["type"], DateTime)
+    raise ValueError(f"Column {table}.{column} not found")
+
+
+def migrate_timestamps(conn):
+    table = AttackLog.__tablename__
+    invalid = conn.execute(text(
+        f"SELECT count(*) FROM {table} WHERE timestamp !~ :pattern"
+    ), {"pattern": TIMESTAMP_PATTERN}).scalar()
+    if invalid:
+        print(f"⚠ {invalid} записів з некоректною датою отримають 1970-01-01 00:00:00")
+
+    conn.execute(text(
+        f"ALTER TABLE {table} ALTER COLUMN timestamp TYPE TIMESTAMP WITHOUT TIME ZONE "
+        f"USING CASE WHEN timestamp ~ '{TIMESTAMP_PATTERN}' "
+        "THEN substr(timestamp, 1, 19)::timestamp ELSE 'epoch'::timestamp END"
+    ))
+    print(f"{table}.timestamp переведено на TIMESTAMP")
+
+
+def migrate_rollup_hours(conn):
+    table = AttackLogRollup.__tablename__
+    conn.execute(text(
+        f"ALTER TABLE {table} ALTER COLUMN hour TYPE TIMESTAMP WITHOUT TIME ZONE "
+        "USING hour::timestamp"
+    ))
+    print(f"{table}.hour переведено на TIMESTAMP")
+
+
+def migrate(engine=AnalyticsEngine):
+    Base.metadata.create_all(engine)
+
+    if engine.dialect.name == "postgresql":
+        # SQLite has no column types to change: ISO strings already read as DateTime
+        with engine.begin() as conn:
+            if not _is_datetime(engine, AttackLog.__tablename__, "timestamp"):
+                migrate_timestamps(conn)
+            if not _is_datetime(engine, AttackLogRollup.__tablename__, "hour"):
+                migrate_rollup_hours(conn)
+
+    for index in AttackLog.__table__.indexes:
+        index.create(engine, checkfirst=True)
+        print(f"Індекс {index.name} готовий")
+
+    if engine.dialect.name == "postgresql":
+        with engine.begin() as conn:
+            conn.execute(text(f"ANALYZE {AttackLog.__tablename__}"))
+
+
+if __name__ == "__main__":
+    migrate()
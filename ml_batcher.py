@@ -0,0 +1,186 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+import ml_pool
+from metrics import Histogram, exponential_buckets
+from ml_checker import get_ml_checker
+
+# Only models without a compiled scorer are batched (see predict below)
+ML_BATCHING_ENABLED = True
+ML_BATCH_MAX_SIZE = 64
+ML_BATCH_MAX_WAIT = 0.002
+ML_BATCH_QUEUE_DEPTH = 1024
+ML_BATCH_RESULT_TIMEOUT = 5.0
+
+_shared_dispatcher = None
+_shared_lock = threading.Lock()
+
+
+class MLBatchDispatcher:
+    def __init__(
+            self,
+            checker,
+            max_batch_size=ML_BATCH_MAX_SIZE,
+            max_wait=ML_BATCH_MAX_WAIT,
+            queue_depth=ML_BATCH_QUEUE_DEPTH,
+            result_timeout=ML_BATCH_RESULT_TIMEOUT,
+    ):
+        self.checker = checker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue_depth = queue_depth
+        self.result_timeout = result_timeout
+
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._stopped = False
+
+        self.batch_sizes = Histogram(
+            exponential_buckets(1, 2, max(1, max_batch_size.bit_length() + 1))
+        )
+        self.queue_wait_ms = Histogram(exponential_buckets(0.05, 2, 14))
+        self.batches = 0
+        self.inline = 0
+        self.timeouts = 0
+
+    def start(self):
+        with self._lock:
+            if self._running or self._stopped:
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=1.0):
+        with self._lock:
+            self._running = False
+            self._stopped = True
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            thread.join(timeout)
+
+        while True:
+            try:
+                sql, future, _, tokens = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if future.set_running_or_notify_cancel():
+                future.set_result(self.checker.predict(sql, tokens))
+
+    def submit(self, sql: str, tokens=None) -> Future:
+        if not self._running:
+            self.start()
+
+        future = Future()
+        # Under the lock: stop() cannot drain the queue between the check and the put
+        with self._lock:
+            if self._stopped:
+                raise RuntimeError("ML batch dispatcher is stopped")
+            try:
+                self._queue.put_nowait((sql, future, time.perf_counter(), tokens))
+                return future
+            except queue.Full:
+                pass
+        # Overloaded: score on the caller's thread instead of queueing
+        self.inline += 1
+        future.set_result(self.checker.predict(sql, tokens))
+        return future
+
+    def predict(self, sql: str, tokens=None):
+        future = self.submit(sql, tokens)
+        try:
+            return future.result(self.result_timeout)
+        except FutureTimeout:
+            # Batch thread stuck or dead: score here rather than hang the request
+            future.cancel()
+            self.timeouts += 1
+            return self.checker.predict(sql, tokens)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            batch = [
+                item for item in self._collect(first)
+                if item[1].set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for _, _, enqueued, _ in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+            self.batches += 1
+
+            try:
+                verdicts = self.checker.predict_batch(
+                    [sql for sql, _, _, _ in batch],
+                    [tokens for _, _, _, tokens in batch],
+                )
+            except Exception as e:
+                for _, future, _, _ in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future, _, _), verdict in zip(batch, verdicts):
+                future.set_result(verdict)
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "inline": self.inline,
+            "timeouts": self.timeouts,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+def get_dispatcher():
+    global _shared_dispatcher
+
+    with _shared_lock:
+        if _shared_dispatcher is None:
+            _shared_dispatcher = MLBatchDispatcher(get_ml_checker())
+        return _shared_dispatcher
+
+
+def batching_active() -> bool:
+    # A compiled scorer answers in tens of microseconds; batching would only add its wait.
+    # Batches pay off for models scored through sklearn (ML_FAST_SCORER off, non-linear models).
+    return ML_BATCHING_ENABLED and get_ml_checker().scorer is None
+
+
+def predict(sql: str, tokens=None):
+    if ml_pool.ML_POOL_ENABLED:
+        # Workers lex in their own process: only the text crosses the pipe
+        return ml_pool.get_ml_pool().predict(sql)
+    if batching_active():
+        return get_dispatcher().predict(sql, tokens)
+    return get_ml_checker().predict(sql, tokens)
@@ -1,39 +1,174 @@
+import logging
 import os
 import pickle
+import threading
+import time
 
+from sklearn.base import clone
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sqlalchemy import create_engine, text
 
 from config_db import DATABASE_URI
+from linear_scorer import compile_scorer
+from model_artifact import (
+    DEFAULT_PICKLE,
+    META_FILE,
+    default_model_path,
+    is_artifact,
+    load_artifact,
+    publish_model,
+    resolve_artifact,
+    save_artifact,
+)
+from sql_lexer import lex
 
 ML_LOW_THRESHOLD = 0.5
 ML_HIGH_THRESHOLD = 0.8
+# Single queries skip sklearn and score from the compiled weights (see linear_scorer.py)
+ML_FAST_SCORER = True
+# How often scoring checks whether a retrained model was published
+ML_MODEL_CHECK_INTERVAL = 1.0
+
+logger = logging.getLogger(__name__)
+
+_shared_checker = None
+_shared_lock = threading.Lock()
 
 
 class MLChecker:
-    MODEL_FILE = "ml_model.pkl"
+    MODEL_FILE = DEFAULT_PICKLE
 
-    def __init__(self):
-        self.vectorizer = TfidfVectorizer()
-        self.model = LogisticRegression()
+    def __init__(self, model_file=None, check_interval=ML_MODEL_CHECK_INTERVAL):
+        # Without an explicit file: the ml_model artifact when published, else the pickle
+        self.model_source = model_file
+        self.MODEL_FILE = model_file or default_model_path()
         self.engine = create_engine(DATABASE_URI)
+        # (vectorizer, model, scorer), always replaced as a whole
+        self._state = (TfidfVectorizer(), LogisticRegression(), None)
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self.check_interval = check_interval
+        self._next_check = 0.0
+        self.model_signature = None
+        self.loaded = False
+        # Bumped on every swap; verdict caches compare it to drop stale entries
+        self.generation = 0
+        self.load_model()
 
-        if os.path.exists(self.MODEL_FILE):
-            with open(self.MODEL_FILE, "rb") as f:
-                self.vectorizer, self.model = pickle.load(f)
-        else:
-            self.vectorizer = TfidfVectorizer()
-            self.model = LogisticRegression()
+    @property
+    def vectorizer(self):
+        return self._state[0]
+
+    @property
+    def model(self):
+        return self._state[1]
+
+    @property
+    def scorer(self):
+        return self._state[2]
+
+    def get_model_signature(self):
+        if self.model_source is None:
+            self.MODEL_FILE = default_model_path()
+        path = self.MODEL_FILE
+        if os.path.isdir(path):
+            resolved = resolve_artifact(path)
+            if resolved is None:
+                return None
+            path = os.path.join(resolved, META_FILE)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return path, stat.st_mtime_ns, stat.st_size
+
+    def _install(self, vectorizer, model, signature):
+        # Built off to the side; readers see either the old triple or the new one
+        scorer = compile_scorer(vectorizer, model) if ML_FAST_SCORER else None
+        with self._lock:
+            self._state = (vectorizer, model, scorer)
+            self.model_signature = signature
+            self.loaded = True
+            self.generation += 1
+
+    def load_model(self):
+        signature = self.get_model_signature()
+        if signature is None:
+            if self.model_signature is not None:
+                # Removed or mid-publish: scoring with an empty model would pass everything
+                logger.warning("Модель %s недоступна, залишається попередня", self.MODEL_FILE)
+            return
+        try:
+            if is_artifact(self.MODEL_FILE):
+                vectorizer, model = load_artifact(self.MODEL_FILE)
+            else:
+                with open(self.MODEL_FILE, "rb") as f:
+                    vectorizer, model = pickle.load(f)
+        except Exception:
+            if self.model_signature is None:
+                raise
+            logger.exception("Не вдалося завантажити модель %s, залишається попередня", self.MODEL_FILE)
+            return
+        self._install(vectorizer, model, signature)
+
+    def reload_if_changed(self) -> bool:
+        if self.get_model_signature() == self.model_signature:
+            return False
+        generation = self.generation
+        self.load_model()
+        return self.generation != generation
 
-    def predict(self, sql: str):
+    def maybe_reload(self):
+        # At most once per check_interval, and never with several threads at once
+        now = time.monotonic()
+        if now < self._next_check or not self._reload_lock.acquire(blocking=False):
+            return
         try:
-            X = self.vectorizer.transform([sql])
-            prob = self.model.predict_proba(X)[0][1]
+            self._next_check = now + self.check_interval
+            self.reload_if_changed()
+        finally:
+            self._reload_lock.release()
+
+    def predict(self, sql: str, tokens=None):
+        self.maybe_reload()
+        vectorizer, model, scorer = self._state
+        if not self.loaded:
+            # No trained model yet: the ML stage has no opinion, the rules still apply
+            return False, 0.0
+        try:
+            if tokens is None:
+                tokens = lex(sql)
+            if scorer is not None:
+                prob = scorer.predict_proba(sql, tokens)
+            else:
+                X = vectorizer.transform([tokens.normalized])
+                prob = model.predict_proba(X)[0][1]
             is_suspicious = prob >= ML_LOW_THRESHOLD
             return is_suspicious, prob
         except Exception:
-            return False, 0.0
+            # Fail closed: an unscorable query is not a safe one
+            logger.exception("Помилка ML-оцінки, запит вважається підозрілим")
+            return True, 1.0
+
+    def predict_batch(self, queries, streams=None):
+        if not queries:
+            return []
+        self.maybe_reload()
+        vectorizer, model, _ = self._state
+        if not self.loaded:
+            return [(False, 0.0)] * len(queries)
+        try:
+            streams = streams or [None] * len(queries)
+            X = vectorizer.transform([
+                (stream if stream is not None else lex(sql)).normalized
+                for sql, stream in zip(queries, streams)
+            ])
+            probs = model.predict_proba(X)[:, 1]
+            return [(prob >= ML_LOW_THRESHOLD, prob) for prob in probs]
+        except Exception:
+            logger.exception("Помилка ML-оцінки пакета, запити вважаються підозрілими")
+            return [(True, 1.0)] * len(queries)
 
     def sandbox_execute(self, sql: str):
         try:
@@ -45,7 +180,23 @@ class MLChecker:
             return {"error": str(e)}
 
     def train(self, X_train, y_train):
-        X_vect = self.vectorizer.fit_transform(X_train)
-        self.model.fit(X_vect, y_train)
-        with open(self.MODEL_FILE, "wb") as f:
-            pickle.dump((self.vectorizer, self.model), f)
+        vectorizer, model, _ = self._state
+        # Fresh estimators: the served ones keep scoring while these fit
+        vectorizer = clone(vectorizer) if isinstance(vectorizer, TfidfVectorizer) else TfidfVectorizer()
+        model = clone(model) if isinstance(model, LogisticRegression) else LogisticRegression()
+        X_vect = vectorizer.fit_transform([normalize_sql(s) for s in X_train])
+        model.fit(X_vect, y_train)
+        if os.path.isdir(self.MODEL_FILE):
+            save_artifact(vectorizer, model, self.MODEL_FILE)
+        else:
+            publish_model(vectorizer, model, self.MODEL_FILE)
+        self._install(vectorizer, model, self.get_model_signature())
+
+
+def get_ml_checker():
+    global _shared_checker
+
+    with _shared_lock:
+        if _shared_checker is None:
+            _shared_checker = MLChecker()
+        return _shared_checker
@@ -0,0 +1,321 @@
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from metrics import Histogram, exponential_buckets
+from ml_checker import MLChecker, get_ml_checker
+
+# Off by default: one process is enough for small deployments
+ML_POOL_ENABLED = False
+ML_POOL_WORKERS = os.cpu_count() or 1
+ML_POOL_MAX_BATCH_SIZE = 64
+ML_POOL_MAX_WAIT = 0.002
+ML_POOL_QUEUE_DEPTH = 4096
+# Idle workers are pinged this often; the ping also picks up a retrained model
+ML_POOL_HEALTH_INTERVAL = 1.0
+ML_POOL_REQUEST_TIMEOUT = 5.0
+# A spawned worker imports sklearn and loads the model before it answers
+ML_POOL_START_TIMEOUT = 60.0
+ML_POOL_RESPAWN_DELAY = 1.0
+# Not fork: the parent already runs Flask's threads and the batch dispatcher
+ML_POOL_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+logger = logging.getLogger(__name__)
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+
+def _serve(conn, model_file):
+    try:
+        checker = MLChecker(model_file)
+    except Exception as e:
+        conn.send(("error", f"{type(e).__name__}: {e}"))
+        return
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return
+        kind = message[0]
+        if kind == "predict":
+            queries = message[1]
+            if checker.scorer is not None:
+                verdicts = [checker.predict(sql) for sql in queries]
+            else:
+                verdicts = checker.predict_batch(queries)
+            conn.send(("ok", [(bool(s), float(p)) for s, p in verdicts]))
+        elif kind == "ping":
+            checker.reload_if_changed()
+            conn.send(("pong", os.getpid()))
+        elif kind == "stop":
+            return
+
+
+class MLWorker:
+    def __init__(self, index, model_file, context):
+        self.index = index
+        self.model_file = model_file
+        self.context = context
+        self.process = None
+        self.conn = None
+        self.pid = None
+        self.starts = 0
+        self.batches = 0
+        self.queries = 0
+        self.failures = 0
+        self.last_ping_ms = None
+
+    def start(self, timeout=ML_POOL_START_TIMEOUT):
+        parent, child = self.context.Pipe()
+        self.process = self.context.Process(
+            target=_serve,
+            args=(child, self.model_file),
+            name=f"ml-worker-{self.index}",
+            daemon=True,
+        )
+        self.process.start()
+        child.close()
+        self.conn = parent
+        self.starts += 1
+
+        kind, value = self._receive(timeout)
+        if kind != "ready":
+            raise RuntimeError(f"ML worker {self.index} failed to start: {value}")
+        self.pid = value
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def _receive(self, timeout):
+        if not self.conn.poll(timeout):
+            raise TimeoutError(f"ML worker {self.index} did not answer in {timeout:.1f}s")
+        return self.conn.recv()
+
+    def call(self, message, timeout=ML_POOL_REQUEST_TIMEOUT):
+        self.conn.send(message)
+        return self._receive(timeout)
+
+    def ping(self, timeout=ML_POOL_REQUEST_TIMEOUT):
+        started = time.perf_counter()
+        kind, _ = self.call(("ping",), timeout)
+        if kind != "pong":
+            raise RuntimeError(f"ML worker {self.index} answered {kind} to a ping")
+        self.last_ping_ms = (time.perf_counter() - started) * 1000
+
+    def kill(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+        if self.process is not None:
+            if self.process.is_alive():
+                self.process.kill()
+            self.process.join(1.0)
+            self.process = None
+        self.pid = None
+
+    def stop(self, timeout=1.0):
+        if self.conn is not None and self.alive():
+            try:
+                self.conn.send(("stop",))
+                self.process.join(timeout)
+            except OSError:
+                pass
+        self.kill()
+
+    def stats(self):
+        return {
+            "pid": self.pid,
+            "alive": self.alive(),
+            "restarts": max(self.starts - 1, 0),
+            "batches": self.batches,
+            "queries": self.queries,
+            "failures": self.failures,
+            "last_ping_ms": self.last_ping_ms,
+        }
+
+
+class MLProcessPool:
+    def __init__(
+            self,
+            workers=ML_POOL_WORKERS,
+            model_file=None,
+            max_batch_size=ML_POOL_MAX_BATCH_SIZE,
+            max_wait=ML_POOL_MAX_WAIT,
+            queue_depth=ML_POOL_QUEUE_DEPTH,
+            health_interval=ML_POOL_HEALTH_INTERVAL,
+            request_timeout=ML_POOL_REQUEST_TIMEOUT,
+    ):
+        # None: each worker resolves the served model (artifact or pickle) itself
+        self.model_file = model_file
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue_depth = queue_depth
+        self.health_interval = health_interval
+        self.request_timeout = request_timeout
+
+        context = multiprocessing.get_context(ML_POOL_START_METHOD)
+        self.workers = [MLWorker(i, self.model_file, context) for i in range(workers)]
+
+        self._queue = queue.Queue(maxsize=queue_depth)
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = False
+
+        self.batch_sizes = Histogram(
+            exponential_buckets(1, 2, max(1, max_batch_size.bit_length() + 1))
+        )
+        self.queue_wait_ms = Histogram(exponential_buckets(0.05, 2, 14))
+        self.inline = 0
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            # One thread per worker owns its pipe: requests and health checks never interleave
+            self._threads = [
+                threading.Thread(target=self._run, args=(worker,), name=f"ml-pool-{worker.index}", daemon=True)
+                for worker in self.workers
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=1.0):
+        with self._lock:
+            self._running = False
+            threads = self._threads
+            self._threads = []
+        for thread in threads:
+            thread.join(timeout)
+        for worker in self.workers:
+            worker.stop()
+
+        while True:
+            try:
+                sql, future, _ = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if not future.done():
+                future.set_result(self._predict_inline(sql))
+
+    def _predict_inline(self, sql):
+        self.inline += 1
+        return get_ml_checker().predict(sql)
+
+    def submit(self, sql: str) -> Future:
+        if not self._running:
+            self.start()
+
+        future = Future()
+        try:
+            self._queue.put_nowait((sql, future, time.perf_counter()))
+        except queue.Full:
+            future.set_result(self._predict_inline(sql))
+        return future
+
+    def predict(self, sql: str):
+        future = self.submit(sql)
+        try:
+            return future.result(self.request_timeout)
+        except FutureTimeout:
+            # No healthy worker in time (all restarting): score here rather than fail the request
+            future.cancel()
+            return self._predict_inline(sql)
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _respawn(self, worker):
+        worker.kill()
+        try:
+            worker.start()
+            logger.info("ML-воркер %s запущено (pid %s)", worker.index, worker.pid)
+        except Exception as e:
+            logger.error("Не вдалося запустити ML-воркер %s: %s", worker.index, e)
+            worker.kill()
+            time.sleep(ML_POOL_RESPAWN_DELAY)
+
+    def _run(self, worker):
+        while self._running:
+            if not worker.alive():
+                self._respawn(worker)
+                continue
+
+            try:
+                first = self._queue.get(timeout=self.health_interval)
+            except queue.Empty:
+                try:
+                    worker.ping(self.request_timeout)
+                except Exception as e:
+                    logger.warning("ML-воркер %s не відповідає: %s", worker.index, e)
+                    worker.failures += 1
+                    worker.kill()
+                continue
+
+            batch = [
+                item for item in self._collect(first)
+                if item[1].set_running_or_notify_cancel()
+            ]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            for _, _, enqueued in batch:
+                self.queue_wait_ms.observe((started - enqueued) * 1000)
+            self.batch_sizes.observe(len(batch))
+
+            queries = [sql for sql, _, _ in batch]
+            try:
+                kind, verdicts = worker.call(("predict", queries), self.request_timeout)
+                if kind != "ok":
+                    raise RuntimeError(f"ML worker {worker.index} answered {kind}")
+                worker.batches += 1
+                worker.queries += len(batch)
+            except Exception as e:
+                logger.warning("ML-воркер %s впав на пакеті з %s запитів: %s", worker.index, len(batch), e)
+                worker.failures += 1
+                worker.kill()
+                self.inline += len(batch)
+                verdicts = get_ml_checker().predict_batch(queries)
+
+            for (_, future, _), verdict in zip(batch, verdicts):
+                future.set_result(verdict)
+
+    def stats(self):
+        return {
+            "running": self._running,
+            "workers": [worker.stats() for worker in self.workers],
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "queue_depth": self.queue_depth,
+            "queued": self._queue.qsize(),
+            "inline": self.inline,
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+def get_ml_pool():
+    global _shared_pool
+
+    with _shared_lock:
+        if _shared_pool is None:
+            _shared_pool = MLProcessPool()
+        return _shared_pool
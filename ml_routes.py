@@ -1,5 +1,7 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, jsonify, request
 from train_from_db import train_from_db
+import ml_batcher
+import ml_pool
 
 ml_bp = Blueprint("ml_bp", __name__)
 
@@ -26,3 +28,42 @@ def train_model_route():
                 ),
             }
         )
+
+
+@ml_bp.route("/ml/predict", methods=["POST"])
+def predict_route():
+    data = request.get_json(silent=True) or {}
+    sql = data.get("query", "")
+
+    if not isinstance(sql, str) or not sql.strip():
+        return jsonify({"success": False, "message": "Порожній SQL-запит"}), 400
+
+    is_suspicious, prob = ml_batcher.predict(sql)
+    return jsonify(
+        {
+            "success": True,
+            "suspicious": bool(is_suspicious),
+            "score": float(prob),
+        }
+    )
+
+
+@ml_bp.route("/ml/batching_stats")
+def batching_stats_route():
+    return jsonify(
+        {
+            "enabled": ml_batcher.ML_BATCHING_ENABLED,
+            "active": ml_batcher.batching_active(),
+            **ml_batcher.get_dispatcher().stats(),
+        }
+    )
+
+
+@ml_bp.route("/ml/pool_stats")
+def pool_stats_route():
+    return jsonify(
+        {
+            "enabled": ml_pool.ML_POOL_ENABLED,
+            **ml_pool.get_ml_pool().stats(),
+        }
+    )
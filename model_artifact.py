@@ -0,0 +1,364 @@
+import argparse
+import json
+import os
+import pickle
+import shutil
+import time
+import zlib
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.special import expit
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.preprocessing import normalize
+
+ARTIFACT_VERSION = 2
+# Version 1 artifacts have float64 coefficients and no coef_scale
+SUPPORTED_ARTIFACT_VERSIONS = (1, 2)
+META_FILE = "meta.json"
+# Names the live version directory; replaced atomically on publish
+CURRENT_FILE = "CURRENT"
+# Superseded versions stay for readers that resolved the pointer just before a swap
+ARTIFACT_KEEP_VERSIONS = 3
+DEFAULT_PICKLE = "ml_model.pkl"
+
+VECTORIZER_PARAMS = (
+    "analyzer",
+    "binary",
+    "lowercase",
+    "ngram_range",
+    "norm",
+    "stop_words",
+    "strip_accents",
+    "sublinear_tf",
+    "token_pattern",
+    "use_idf",
+)
+
+
+def resolve_artifact(path):
+    try:
+        with open(os.path.join(path, CURRENT_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except OSError:
+        # Flat layout from before versioned publishing
+        return path if os.path.isfile(os.path.join(path, META_FILE)) else None
+    resolved = os.path.join(path, version)
+    return resolved if os.path.isfile(os.path.join(resolved, META_FILE)) else None
+
+
+def is_artifact(path: str) -> bool:
+    return resolve_artifact(path) is not None
+
+
+def artifact_path(pkl_path):
+    # ml_model.pkl -> ml_model: the artifact published alongside a pickle
+    return os.path.splitext(pkl_path)[0]
+
+
+def default_model_path(pkl_path=DEFAULT_PICKLE):
+    artifact = artifact_path(pkl_path)
+    return artifact if is_artifact(artifact) else pkl_path
+
+
+def _version_key(name):
+    return int(name[1:].split("-", 1)[0])
+
+
+def _prune_versions(out_dir, keep=ARTIFACT_KEEP_VERSIONS):
+    versions = []
+    for name in os.listdir(out_dir):
+        path = os.path.join(out_dir, name)
+        if name.startswith("v") and os.path.isdir(path):
+            versions.append(name)
+        elif name == META_FILE or name.endswith(".npy"):
+            # Flat-layout leftovers: readers follow CURRENT now
+            os.remove(path)
+    for name in sorted(versions, key=_version_key)[:-keep]:
+        shutil.rmtree(os.path.join(out_dir, name), ignore_errors=True)
+
+
+def _term_hash(term: bytes) -> int:
+    return zlib.crc32(term)
+
+
+def _build_slots(hashes):
+    size = 1
+    while size < max(2 * len(hashes), 8):
+        size *= 2
+    mask = size - 1
+
+    slots = np.full(size, -1, dtype=np.int32)
+    for idx, h in enumerate(hashes):
+        pos = h & mask
+        while slots[pos] >= 0:
+            pos = (pos + 1) & mask
+        slots[pos] = idx
+    return slots
+
+
+def quantize_coef(coef, quantize=None):
+    # Stored weights and the scale that restores them
+    coef = np.asarray(coef, dtype=np.float64)
+    if quantize is None:
+        return coef, 1.0
+    if quantize == "float16":
+        return coef.astype(np.float16), 1.0
+    if quantize == "int8":
+        peak = float(np.abs(coef).max()) if coef.size else 0.0
+        scale = peak / 127 if peak > 0 else 1.0
+        return np.clip(np.rint(coef / scale), -127, 127).astype(np.int8), scale
+    raise ValueError(f"Unknown quantization: {quantize}")
+
+
+def save_artifact(vectorizer, model, out_dir, quantize=None):
+    params = vectorizer.get_params()
+    # A fixed vocabulary is fine (pruned models have one): terms come from the fitted vocabulary_
+    if not isinstance(params["analyzer"], str) or any(
+            params[name] is not None
+            for name in ("preprocessor", "tokenizer")
+    ):
+        raise ValueError("Only vectorizers with built-in analyzers can be exported")
+
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    if coef.shape[0] != 1:
+        raise ValueError("Only binary linear models can be exported")
+    coef, coef_scale = quantize_coef(coef[0], quantize)
+
+    n_features = len(vectorizer.vocabulary_)
+    terms = [b""] * n_features
+    for term, col in vectorizer.vocabulary_.items():
+        terms[col] = term.encode("utf-8")
+
+    offsets = np.zeros(n_features + 1, dtype=np.int64)
+    np.cumsum([len(t) for t in terms], out=offsets[1:])
+    blob = np.frombuffer(b"".join(terms), dtype=np.uint8)
+    hashes = np.array([_term_hash(t) for t in terms], dtype=np.uint32)
+
+    if vectorizer.use_idf:
+        idf = np.asarray(vectorizer.idf_, dtype=np.float64)
+    else:
+        idf = np.ones(n_features, dtype=np.float64)
+
+    stop_words = params["stop_words"]
+    meta = {
+        "version": ARTIFACT_VERSION,
+        "n_features": n_features,
+        "intercept": float(np.ravel(model.intercept_)[0]),
+        "coef_scale": coef_scale,
+        "classes": [np.asarray(c).item() for c in model.classes_],
+        "vectorizer": {
+            **{name: params[name] for name in VECTORIZER_PARAMS},
+            "ngram_range": list(params["ngram_range"]),
+            "stop_words": (
+                sorted(stop_words)
+                if stop_words is not None and not isinstance(stop_words, str)
+                else stop_words
+            ),
+        },
+    }
+
+    os.makedirs(out_dir, exist_ok=True)
+    version = f"v{time.time_ns()}-{os.getpid()}"
+    tmp_dir = os.path.join(out_dir, f".tmp-{version}")
+    os.makedirs(tmp_dir)
+
+    np.save(os.path.join(tmp_dir, "vocab_blob.npy"), blob)
+    np.save(os.path.join(tmp_dir, "vocab_offsets.npy"), offsets)
+    np.save(os.path.join(tmp_dir, "vocab_hashes.npy"), hashes)
+    np.save(os.path.join(tmp_dir, "vocab_slots.npy"), _build_slots(hashes))
+    np.save(os.path.join(tmp_dir, "idf.npy"), idf)
+    np.save(os.path.join(tmp_dir, "coef.npy"), coef)
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    os.replace(tmp_dir, os.path.join(out_dir, version))
+
+    # One rename flips readers over; the artifact never disappears in between
+    pointer_tmp = os.path.join(out_dir, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+    with open(pointer_tmp, "w", encoding="utf-8") as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(pointer_tmp, os.path.join(out_dir, CURRENT_FILE))
+    _prune_versions(out_dir)
+    return out_dir
+
+
+def retire_artifact(path):
+    for name in (CURRENT_FILE, META_FILE):
+        try:
+            os.remove(os.path.join(path, name))
+        except FileNotFoundError:
+            pass
+
+
+def artifact_target(model_out=DEFAULT_PICKLE, artifact_out=None):
+    # Where publish_model writes an artifact: the one asked for, else the served one next to the pickle
+    if artifact_out:
+        return artifact_out
+    sibling = artifact_path(model_out)
+    return sibling if is_artifact(sibling) else None
+
+
+def publish_model(vectorizer, model, model_out=DEFAULT_PICKLE, artifact_out=None, quantize=None):
+    # Serving prefers the artifact next to the pickle; keep it in step. It is written
+    # first: if it cannot be, neither file changes and the old model stays served
+    target = artifact_target(model_out, artifact_out)
+    if target and artifact_out is None and not hasattr(vectorizer, "vocabulary_"):
+        target = None
+    if target:
+        save_artifact(vectorizer, model, target, quantize=quantize)
+
+    tmp_path = f"{model_out}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((vectorizer, model), f)
+    os.replace(tmp_path, model_out)
+
+    sibling = artifact_path(model_out)
+    if target is None and is_artifact(sibling):
+        # Hashing models have no artifact form: retire it so the pickle is served
+        retire_artifact(sibling)
+    return target
+
+
+class MappedVocabulary:
+    def __init__(self, path, mmap_mode="r"):
+        self.blob = np.load(os.path.join(path, "vocab_blob.npy"), mmap_mode=mmap_mode)
+        self.offsets = np.load(os.path.join(path, "vocab_offsets.npy"), mmap_mode=mmap_mode)
+        self.hashes = np.load(os.path.join(path, "vocab_hashes.npy"), mmap_mode=mmap_mode)
+        self.slots = np.load(os.path.join(path, "vocab_slots.npy"), mmap_mode=mmap_mode)
+        self.mask = len(self.slots) - 1
+
+    def __len__(self):
+        return len(self.hashes)
+
+    def term(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+    def lookup(self, term: str) -> int:
+        encoded = term.encode("utf-8")
+        h = _term_hash(encoded)
+        pos = h & self.mask
+        while True:
+            idx = int(self.slots[pos])
+            if idx < 0:
+                return -1
+            if self.hashes[idx] == h:
+                start, end = self.offsets[idx], self.offsets[idx + 1]
+                if self.blob[start:end].tobytes() == encoded:
+                    return idx
+            pos = (pos + 1) & self.mask
+
+
+class MappedVectorizer:
+    def __init__(self, path, meta, mmap_mode="r"):
+        params = meta["vectorizer"]
+        self.vocabulary = MappedVocabulary(path, mmap_mode=mmap_mode)
+        self.idf = np.load(os.path.join(path, "idf.npy"), mmap_mode=mmap_mode)
+        self.n_features = meta["n_features"]
+        self.binary = params["binary"]
+        self.sublinear_tf = params["sublinear_tf"]
+        self.use_idf = params["use_idf"]
+        self.norm = params["norm"]
+        self.analyzer = TfidfVectorizer(
+            analyzer=params["analyzer"],
+            lowercase=params["lowercase"],
+            ngram_range=tuple(params["ngram_range"]),
+            stop_words=params["stop_words"],
+            strip_accents=params["strip_accents"],
+            token_pattern=params["token_pattern"],
+        ).build_analyzer()
+
+    def term_counts(self, doc):
+        lookup = self.vocabulary.lookup
+        counts = {}
+        for term in self.analyzer(doc):
+            col = lookup(term)
+            if col >= 0:
+                counts[col] = counts.get(col, 0) + 1
+        return counts
+
+    def transform(self, raw_documents):
+        indptr = [0]
+        indices = []
+        data = []
+        for doc in raw_documents:
+            counts = self.term_counts(doc)
+            for col in sorted(counts):
+                indices.append(col)
+                data.append(counts[col])
+            indptr.append(len(indices))
+
+        X = csr_matrix(
+            (np.asarray(data, dtype=np.float64), indices, indptr),
+            shape=(len(indptr) - 1, self.n_features),
+        )
+        if self.binary:
+            X.data[:] = 1.0
+        if self.sublinear_tf:
+            np.log(X.data, X.data)
+            X.data += 1.0
+        if self.use_idf:
+            X.data *= self.idf[X.indices]
+        if self.norm is not None:
+            X = normalize(X, norm=self.norm, copy=False)
+        return X
+
+
+class MappedLinearModel:
+    def __init__(self, path, meta, mmap_mode="r"):
+        self.coef = np.load(os.path.join(path, "coef.npy"), mmap_mode=mmap_mode)
+        self.intercept = meta["intercept"]
+        # float16/int8 weights from model_compaction.py; coef * coef_scale restores them
+        self.coef_scale = meta.get("coef_scale", 1.0)
+        self.classes_ = np.asarray(meta["classes"])
+
+    def decision_function(self, X):
+        return np.asarray(X @ self.coef).ravel() * self.coef_scale + self.intercept
+
+    def predict_proba(self, X):
+        prob = expit(self.decision_function(X))
+        return np.vstack([1 - prob, prob]).T
+
+    def predict(self, X):
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+
+def load_artifact(path, mmap_mode="r"):
+    resolved = resolve_artifact(path)
+    if resolved is None:
+        raise FileNotFoundError(f"No model artifact in {path}")
+    path = resolved
+    with open(os.path.join(path, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") not in SUPPORTED_ARTIFACT_VERSIONS:
+        raise ValueError(f"Unsupported model artifact version: {meta.get('version')}")
+
+    return (
+        MappedVectorizer(path, meta, mmap_mode=mmap_mode),
+        MappedLinearModel(path, meta, mmap_mode=mmap_mode),
+    )
+
+
+def convert_pickle(pkl_path, out_dir):
+    with open(pkl_path, "rb") as f:
+        vectorizer, model = pickle.load(f)
+    return save_artifact(vectorizer, model, out_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--pkl",
+        default=DEFAULT_PICKLE,
+        help="Pickled (vectorizer, model) tuple to convert",
+    )
+    parser.add_argument(
+        "--out",
+        default="ml_model",
+        help="Output directory for the memory-mapped artifact",
+    )
+    args = parser.parse_args()
+    print(f"Model artifact saved to {convert_pickle(args.pkl, args.out)}")
@@ -0,0 +1,201 @@
+import argparse
+import copy
+import pickle
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.metrics import roc_auc_score
+
+from model_artifact import artifact_target, publish_model, quantize_coef, save_artifact
+from linear_scorer import compile_scorer
+from sql_lexer import lex, normalize_sql
+
+COMPACTION_ENABLED = True
+# Features whose |coefficient| is below this barely move the score
+COMPACTION_MIN_ABS_COEF = 0.01
+# None, "float16" or "int8"; only the memory-mapped artifact stores quantized weights
+COMPACTION_QUANTIZE = None
+# Compacted model is not published if it loses more ROC AUC than this
+COMPACTION_MAX_AUC_DROP = 0.001
+COMPACTION_QUANTIZE_TYPES = (None, "float16", "int8")
+
+
+class CompactionRejected(Exception):
+    def __init__(self, report):
+        super().__init__(
+            f"ROC AUC drop {report['auc_drop']:.5f} exceeds tolerance {report['max_auc_drop']:.5f}"
+        )
+        self.report = report
+
+
+def prune_model(vectorizer, model, min_abs_coef=COMPACTION_MIN_ABS_COEF):
+    if not isinstance(vectorizer, TfidfVectorizer):
+        raise ValueError("Only TfidfVectorizer models can be pruned")
+    coef = np.asarray(model.coef_, dtype=np.float64)
+    if coef.shape[0] != 1:
+        raise ValueError("Only binary linear models can be pruned")
+
+    keep = np.flatnonzero(np.abs(coef[0]) >= min_abs_coef)
+    if not len(keep):
+        raise ValueError(f"No feature has |coef| >= {min_abs_coef}")
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, col in vectorizer.vocabulary_.items():
+        terms[col] = term
+    kept_terms = [terms[col] for col in keep]
+
+    # A fresh vectorizer over the kept terms: stop_words_ (every term min_df/max_df cut) is not carried over
+    pruned = TfidfVectorizer(**{**vectorizer.get_params(), "vocabulary": kept_terms})
+    if vectorizer.use_idf:
+        pruned.idf_ = np.asarray(vectorizer.idf_)[keep]
+    else:
+        # Nothing learned from the documents with a fixed vocabulary and no idf
+        pruned.fit(kept_terms)
+
+    compact = copy.deepcopy(model)
+    compact.coef_ = coef[:, keep]
+    compact.n_features_in_ = len(keep)
+    return pruned, compact
+
+
+def serving_bytes(vectorizer, model):
+    return len(pickle.dumps((vectorizer, model), protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _time_per_query(vectorizer, model, queries, repeat=5):
+    # Through the serving path: the compiled scorer when the model has one
+    scorer = compile_scorer(vectorizer, model)
+    if scorer is not None:
+        predict = scorer.predict_proba
+    else:
+        def predict(sql):
+            return model.predict_proba(vectorizer.transform([normalize_sql(sql)]))
+    for sql in queries:
+        lex(sql)
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for sql in queries:
+            predict(sql)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best / max(len(queries), 1)
+
+
+def compact_model(
+        vectorizer,
+        model,
+        X_eval,
+        y_eval,
+        sample_weight=None,
+        min_abs_coef=COMPACTION_MIN_ABS_COEF,
+        quantize=COMPACTION_QUANTIZE,
+        max_auc_drop=COMPACTION_MAX_AUC_DROP,
+        timing_queries=500,
+):
+    if quantize not in COMPACTION_QUANTIZE_TYPES:
+        raise ValueError(f"Unknown quantization: {quantize}")
+    # X_eval is already normalized, as the vectorizer saw it during training
+    pruned_vect, pruned_model = prune_model(vectorizer, model, min_abs_coef)
+
+    # Score with the weights serving will actually see after quantization
+    scored_model = pruned_model
+    if quantize is not None:
+        stored, scale = quantize_coef(pruned_model.coef_[0], quantize)
+        scored_model = copy.deepcopy(pruned_model)
+        scored_model.coef_ = (stored.astype(np.float64) * scale)[np.newaxis, :]
+
+    full_prob = model.predict_proba(vectorizer.transform(X_eval))[:, 1]
+    compact_prob = scored_model.predict_proba(pruned_vect.transform(X_eval))[:, 1]
+    full_auc = float(roc_auc_score(y_eval, full_prob, sample_weight=sample_weight))
+    compact_auc = float(roc_auc_score(y_eval, compact_prob, sample_weight=sample_weight))
+
+    sample = list(X_eval[:timing_queries])
+    full_us = _time_per_query(vectorizer, model, sample) * 1e6
+    compact_us = _time_per_query(pruned_vect, scored_model, sample) * 1e6
+
+    coef_bytes = pruned_model.coef_.shape[1] * (np.dtype(np.float64).itemsize if quantize is None
+                                                else np.dtype(quantize).itemsize)
+    report = {
+        "features": len(vectorizer.vocabulary_),
+        "features_kept": len(pruned_vect.vocabulary_),
+        "min_abs_coef": min_abs_coef,
+        "quantize": quantize,
+        "bytes": serving_bytes(vectorizer, model),
+        "bytes_compact": serving_bytes(pruned_vect, pruned_model),
+        "coef_bytes": model.coef_.shape[1] * np.dtype(np.float64).itemsize,
+        "coef_bytes_compact": coef_bytes,
+        "latency_us": full_us,
+        "latency_us_compact": compact_us,
+        "roc_auc": full_auc,
+        "roc_auc_compact": compact_auc,
+        "auc_drop": full_auc - compact_auc,
+        "max_auc_drop": max_auc_drop,
+    }
+    report["accepted"] = report["auc_drop"] <= max_auc_drop
+    return pruned_vect, pruned_model, report
+
+
+def format_report(report) -> str:
+    return (
+        f"Features: {report['features']} -> {report['features_kept']} "
+        f"(|coef| >= {report['min_abs_coef']}, weights: {report['quantize'] or 'float64'})\n"
+        f"Pickled model: {report['bytes'] / 1024:.1f} KiB -> {report['bytes_compact'] / 1024:.1f} KiB, "
+        f"coefficients: {report['coef_bytes'] / 1024:.1f} KiB -> {report['coef_bytes_compact'] / 1024:.1f} KiB\n"
+        f"Latency: {report['latency_us']:.1f} us -> {report['latency_us_compact']:.1f} us per query\n"
+        f"ROC AUC: {report['roc_auc']:.5f} -> {report['roc_auc_compact']:.5f} "
+        f"(drop {report['auc_drop']:.5f}, tolerance {report['max_auc_drop']:.5f})"
+    )
+
+
+def publish(vectorizer, model, report, model_out=None, artifact_out=None):
+    if not report["accepted"]:
+        raise CompactionRejected(report)
+    target = artifact_target(model_out, artifact_out) if model_out else artifact_out
+    if report["quantize"] and not target:
+        raise ValueError("Quantized weights are only published in an artifact; pickles keep float64")
+    if model_out:
+        publish_model(vectorizer, model, model_out, artifact_out, quantize=report["quantize"])
+    elif artifact_out:
+        save_artifact(vectorizer, model, artifact_out, quantize=report["quantize"])
+
+
+if __name__ == "__main__":
+    import pandas as pd
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="ml_model.pkl", help="Pickled (vectorizer, model) to compact")
+    parser.add_argument("--csv", required=True, help="Evaluation CSV with columns 'sql' and 'label'")
+    parser.add_argument("--out", default=None, help="Where to write the compacted pickle")
+    parser.add_argument("--artifact", default=None, help="Where to write the compacted memory-mapped artifact")
+    parser.add_argument("--min-abs-coef", type=float, default=COMPACTION_MIN_ABS_COEF)
+    parser.add_argument("--quantize", choices=("float16", "int8"), default=COMPACTION_QUANTIZE)
+    parser.add_argument("--max-auc-drop", type=float, default=COMPACTION_MAX_AUC_DROP)
+    args = parser.parse_args()
+
+    if args.quantize and not args.artifact:
+        parser.error("--quantize needs --artifact: pickled sklearn models keep float64 weights")
+
+    with open(args.model, "rb") as f:
+        vectorizer, model = pickle.load(f)
+    df = pd.read_csv(args.csv).dropna(subset=["sql", "label"])
+    X_eval = df["sql"].astype(str).map(normalize_sql).tolist()
+    y_eval = df["label"].astype(int).to_numpy()
+
+    vectorizer, model, report = compact_model(
+        vectorizer,
+        model,
+        X_eval,
+        y_eval,
+        min_abs_coef=args.min_abs_coef,
+        quantize=args.quantize,
+        max_auc_drop=args.max_auc_drop,
+    )
+    print(format_report(report))
+    try:
+        publish(vectorizer, model, report, model_out=args.out, artifact_out=args.artifact)
+    except CompactionRejected as e:
+        raise SystemExit(f"Compacted model not published: {e}")
+    for path in (args.out, args.artifact):
+        if path:
+            print(f"Compacted model saved to {path}")
@@ -1,108 +1,155 @@
-import json
-import random
 import threading
-import time
-import requests
-from flask import Blueprint, Response, jsonify
-from analytics_module import AnalyticsSession, AttackLog
+from flask import Blueprint, Response, jsonify, request
 from datetime import datetime
-from train_from_db import train_from_db
+from load_generator import (
+    LOADGEN_CONCURRENCY,
+    LOADGEN_MAX_CONCURRENCY,
+    LOADGEN_MIX,
+    LOADGEN_PROFILES,
+    LOADGEN_RATE,
+    LOADGEN_TARGET,
+    LoadGenerator,
+    get_load_stats,
+)
+from shared_counters import get_traffic_counters
+from sse_broker import SSEBroker
+from train_from_db import train_model
 
 realtime_bp = Blueprint("realtime", __name__)
 
-allowed_count = 0
-blocked_count = 0
-_sim_running = False
-_sim_thread = None
+_sim_generator = None
+_sim_lock = threading.Lock()
+_dos_broker = None
+_dos_broker_lock = threading.Lock()
 
-from queries_generator import generate_safe_queries, generate_malicious_queries
 
-SAFE_QUERIES = generate_safe_queries(500)
-MALICIOUS_QUERIES = generate_malicious_queries(500)
+def dos_snapshot():
+    counters = get_traffic_counters().snapshot()
+    return {
+        "timestamp": datetime.now().strftime("%H:%M:%S"),
+        "allowed": counters["allowed"],
+        "blocked": counters["blocked"],
+        "reasons": {
+            name.split(":", 1)[1]: value
+            for name, value in counters.items() if name.startswith("reason:")
+        },
+        "load": get_load_stats().snapshot(),
+    }
 
-BASE_URL = "http://127.0.0.1:5000"
 
+def get_dos_broker():
+    global _dos_broker
 
-def log_attack_to_db(query: str, status: str, reason: str = "", score: float = 0.0):
-    with AnalyticsSession() as session:
-        log = AttackLog(
-            timestamp=datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            reason=reason or ("malicious" if status == "blocked" else "safe"),
-            query=query,
-            score=score,
-            status=status,
-        )
-        session.add(log)
-        session.commit()
-
-
-def _simulate_worker():
-    global allowed_count, blocked_count, _sim_running
-
-    while _sim_running:
-        sql = random.choice(SAFE_QUERIES + MALICIOUS_QUERIES)
-        try:
-            r = requests.post(
-                f"{BASE_URL}/check_query",
-                json={"query": sql},
-                timeout=2,
-            )
-            result = r.json().get("result", "")
-
-            if result.startswith("✅"):
-                allowed_count += 1
-                log_attack_to_db(sql, "allowed", reason="safe")
-            else:
-                blocked_count += 1
-                log_attack_to_db(sql, "blocked", reason="error_from_db")
-
-        except Exception as e:
-            blocked_count += 1
-            log_attack_to_db(sql, "blocked", reason=str(e))
-
-        time.sleep(0.7)
+    with _dos_broker_lock:
+        if _dos_broker is None:
+            _dos_broker = SSEBroker(dos_snapshot)
+            _dos_broker.start()
+        return _dos_broker
 
 
 @realtime_bp.route("/dos_stream")
 def dos_stream():
-    def event_stream():
-        while True:
-            data = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "allowed": allowed_count,
-                "blocked": blocked_count,
-            }
-            yield f"data: {json.dumps(data)}\n\n"
-            time.sleep(1)
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
 
-    return Response(event_stream(), mimetype="text/event-stream")
+    def event_stream():
+        # One ticker serves every dashboard; each connection only drains its queue
+        subscription = get_dos_broker().subscribe(last_event_id)
+        try:
+            yield from subscription
+        finally:
+            subscription.close()
+
+    return Response(
+        event_stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@realtime_bp.route("/dos_stream/stats")
+def dos_stream_stats():
+    return jsonify({**get_dos_broker().stats(), "counters": get_traffic_counters().stats()})
+
+
+def _simulation_params(data):
+    count = data.get("count")
+    duration = data.get("duration")
+    params = {
+        "target": str(data.get("target") or LOADGEN_TARGET),
+        "rate": float(data.get("rate") or LOADGEN_RATE),
+        "count": int(count) if count else None,
+        "duration": float(duration) if duration else None,
+        "concurrency": int(data.get("concurrency") or LOADGEN_CONCURRENCY),
+        "mix": float(LOADGEN_MIX if data.get("mix") is None else data["mix"]),
+        "profile": data.get("profile") or "constant",
+        "ramp": float(data.get("ramp") or 0),
+    }
+    if params["rate"] <= 0:
+        raise ValueError("rate має бути більше 0")
+    if not 1 <= params["concurrency"] <= LOADGEN_MAX_CONCURRENCY:
+        raise ValueError(f"concurrency має бути від 1 до {LOADGEN_MAX_CONCURRENCY}")
+    if not 0 <= params["mix"] <= 1:
+        raise ValueError("mix має бути від 0 до 1")
+    if params["profile"] not in LOADGEN_PROFILES:
+        raise ValueError(f"profile має бути одним із: {', '.join(LOADGEN_PROFILES)}")
+    if params["ramp"] < 0:
+        raise ValueError("ramp не може бути від'ємним")
+    return params
 
 
 @realtime_bp.route("/simulate/start", methods=["POST"])
 def start_simulation():
-    global allowed_count, blocked_count, _sim_running, _sim_thread
+    global _sim_generator
 
-    if _sim_running:
-        return jsonify({"status": "already_running"}), 409
+    data = request.get_json(silent=True) or {}
+    try:
+        params = _simulation_params(data)
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
 
-    allowed_count = 0
-    blocked_count = 0
-    _sim_running = True
+    stats = get_load_stats()
+    with _sim_lock:
+        if stats.running():
+            if not data.get("force"):
+                return jsonify({"status": "already_running"}), 409
+            # The running generator may live in another worker: it polls the stop counter
+            stats.request_stop()
+            if _sim_generator is not None:
+                _sim_generator.stop(timeout=5)
 
-    _sim_thread = threading.Thread(target=_simulate_worker, daemon=True)
-    _sim_thread.start()
+        get_traffic_counters().reset()
+        _sim_generator = LoadGenerator(stats=stats, **params)
+        _sim_generator.start()
 
-    return jsonify({"status": "started"})
+    return jsonify({"status": "started", "params": params})
 
 
 @realtime_bp.route("/simulate/stop", methods=["POST"])
 def stop_simulation():
-    global _sim_running
-    _sim_running = False
-    return jsonify({"status": "stopped"})
+    stats = get_load_stats()
+    stats.request_stop()
+    with _sim_lock:
+        if _sim_generator is not None:
+            _sim_generator.stop(timeout=5)
+
+    latency = stats.latency.snapshot()
+    if latency["count"]:
+        result = (
+            f"зупинено: {latency['counters']['completed']} запитів, "
+            f"p50 {latency['p50']:.1f} мс, p95 {latency['p95']:.1f} мс, "
+            f"p99 {latency['p99']:.1f} мс, max {latency['max']:.1f} мс"
+        )
+    else:
+        result = "зупинено"
+    return jsonify({"status": "stopped", "result": result, "latency_ms": latency})
 
 
 @realtime_bp.route("/train_model", methods=["POST"])
 def train_model_route():
-    result = train_from_db()
+    data = request.get_json(silent=True) or {}
+    try:
+        result = train_model(data.get("mode", "full"))
+    except Exception as e:
+        # The served model is left as it was: publish writes nothing unless it can write both files
+        return jsonify({"success": False, "message": f"Помилка навчання: {e}"}), 500
     return jsonify(result)
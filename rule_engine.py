@@ -0,0 +1,136 @@
+from sqlparse import tokens as T
+
+from sql_lexer import lex
+
+# sqlparse grouping is recursive and fails on deep nesting; leave such input to it
+MAX_PARENTHESES = 100
+
+_CLEAN_TABLE = str.maketrans("", "", ";(),")
+_CHECKED_TTYPES = (T.Keyword, T.Comment)
+
+
+def clean_token(value: str) -> str:
+    return value.translate(_CLEAN_TABLE).strip().upper()
+
+
+class CompiledRuleEngine:
+    def __init__(self, blocked_commands, blocked_tokens, fallback):
+        self.blocked_commands = blocked_commands
+        self.blocked_tokens = blocked_tokens
+        self.fallback = fallback
+
+    def tokenize(self, sql: str):
+        return iter(lex(sql))
+
+    def first_statement(self, sql: str, tokens=None):
+        # Mirrors sqlparse.engine.statement_splitter.StatementSplitter, but
+        # stops at the end of the first statement instead of building them all
+        if tokens is None:
+            tokens = lex(sql)
+        stmt = []
+        level = 0
+        is_create = False
+        in_case = False
+        begin_depth = 0
+        consume_ws = False
+
+        for ttype, value in tokens:
+            if consume_ws and ttype is not T.Whitespace \
+                    and ttype is not T.Comment.Single:
+                return stmt
+
+            if ttype is T.Punctuation and value == "(":
+                level += 1
+            elif ttype is T.Punctuation and value == ")":
+                level -= 1
+            elif ttype in T.Keyword:
+                unified = value.upper()
+                if ttype is T.Keyword.DDL and unified.startswith("CREATE"):
+                    is_create = True
+                elif unified == "DECLARE" and is_create and begin_depth == 0:
+                    level += 1
+                elif unified == "BEGIN":
+                    begin_depth += 1
+                    if is_create:
+                        level += 1
+                elif unified == "END":
+                    if not in_case:
+                        begin_depth = max(0, begin_depth - 1)
+                    else:
+                        in_case = False
+                    level -= 1
+                elif unified in ("IF", "FOR", "WHILE", "CASE") \
+                        and is_create and begin_depth > 0:
+                    if unified == "CASE":
+                        in_case = True
+                    level += 1
+                elif unified in ("END IF", "END FOR", "END WHILE"):
+                    level -= 1
+
+            stmt.append((ttype, value))
+
+            if (level <= 0 and ttype is T.Punctuation and value == ";") \
+                    or (ttype is T.Keyword and value.split()[0] == "GO"):
+                consume_ws = True
+
+        if stmt and not all(ttype in T.Whitespace for ttype, _ in stmt):
+            return stmt
+        return None
+
+    def _first_command(self, stmt, idx):
+        # Returns the cleaned first token when it is provably not merged into
+        # a larger group by sqlparse, otherwise None
+        ttype, value = stmt[idx]
+        first_value = clean_token(value)
+        if not first_value:
+            return None
+
+        if idx + 1 < len(stmt):
+            next_type, next_value = stmt[idx + 1]
+            if next_type not in T.Whitespace \
+                    and not (next_type is T.Punctuation and next_value == ";"):
+                return None
+
+        if first_value not in self.blocked_commands:
+            return first_value
+
+        if ttype not in T.Keyword:
+            return None
+
+        for next_type, next_value in stmt[idx + 1:]:
+            if next_type in T.Whitespace or next_type in T.Comment:
+                continue
+            if next_type in T.Keyword or next_type is T.Name \
+                    or (next_type is T.Punctuation and next_value == ";"):
+                return first_value
+            return None
+
+        return first_value
+
+    def check_query(self, sql: str, tokens=None):
+        if not isinstance(sql, str) or sql.count("(") > MAX_PARENTHESES:
+            return self.fallback(sql)
+
+        stmt = self.first_statement(sql, tokens)
+        if stmt is None:
+            return False, "Empty or invalid SQL"
+
+        for idx, (ttype, _) in enumerate(stmt):
+            if ttype not in T.Whitespace and ttype not in T.Comment:
+                break
+        else:
+            return False, "No first token"
+
+        first_value = self._first_command(stmt, idx)
+        if first_value is None:
+            return self.fallback(sql)
+        if first_value in self.blocked_commands:
+            return False, f"Blocked command: {first_value}"
+
+        for ttype, value in stmt:
+            if ttype in _CHECKED_TTYPES:
+                value = clean_token(value)
+                if value in self.blocked_tokens:
+                    return False, f"Blocked token: {value}"
+
+        return True, "Safe"
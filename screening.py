@@ -0,0 +1,306 @@
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+
+import ml_batcher
+from log_rollup import classify_reason
+from log_writer import log_attack
+from metrics import Histogram, exponential_buckets
+from ml_checker import ML_HIGH_THRESHOLD, ML_LOW_THRESHOLD, get_ml_checker
+from shared_counters import get_traffic_counters
+from sql_lexer import lex
+from sql_parser import SQLRuleParser
+from verdict_cache import MODEL_CHECK_INTERVAL, VerdictCache, fingerprint, fingerprint_preserves_rules
+
+# Cheapest first (mean per query: fingerprint ~45 us including the lex the later
+# stages reuse, rule ~20 us on that stream, ml ~20 us with the compiled scorer,
+# execution a database round trip); each stage only sees what the previous ones
+# let through
+SCREENING_STAGES = ("fingerprint", "rule", "ml", "execution")
+SCREENING_ENABLED = {"fingerprint": True, "rule": True, "ml": True, "execution": True}
+SCREENING_LOG_OUTCOMES = True
+# Per dialect: statement making the rest of the connection's work read-only, and the
+# one undoing it before the connection goes back to the pool (None: ends with the transaction)
+READ_ONLY_GUARDS = {
+    "postgresql": ("SET TRANSACTION READ ONLY", None),
+    "mysql": ("SET TRANSACTION READ ONLY", None),
+    "mariadb": ("SET TRANSACTION READ ONLY", None),
+    "sqlite": ("PRAGMA query_only = ON", "PRAGMA query_only = OFF"),
+}
+
+_shared_pipeline = None
+_shared_lock = threading.Lock()
+
+
+class Verdict:
+    def __init__(self, status, reason, stage, score=None, rows=None, message=None):
+        self.status = status
+        self.reason = reason
+        self.stage = stage
+        self.score = score
+        self.rows = rows
+        self.message = message
+
+    @property
+    def blocked(self) -> bool:
+        return self.status == "blocked"
+
+    def to_dict(self):
+        return {"status": self.status, "stage": self.stage, "reason": self.reason, "score": self.score}
+
+
+class Screening:
+    def __init__(self, sql, engine=None):
+        self.sql = sql
+        self.engine = engine
+        self.fingerprint = None
+        self.score = None
+        # Between the ML thresholds: runs, but in a read-only transaction
+        self.review = False
+        self._tokens = None
+
+    @property
+    def tokens(self):
+        # Lexed once, then shared by the fingerprint, the rules and the ML featurizer
+        if self._tokens is None:
+            self._tokens = lex(self.sql)
+        return self._tokens
+
+
+def ml_reason(score) -> str:
+    return f"AI: score {score:.2f}"
+
+
+class RuleStage:
+    name = "rule"
+
+    def __init__(self, parser=None):
+        self.parser = parser or SQLRuleParser()
+
+    def check(self, screening):
+        is_safe, reason = self.parser.check_query(screening.sql, screening.tokens)
+        if not is_safe:
+            return Verdict("blocked", reason, self.name)
+        return None
+
+
+class FingerprintStage:
+    name = "fingerprint"
+
+    def __init__(
+            self,
+            checker=None,
+            rule_parser=None,
+            cache=None,
+            low=ML_LOW_THRESHOLD,
+            check_interval=MODEL_CHECK_INTERVAL,
+    ):
+        self.checker = checker or get_ml_checker()
+        self.rule_parser = rule_parser
+        # Fingerprint -> screening verdict; a new model or rule set makes them stale
+        self.cache = cache if cache is not None else VerdictCache()
+        self.low = low
+        self.check_interval = check_interval
+        self.rules_signature = self._current_rules()
+        self.model_generation = self.checker.generation
+        self.bypassed = 0
+        self._next_check = 0.0
+
+    def _current_rules(self):
+        if self.rule_parser is None:
+            return None
+        return self.rule_parser.rules_version
+
+    def _check_sources(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + self.check_interval
+        rules = self._current_rules()
+        # Cache hits never reach the ML stage, so the model check has to happen here too
+        self.checker.maybe_reload()
+        generation = self.checker.generation
+        if generation != self.model_generation or rules != self.rules_signature:
+            self.model_generation = generation
+            self.rules_signature = rules
+            self.cache.clear()
+
+    def check(self, screening):
+        if not fingerprint_preserves_rules(screening.sql):
+            # The rule verdict may differ between queries sharing this fingerprint
+            self.bypassed += 1
+            return None
+
+        self._check_sources()
+        screening.fingerprint = fingerprint(screening.sql, screening.tokens)
+        known = self.cache.get(screening.fingerprint)
+        if known is None:
+            return None
+        status, reason, score = known
+        screening.score = score
+        screening.review = score is not None and score >= self.low
+        return Verdict(status, reason, self.name, score=score)
+
+    def remember(self, screening, verdict):
+        if screening.fingerprint is None:
+            return
+        if verdict is None:
+            self.cache.put(screening.fingerprint, ("allowed", "safe", screening.score))
+        else:
+            self.cache.put(screening.fingerprint, (verdict.status, verdict.reason, verdict.score))
+
+
+class MLStage:
+    name = "ml"
+
+    def __init__(self, low=ML_LOW_THRESHOLD, high=ML_HIGH_THRESHOLD, predict=None):
+        self.low = low
+        self.high = high
+        self.predict = predict or ml_batcher.predict
+
+    def check(self, screening):
+        _, score = self.predict(screening.sql, screening.tokens)
+        score = screening.score = float(score)
+        if score >= self.high:
+            return Verdict("blocked", ml_reason(score), self.name, score=score)
+        # Between the thresholds: allowed, but executed read-only
+        screening.review = score >= self.low
+        return Verdict("allowed", "safe", self.name, score=score)
+
+
+class ExecutionStage:
+    name = "execution"
+
+    def check(self, screening):
+        dialect = screening.engine.dialect.name
+        guard, unguard = READ_ONLY_GUARDS.get(dialect, (None, None))
+        if screening.review and guard is None:
+            # Would run with write access: refuse instead
+            return Verdict(
+                "blocked",
+                f"{ml_reason(screening.score)} (read-only unavailable)",
+                self.name,
+                score=screening.score,
+                message=f"Запит потребує виконання лише для читання, що не підтримується для {dialect}",
+            )
+        try:
+            with screening.engine.connect() as conn:
+                if screening.review:
+                    conn.execute(text(guard))
+                try:
+                    result = conn.execute(text(screening.sql))
+                    if result.returns_rows:
+                        rows = [dict(r._mapping) for r in result]
+                        message = "Запит виконано успішно"
+                    else:
+                        rows = None
+                        message = "Запит виконано (без результату)"
+                finally:
+                    if screening.review and unguard is not None:
+                        conn.execute(text(unguard))
+        except SQLAlchemyError as e:
+            return Verdict(
+                "blocked",
+                "error_from_db",
+                self.name,
+                score=screening.score,
+                message=f"SQL помилка: {e.__cause__ or e}",
+            )
+        return Verdict("allowed", "safe", self.name, score=screening.score, rows=rows, message=message)
+
+
+class ScreeningPipeline:
+    def __init__(
+            self,
+            enabled=None,
+            low=ML_LOW_THRESHOLD,
+            high=ML_HIGH_THRESHOLD,
+            rule_parser=None,
+            checker=None,
+            predict=None,
+            log_outcomes=SCREENING_LOG_OUTCOMES,
+    ):
+        enabled = {**SCREENING_ENABLED, **(enabled or {})}
+        rules = RuleStage(rule_parser)
+        stages = {
+            "fingerprint": FingerprintStage(checker=checker, rule_parser=rules.parser, low=low),
+            "rule": rules,
+            "ml": MLStage(low, high, predict=predict),
+            "execution": ExecutionStage(),
+        }
+        self.stages = [stages[name] for name in SCREENING_STAGES if enabled[name]]
+        self.checks = [stage for stage in self.stages if stage.name != "execution"]
+        self.fingerprints = stages["fingerprint"] if enabled["fingerprint"] else None
+        self.execution = stages["execution"] if enabled["execution"] else None
+        self.low = low
+        self.high = high
+        self.log_outcomes = log_outcomes
+
+        self._lock = threading.Lock()
+        self.latency_us = {stage.name: Histogram(exponential_buckets(1, 2, 20)) for stage in self.stages}
+        self.decisions = {stage.name: {"blocked": 0, "allowed": 0} for stage in self.stages}
+        self.passed = 0
+
+    def _run_stage(self, stage, screening):
+        started = time.perf_counter()
+        verdict = stage.check(screening)
+        self.latency_us[stage.name].observe((time.perf_counter() - started) * 1e6)
+        if verdict is not None:
+            with self._lock:
+                self.decisions[stage.name][verdict.status] += 1
+        return verdict
+
+    def screen(self, sql, engine=None):
+        screening = Screening(sql, engine)
+        verdict = None
+        for stage in self.checks:
+            # First decisive verdict wins: blocked is final, allowed goes to execution
+            verdict = self._run_stage(stage, screening)
+            if verdict is not None:
+                break
+
+        if self.fingerprints is not None and (verdict is None or verdict.stage != self.fingerprints.name):
+            self.fingerprints.remember(screening, verdict)
+
+        if verdict is None or not verdict.blocked:
+            # No engine connected: screened and logged all the same, just not run
+            if self.execution is not None and engine is not None:
+                verdict = self._run_stage(self.execution, screening)
+            elif verdict is None:
+                verdict = Verdict("allowed", "safe", "screening", score=screening.score)
+                with self._lock:
+                    self.passed += 1
+
+        # Every screened query is traffic, whoever sent it
+        get_traffic_counters().incr_many((verdict.status, f"reason:{classify_reason(verdict.reason)}"))
+        if self.log_outcomes:
+            log_attack(sql, verdict.status, reason=verdict.reason, score=verdict.score or 0.0)
+        return verdict
+
+    def stats(self):
+        with self._lock:
+            decisions = {name: dict(counts) for name, counts in self.decisions.items()}
+            passed = self.passed
+        stats = {
+            "stages": [stage.name for stage in self.stages],
+            "thresholds": {"low": self.low, "high": self.high},
+            "passed_without_execution": passed,
+        }
+        for stage in self.stages:
+            latency = self.latency_us[stage.name].snapshot()
+            latency.pop("buckets")
+            stats[stage.name] = {**decisions[stage.name], "latency_us": latency}
+        if self.fingerprints is not None:
+            stats["fingerprint"]["cache"] = {**self.fingerprints.cache.stats(), "bypassed": self.fingerprints.bypassed}
+        return stats
+
+
+def get_screening_pipeline():
+    global _shared_pipeline
+
+    with _shared_lock:
+        if _shared_pipeline is None:
+            _shared_pipeline = ScreeningPipeline()
+        return _shared_pipeline
@@ -0,0 +1,268 @@
+import bisect
+import mmap
+import os
+import stat
+import struct
+import threading
+import zlib
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: no pre-fork servers there, one process owns the file
+    fcntl = None
+
+from log_rollup import REASON_CLASSES
+
+# Flask's default instance folder: owned by the app, one per deployment
+SHARED_STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "instance")
+SHARED_COUNTERS_PATH = os.path.join(SHARED_STATE_DIR, "traffic_counters.bin")
+SHARED_COUNTERS_SLOTS = 64
+TRAFFIC_STATUSES = ("allowed", "blocked")
+TRAFFIC_COUNTERS = TRAFFIC_STATUSES + tuple(f"reason:{name}" for name in REASON_CLASSES)
+
+MAGIC = b"SQLCNT01"
+# magic, slot count, counter count, crc32 of the counter names; padded to 8 bytes
+HEADER = struct.Struct("<8sIII4x")
+WORD = 8
+
+_shared_counters = None
+_shared_lock = threading.Lock()
+
+
+def _pid_alive(pid) -> bool:
+    if pid <= 0:
+        return False
+    if os.name != "posix":
+        # os.kill(pid, 0) would terminate the process on Windows, where the
+        # app runs as a single process anyway
+        return pid == os.getpid()
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _open_state_file(path):
+    os.makedirs(os.path.dirname(path) or ".", mode=0o700, exist_ok=True)
+    # Never follow a planted symlink: the file gets truncated when its layout differs
+    fd = os.open(path, os.O_RDWR | os.O_CREAT | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    info = os.fstat(fd)
+    if not stat.S_ISREG(info.st_mode) or (hasattr(os, "getuid") and info.st_uid != os.getuid()):
+        os.close(fd)
+        raise RuntimeError(f"{path} is not a regular file owned by this user")
+    return fd
+
+
+class SharedCounters:
+    def __init__(self, names=TRAFFIC_COUNTERS, path=SHARED_COUNTERS_PATH, slots=SHARED_COUNTERS_SLOTS):
+        self.names = tuple(names)
+        self.path = path
+        self.slots = slots
+        self._index = {name: i for i, name in enumerate(self.names)}
+        self._signature = zlib.crc32("\0".join(self.names).encode("utf-8"))
+
+        counters = len(self.names)
+        self._owners_at = HEADER.size
+        self._baseline_at = self._owners_at + slots * WORD
+        self._slots_at = self._baseline_at + counters * WORD
+        self.size = self._slots_at + slots * counters * WORD
+
+        self._local = threading.Lock()
+        self._fd = _open_state_file(path)
+        with self._file_lock():
+            self._prepare()
+            self._map = mmap.mmap(self._fd, self.size)
+            self._words = memoryview(self._map).cast("Q")
+            if not self._owners_alive():
+                # First process since a restart or crash: the previous run's totals are stale
+                self._clear()
+            self.slot = self._claim_slot()
+
+        row = (self._slots_at // WORD) + self.slot * counters
+        self._row = self._words[row:row + counters]
+        if hasattr(os, "register_at_fork"):
+            # Forked after the parent claimed its slot: take one of our own
+            os.register_at_fork(after_in_child=self._reopen)
+
+    def _file_lock(self):
+        return _FileLock(self._fd)
+
+    def _prepare(self):
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        header = os.read(self._fd, HEADER.size)
+        expected = HEADER.pack(MAGIC, self.slots, len(self.names), self._signature)
+        if len(header) == HEADER.size and header == expected and os.fstat(self._fd).st_size == self.size:
+            return
+        # Missing, foreign or from another counter layout: start from zero
+        os.ftruncate(self._fd, 0)
+        os.ftruncate(self._fd, self.size)
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        os.write(self._fd, expected)
+
+    def _owners_alive(self) -> bool:
+        owners = self._owners_at // WORD
+        return any(_pid_alive(self._words[owners + slot]) for slot in range(self.slots))
+
+    def _clear(self):
+        self._map[HEADER.size:] = bytes(self.size - HEADER.size)
+
+    def _claim_slot(self):
+        owners = self._owners_at // WORD
+        pid = os.getpid()
+        free = None
+        for slot in range(self.slots):
+            owner = self._words[owners + slot]
+            if owner == pid:
+                return slot
+            if free is None and not _pid_alive(owner):
+                free = slot
+        if free is None:
+            raise RuntimeError(f"All {self.slots} shared counter slots are taken")
+        # A dead worker's totals stay in the slot and keep counting for the new owner
+        self._words[owners + free] = pid
+        return free
+
+    def incr(self, name, amount=1):
+        index = self._index[name]
+        # The slot belongs to this process only: no cross-process lock
+        with self._local:
+            self._row[index] += amount
+
+    def incr_many(self, names, amount=1):
+        with self._local:
+            for name in names:
+                self._row[self._index[name]] += amount
+
+    def _reopen(self):
+        # flock is per open file: a descriptor shared with the parent locks nothing
+        inherited = self._fd
+        self._fd = _open_state_file(self.path)
+        os.close(inherited)
+        with self._file_lock():
+            self.slot = self._claim_slot()
+        counters = len(self.names)
+        row = (self._slots_at // WORD) + self.slot * counters
+        self._row = self._words[row:row + counters]
+        self._local = threading.Lock()
+
+    def _totals(self):
+        counters = len(self.names)
+        start = self._slots_at // WORD
+        rows = [
+            self._words[start + slot * counters:start + (slot + 1) * counters].tolist()
+            for slot in range(self.slots)
+        ]
+        return [sum(column) for column in zip(*rows)]
+
+    def value(self, name):
+        index = self._index[name]
+        counters = len(self.names)
+        start = self._slots_at // WORD + index
+        total = sum(self._words[start:start + self.slots * counters:counters])
+        return max(total - self._words[self._baseline_at // WORD + index], 0)
+
+    def snapshot(self):
+        baseline = self._baseline_at // WORD
+        return {
+            name: max(total - self._words[baseline + i], 0)
+            for i, (name, total) in enumerate(zip(self.names, self._totals()))
+        }
+
+    def reset(self):
+        # Writers never see the reset: the current sums become the new zero
+        with self._file_lock():
+            baseline = self._baseline_at // WORD
+            for i, total in enumerate(self._totals()):
+                self._words[baseline + i] = total
+
+    def stats(self):
+        owners = self._owners_at // WORD
+        return {
+            "path": self.path,
+            "slot": self.slot,
+            "slots": self.slots,
+            "workers": sum(
+                1 for slot in range(self.slots) if _pid_alive(self._words[owners + slot])
+            ),
+            "counters": self.snapshot(),
+        }
+
+
+class SharedHistogram:
+    def __init__(self, bounds, path, extra=(), slots=SHARED_COUNTERS_SLOTS):
+        self.bounds = sorted(bounds)
+        self._buckets = tuple(f"le:{i}" for i in range(len(self.bounds) + 1))
+        # Extra counters share the block, so one reset clears a whole run
+        self.counters = SharedCounters(
+            self._buckets + ("count", "sum_us") + tuple(extra), path=path, slots=slots
+        )
+
+    def observe(self, value):
+        bucket = self._buckets[bisect.bisect_left(self.bounds, value)]
+        self.counters.incr_many((bucket, "count"))
+        self.counters.incr("sum_us", int(value * 1000))
+
+    def incr(self, name, amount=1):
+        self.counters.incr(name, amount)
+
+    def reset(self):
+        self.counters.reset()
+
+    def snapshot(self):
+        values = self.counters.snapshot()
+        counts = [values[bucket] for bucket in self._buckets]
+        total = values["count"]
+        # No exact max across processes: the highest non-empty bucket bounds it
+        top = max((idx for idx, count in enumerate(counts) if count), default=None)
+
+        def upper(idx):
+            return self.bounds[min(idx, len(self.bounds) - 1)]
+
+        def percentile(q):
+            if not total:
+                return None
+            rank = q / 100 * total
+            seen = 0
+            for idx, count in enumerate(counts):
+                seen += count
+                if seen >= rank and count:
+                    return upper(idx)
+            return upper(top)
+
+        return {
+            "count": total,
+            "sum": values["sum_us"] / 1000,
+            "mean": values["sum_us"] / 1000 / total if total else None,
+            "max": upper(top) if top is not None else None,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "p99": percentile(99),
+            "counters": {name: values[name] for name in self.counters.names[len(self._buckets) + 2:]},
+        }
+
+
+class _FileLock:
+    def __init__(self, fd):
+        self.fd = fd
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+
+def get_traffic_counters():
+    global _shared_counters
+
+    with _shared_lock:
+        if _shared_counters is None:
+            _shared_counters = SharedCounters()
+        return _shared_counters
@@ -0,0 +1,230 @@
+import re
+import threading
+from collections import OrderedDict
+from itertools import accumulate
+
+from sqlparse import keywords, tokens as T
+
+# Same dictionaries, in the same lookup order, as sqlparse.lexer.Lexer.default_initialization
+KEYWORD_DICTS = (
+    keywords.KEYWORDS_COMMON,
+    keywords.KEYWORDS_ORACLE,
+    keywords.KEYWORDS_MYSQL,
+    keywords.KEYWORDS_PLPGSQL,
+    keywords.KEYWORDS_HQL,
+    keywords.KEYWORDS_MSACCESS,
+    keywords.KEYWORDS_SNOWFLAKE,
+    keywords.KEYWORDS_BIGQUERY,
+    keywords.KEYWORDS,
+)
+
+LEX_CACHE_SIZE = 4096
+# Longer queries are lexed every time instead of pinning memory in the cache
+LEX_CACHE_MAX_LENGTH = 1024
+# Total tokens held by the cache, about 100 bytes each: an adversarial stream of
+# distinct long queries pins a few tens of MB at most
+LEX_CACHE_MAX_TOKENS = 256 * 1024
+
+VAL_STR = " VAL_STR "
+VAL_NUM = " VAL_NUM "
+
+_BACKREF = re.compile(r"(?<!\\)((?:\\\\)*)\\(\d+)")
+_WHITESPACE = re.compile(r"\s+")
+# TfidfVectorizer's default token_pattern
+_TERM = re.compile(r"(?u)\b\w\w+\b")
+
+
+def compile_lexer(sql_regex=keywords.SQL_REGEX):
+    parts = []
+    actions = {}
+    offset = 0
+
+    for i, (rx, action) in enumerate(sql_regex):
+        name = f"t{i}"
+        shift = offset + 1
+        groups = re.compile(rx).groups
+        rx = _BACKREF.sub(
+            lambda m: f"{m.group(1)}\\{int(m.group(2)) + shift}", rx
+        )
+        parts.append(f"(?P<{name}>{rx})")
+        actions[name] = action
+        offset += groups + 1
+
+    pattern = re.compile("|".join(parts), re.IGNORECASE | re.UNICODE)
+    return pattern, actions
+
+
+def compile_keywords(keyword_dicts=KEYWORD_DICTS):
+    merged = {}
+    for kwdict in reversed(keyword_dicts):
+        merged.update(kwdict)
+    return merged
+
+
+_PATTERN, _ACTIONS = compile_lexer()
+_KEYWORDS = compile_keywords()
+
+
+# Literals collapse to placeholders and whitespace to one space, as the regex normalizer did
+_NORMALIZED = {
+    T.Text.Whitespace: " ",
+    T.Newline: " ",
+    T.String.Single: VAL_STR,
+    T.String.Symbol: VAL_STR,
+    T.Number.Integer: VAL_NUM,
+    T.Number.Float: VAL_NUM,
+    T.Number.Hexadecimal: VAL_NUM,
+}
+_SPACE_TYPES = frozenset((T.Text.Whitespace, T.Newline))
+
+
+class TokenStream:
+    __slots__ = ("sql", "tokens", "_normalized", "_terms")
+
+    def __init__(self, sql, tokens):
+        self.sql = sql
+        # (ttype, value) pairs; they cover the query without gaps
+        self.tokens = tokens
+        self._normalized = None
+        self._terms = None
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    @property
+    def types(self):
+        return [ttype for ttype, _ in self.tokens]
+
+    @property
+    def values(self):
+        return [value for _, value in self.tokens]
+
+    @property
+    def offsets(self):
+        if not self.tokens:
+            return []
+        return list(accumulate((len(value) for _, value in self.tokens[:-1]), initial=0))
+
+    @property
+    def normalized(self) -> str:
+        if self._normalized is None:
+            tokens = self.tokens
+            start = 0
+            end = len(tokens)
+            while start < end and tokens[start][0] in _SPACE_TYPES:
+                start += 1
+            while end > start and tokens[end - 1][0] in _SPACE_TYPES:
+                end -= 1
+
+            replace = _NORMALIZED.get
+            text = "".join([replace(ttype) or value for ttype, value in tokens[start:end]])
+            self._normalized = _WHITESPACE.sub(" ", text).lower()
+        return self._normalized
+
+    @property
+    def terms(self):
+        # The words TfidfVectorizer extracts from the normalized query
+        if self._terms is None:
+            self._terms = tuple(_TERM.findall(self.normalized))
+        return self._terms
+
+
+def _lex(sql: str) -> TokenStream:
+    match = _PATTERN.match
+    actions = _ACTIONS
+    kwlookup = _KEYWORDS.get
+    as_keyword = keywords.PROCESS_AS_KEYWORD
+    tokens = []
+    append = tokens.append
+    pos = 0
+    end = len(sql)
+
+    while pos < end:
+        m = match(sql, pos)
+        if m is None:
+            append((T.Error, sql[pos]))
+            pos += 1
+            continue
+
+        value = m.group()
+        action = actions[m.lastgroup]
+        if action is as_keyword:
+            append((kwlookup(value.upper(), T.Name), value))
+        else:
+            append((action, value))
+        pos = m.end()
+
+    return TokenStream(sql, tokens)
+
+
+class LexCache:
+    def __init__(self, max_entries=LEX_CACHE_SIZE, max_tokens=LEX_CACHE_MAX_TOKENS):
+        self.max_entries = max_entries
+        self.max_tokens = max_tokens
+        # sql -> token list only; normalized/terms are rebuilt per stream, not pinned here
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.tokens = 0
+        self.hits = 0
+        self.misses = 0
+
+    def lex(self, sql: str) -> TokenStream:
+        with self._lock:
+            tokens = self._entries.get(sql)
+            if tokens is not None:
+                self._entries.move_to_end(sql)
+                self.hits += 1
+                return TokenStream(sql, tokens)
+            self.misses += 1
+
+        stream = _lex(sql)
+        size = len(stream.tokens)
+        if size > self.max_tokens:
+            return stream
+        with self._lock:
+            if sql not in self._entries:
+                self._entries[sql] = stream.tokens
+                self.tokens += size
+                while len(self._entries) > self.max_entries or self.tokens > self.max_tokens:
+                    _, old = self._entries.popitem(last=False)
+                    self.tokens -= len(old)
+        return stream
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.tokens = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "tokens": self.tokens,
+                "max_tokens": self.max_tokens,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
+
+
+_lex_cache = LexCache()
+
+
+def lex(sql: str) -> TokenStream:
+    # Rules, fingerprinting and the ML featurizer ask for the same query in turn
+    if len(sql) > LEX_CACHE_MAX_LENGTH:
+        return _lex(sql)
+    return _lex_cache.lex(sql)
+
+
+def normalize_sql(sql: str) -> str:
+    return lex(sql).normalized
+
+
+def lex_cache_stats():
+    return _lex_cache.stats()
@@ -4,6 +4,10 @@ import sqlparse
 from sqlparse.tokens import Keyword, Comment
 
 from rule_checker import BLOCKED_COMMANDS, BLOCKED_TOKENS
+from rule_engine import CompiledRuleEngine
+
+RULE_ENGINE = "compiled"
+RULE_ENGINES = ("compiled", "sqlparse")
 
 
 def clean_token(value: str) -> str:
@@ -11,15 +15,41 @@ def clean_token(value: str) -> str:
 
 
 class SQLRuleParser:
-    def __init__(self):
+    def __init__(self, engine: str = RULE_ENGINE):
+        if engine not in RULE_ENGINES:
+            raise ValueError(f"Unknown rule engine: {engine}")
+
+        self.engine = engine
         self.blocked_commands = set(BLOCKED_COMMANDS)
         self.blocked_tokens = set(BLOCKED_TOKENS)
+        # Bumped by set_rules; verdict caches compare it instead of the sets themselves
+        self.rules_version = 0
+        self.compiled = CompiledRuleEngine(
+            self.blocked_commands,
+            self.blocked_tokens,
+            fallback=self.check_query_sqlparse,
+        )
+
+    def set_rules(self, blocked_commands=None, blocked_tokens=None):
+        # In place: the compiled engine holds the same set objects
+        if blocked_commands is not None:
+            self.blocked_commands.clear()
+            self.blocked_commands.update(blocked_commands)
+        if blocked_tokens is not None:
+            self.blocked_tokens.clear()
+            self.blocked_tokens.update(blocked_tokens)
+        self.rules_version += 1
 
     def is_safe(self, sql: str) -> bool:
         result, _ = self.check_query(sql)
         return result
 
-    def check_query(self, sql: str):
+    def check_query(self, sql: str, tokens=None):
+        if self.engine == "compiled":
+            return self.compiled.check_query(sql, tokens)
+        return self.check_query_sqlparse(sql)
+
+    def check_query_sqlparse(self, sql: str):
         try:
             parsed = sqlparse.parse(sql)
             if not parsed:
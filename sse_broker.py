@@ -0,0 +1,150 @@
+import itertools
+import json
+import logging
+import queue
+import threading
+from collections import deque
+
+SSE_TICK_INTERVAL = 1.0
+SSE_HISTORY_SIZE = 300
+SSE_SUBSCRIBER_QUEUE = 16
+SSE_HEARTBEAT = 15.0
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, broker, backlog, queue_size):
+        self.broker = broker
+        self.backlog = backlog
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.closed = False
+
+    def offer(self, message):
+        try:
+            self.queue.put_nowait(message)
+            return True
+        except queue.Full:
+            pass
+        # Slow consumer: the oldest pending update goes, the newest stays
+        try:
+            self.queue.get_nowait()
+        except queue.Empty:
+            pass
+        self.dropped += 1
+        try:
+            self.queue.put_nowait(message)
+        except queue.Full:
+            pass
+        return False
+
+    def __iter__(self):
+        yield "retry: 3000\n\n"
+        yield from self.backlog
+        self.backlog = ()
+        while not self.closed:
+            try:
+                yield self.queue.get(timeout=self.broker.heartbeat)
+            except queue.Empty:
+                # Comment line: keeps proxies open and surfaces dead clients
+                yield ": keepalive\n\n"
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker.unsubscribe(self)
+
+
+class SSEBroker:
+    def __init__(
+            self,
+            snapshot,
+            interval=SSE_TICK_INTERVAL,
+            history_size=SSE_HISTORY_SIZE,
+            queue_size=SSE_SUBSCRIBER_QUEUE,
+            heartbeat=SSE_HEARTBEAT,
+    ):
+        self.snapshot = snapshot
+        self.interval = interval
+        self.queue_size = queue_size
+        self.heartbeat = heartbeat
+
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._ids = itertools.count(1)
+
+        self.published = 0
+        self.dropped = 0
+        self.connected = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5.0):
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.publish(self.snapshot())
+            except Exception:
+                logger.exception("Не вдалося сформувати SSE-оновлення")
+
+    def publish(self, data):
+        # Serialized once, whatever the number of subscribers
+        event_id = next(self._ids)
+        message = f"id: {event_id}\ndata: {json.dumps(data)}\n\n"
+        with self._lock:
+            self._history.append((event_id, message))
+            subscribers = list(self._subscribers)
+            self.published += 1
+
+        for subscription in subscribers:
+            if not subscription.offer(message):
+                with self._lock:
+                    self.dropped += 1
+
+    def subscribe(self, last_event_id=None):
+        self.start()
+        with self._lock:
+            if self._history and last_event_id is not None and last_event_id > self._history[-1][0]:
+                # Id from before a restart: the whole history is new to this client
+                last_event_id = None
+            # A reconnecting EventSource only needs what it has not seen yet
+            backlog = [
+                message for event_id, message in self._history
+                if last_event_id is None or event_id > last_event_id
+            ]
+            subscription = Subscription(self, backlog, self.queue_size)
+            self._subscribers.add(subscription)
+            self.connected += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "subscribers": len(self._subscribers),
+                "connected_total": self.connected,
+                "published": self.published,
+                "dropped": self.dropped,
+                "history": len(self._history),
+                "history_size": self._history.maxlen,
+                "interval": self.interval,
+            }
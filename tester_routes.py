@@ -1,13 +1,18 @@
 import logging
 
 from flask import Blueprint, jsonify, redirect, render_template, request, url_for
-from sqlalchemy import text
-from sqlalchemy.exc import SQLAlchemyError
 
 from external_db.db_connection import connect_from_params, get_current_uri, get_engine
+from ml_checker import get_ml_checker
+from screening import get_screening_pipeline
+from sql_parser import SQLRuleParser
 
 tester_bp = Blueprint("tester", __name__)
 
+MAX_BATCH_QUERIES = 10000
+
+_rule_parser = None
+
 logging.basicConfig(
     level=logging.INFO,
     format="[%(asctime)s] %(levelname)s - %(message)s",
@@ -18,6 +23,51 @@ logger = logging.getLogger(__name__)
 @tester_bp.route("/check_query", methods=["POST"])
 def check_query():
     engine = get_engine()
+    data = request.get_json() or {}
+    sql = data.get("query", "").strip()
+
+    if not sql:
+        return jsonify({"status": "error", "message": "Порожній SQL-запит"}), 400
+
+    try:
+        verdict = get_screening_pipeline().screen(sql, engine)
+    except Exception as e:
+        logger.exception("Непередбачена помилка у /check_query")
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": f"Внутрішня помилка: {str(e)}",
+                }
+            ),
+            500,
+        )
+
+    if verdict.stage == "execution" and verdict.blocked:
+        logger.error(verdict.message)
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": verdict.message,
+                    "verdict": verdict.to_dict(),
+                }
+            ),
+            400,
+        )
+
+    if verdict.blocked:
+        return (
+            jsonify(
+                {
+                    "status": "error",
+                    "message": f"Запит заблоковано ({verdict.stage}): {verdict.reason}",
+                    "verdict": verdict.to_dict(),
+                }
+            ),
+            403,
+        )
+
     if engine is None:
         return (
             jsonify(
@@ -27,68 +77,83 @@ def check_query():
                         "Немає активного підключення до БД. "
                         "Спочатку підключіться."
                     ),
+                    "verdict": verdict.to_dict(),
                 }
             ),
             400,
         )
 
-    data = request.get_json() or {}
-    sql = data.get("query", "").strip()
+    response = {
+        "status": "success",
+        "message": verdict.message or "Запит пройшов перевірку",
+        "verdict": verdict.to_dict(),
+    }
+    if verdict.rows is not None:
+        response["rows"] = verdict.rows
+    return jsonify(response), 200
 
-    if not sql:
-        return jsonify({"status": "error", "message": "Порожній SQL-запит"}), 400
 
-    try:
-        with engine.connect() as conn:
-            result = conn.execute(text(sql))
-            if result.returns_rows:
-                rows = [dict(r._mapping) for r in result]
-                return (
-                    jsonify(
-                        {
-                            "status": "success",
-                            "message": "Запит виконано успішно",
-                            "rows": rows,
-                        }
-                    ),
-                    200,
-                )
-
-            return (
-                jsonify(
-                    {
-                        "status": "success",
-                        "message": "Запит виконано (без результату)",
-                    }
-                ),
-                200,
-            )
-
-    except SQLAlchemyError as e:
-        error_msg = str(e.__cause__ or e)
-        logger.error(f"SQL Error: {error_msg}")
+@tester_bp.route("/check_query/pipeline_stats")
+def pipeline_stats():
+    return jsonify(get_screening_pipeline().stats())
+
+
+def get_checkers():
+    global _rule_parser
+
+    if _rule_parser is None:
+        _rule_parser = SQLRuleParser()
+    return _rule_parser, get_ml_checker()
+
+
+@tester_bp.route("/check_queries_batch", methods=["POST"])
+def check_queries_batch():
+    data = request.get_json(silent=True) or {}
+    queries = data.get("queries")
+
+    if not isinstance(queries, list) or not all(
+            isinstance(q, str) for q in queries
+    ):
         return (
             jsonify(
                 {
                     "status": "error",
-                    "message": f"SQL помилка: {error_msg}",
+                    "message": "Поле 'queries' має бути масивом рядків",
                 }
             ),
             400,
         )
 
-    except Exception as e:
-        logger.exception("Непередбачена помилка у /check_query")
+    if len(queries) > MAX_BATCH_QUERIES:
         return (
             jsonify(
                 {
                     "status": "error",
-                    "message": f"Внутрішня помилка: {str(e)}",
+                    "message": (
+                        f"Забагато запитів у пакеті: {len(queries)} "
+                        f"(максимум {MAX_BATCH_QUERIES})"
+                    ),
                 }
             ),
-            500,
+            413,
         )
 
+    rule_parser, ml_checker = get_checkers()
+    ml_verdicts = ml_checker.predict_batch(queries)
+
+    results = []
+    for sql, (is_suspicious, prob) in zip(queries, ml_verdicts):
+        is_safe, reason = rule_parser.check_query(sql)
+        results.append(
+            {
+                "query": sql,
+                "rule": {"safe": is_safe, "reason": reason},
+                "ml": {"suspicious": bool(is_suspicious), "score": float(prob)},
+            }
+        )
+
+    return jsonify({"status": "success", "count": len(results), "results": results}), 200
+
 
 @tester_bp.route("/tester")
 def tester_page():
@@ -0,0 +1,102 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linear_scorer import PARITY_TOLERANCE, compile_scorer, verify_parity  # noqa: E402
+from model_artifact import load_artifact, save_artifact  # noqa: E402
+from sql_lexer import normalize_sql  # noqa: E402
+
+SAFE = [
+    "SELECT * FROM users WHERE id = 1",
+    "SELECT name, email FROM users WHERE id = 42 ORDER BY name",
+    "SELECT count(*) FROM orders WHERE created_at > '2024-01-01'",
+    "INSERT INTO logs (level, message) VALUES ('info', 'started')",
+    "UPDATE users SET last_login = now() WHERE id = 7",
+    "SELECT title FROM film WHERE rental_rate < 2.99 LIMIT 10",
+    "SELECT a.id, b.total FROM accounts a JOIN balances b ON a.id = b.account_id",
+    "DELETE FROM sessions WHERE expires_at < now()",
+    "select p.name from products p where p.price between 10 and 20",
+    "SELECT AVG(amount) FROM payment GROUP BY customer_id HAVING AVG(amount) > 5",
+]
+MALICIOUS = [
+    "SELECT * FROM users WHERE id = 1 OR 1=1",
+    "SELECT * FROM users WHERE name = '' OR 'a'='a'",
+    "SELECT name FROM users WHERE id = 1 UNION SELECT password FROM admins",
+    "SELECT * FROM users WHERE id = 1; DROP TABLE users; --",
+    "SELECT * FROM users WHERE id = 1 AND SLEEP(5)",
+    "SELECT * FROM products WHERE id = 1 UNION ALL SELECT NULL, version(), NULL",
+    "SELECT * FROM users WHERE username = 'admin' --' AND password = 'x'",
+    "SELECT * FROM users WHERE id = 1 OR 'x'='x' /* bypass */",
+    "1' OR '1'='1",
+    "SELECT * FROM accounts WHERE id = 10 AND 1=(SELECT COUNT(*) FROM pg_user)",
+]
+# Not seen in training: terms outside the vocabulary, empty and whitespace-only input
+UNSEEN = [
+    "",
+    "   ",
+    "SELECT zzz_unknown FROM nowhere",
+    "SeLeCt * FrOm UsErS wHeRe Id = 99 Or 2=2",
+    "SELECT\n  *\nFROM\tusers\nWHERE id = 5",
+    "SELECT * FROM users WHERE note = 'don''t' OR 1=1",
+]
+CORPUS = SAFE + MALICIOUS + UNSEEN
+LABELS = np.array([0] * len(SAFE) + [1] * len(MALICIOUS))
+
+
+def _fit(vectorizer, model):
+    X = vectorizer.fit_transform([normalize_sql(sql) for sql in SAFE + MALICIOUS])
+    model.fit(X, LABELS)
+    return vectorizer, model
+
+
+def _assert_parity(scorer, vectorizer, model):
+    assert scorer is not None
+    result = verify_parity(scorer, vectorizer, model, CORPUS)
+    assert result["max_abs_diff"] <= PARITY_TOLERANCE, result["worst_query"]
+    assert result["verdict_mismatches"] == 0
+
+
+@pytest.mark.parametrize("params", [
+    {},
+    {"ngram_range": (1, 2)},
+    {"sublinear_tf": True, "norm": "l1"},
+    {"use_idf": False, "binary": True},
+    {"analyzer": "char_wb", "ngram_range": (2, 4)},
+])
+def test_tfidf_parity(params):
+    vectorizer, model = _fit(TfidfVectorizer(**params), LogisticRegression())
+    _assert_parity(compile_scorer(vectorizer, model), vectorizer, model)
+
+
+@pytest.mark.parametrize("params", [
+    {"n_features": 2 ** 10},
+    {"n_features": 2 ** 8, "ngram_range": (1, 2), "alternate_sign": True},
+    {"n_features": 2 ** 10, "alternate_sign": False, "binary": True},
+])
+def test_hashing_parity(params):
+    vectorizer, model = _fit(
+        HashingVectorizer(**params),
+        SGDClassifier(loss="log_loss", random_state=0),
+    )
+    _assert_parity(compile_scorer(vectorizer, model), vectorizer, model)
+
+
+@pytest.mark.parametrize("params", [{}, {"ngram_range": (1, 2), "sublinear_tf": True}])
+def test_mapped_artifact_parity(tmp_path, params):
+    vectorizer, model = _fit(TfidfVectorizer(**params), LogisticRegression())
+    save_artifact(vectorizer, model, str(tmp_path / "ml_model"))
+    mapped_vectorizer, mapped_model = load_artifact(str(tmp_path / "ml_model"))
+
+    # Scored from the mapped weights, compared against the sklearn model they came from
+    _assert_parity(compile_scorer(mapped_vectorizer, mapped_model), vectorizer, model)
+
+
+def test_unsupported_model_has_no_scorer():
+    vectorizer, model = _fit(TfidfVectorizer(), SGDClassifier(loss="hinge", random_state=0))
+    assert compile_scorer(vectorizer, model) is None
@@ -0,0 +1,71 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_spool import HEADER, OFFSET_SUFFIX, QUARANTINE_DIR, LogSpool, SpoolReplayer  # noqa: E402
+
+
+class FlakySink:
+    def __init__(self, fail_on=()):
+        self.fail_on = set(fail_on)
+        self.calls = 0
+        self.written = []
+
+    def __call__(self, chunk):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise RuntimeError("analytics database down")
+        self.written.extend(event["n"] for event in chunk)
+
+
+def _spool(tmp_path, events):
+    spool = LogSpool(str(tmp_path / "spool"), fsync=False)
+    spool.append([{"n": n} for n in events])
+    spool.seal()
+    return spool
+
+
+def test_replay_resumes_from_offset(tmp_path):
+    spool = _spool(tmp_path, range(10))
+    segment = spool.segments()[0]
+    sink = FlakySink(fail_on={3})
+    replayer = SpoolReplayer(spool, sink, batch_size=3)
+
+    # Two chunks land, the third fails: the offset remembers where to resume
+    assert replayer.replay_once() == 0
+    assert sink.written == list(range(6))
+    assert spool.replay_offset(segment) == 6
+
+    assert replayer.replay_once() == 4
+    assert sink.written == list(range(10))
+    assert spool.segments() == []
+    assert not os.path.exists(segment + OFFSET_SUFFIX)
+
+
+def test_torn_segment_is_quarantined(tmp_path):
+    spool = _spool(tmp_path, [100, 101, 102])
+    segment = spool.segments()[0]
+    with open(segment, "r+b") as f:
+        # Damage the second record's payload: the first is still replayed
+        f.seek(HEADER.size + len(b'{"n": 100}') + HEADER.size + 2)
+        f.write(b"\xff")
+    sink = FlakySink()
+
+    assert SpoolReplayer(spool, sink).replay_once() == 1
+    assert sink.written == [100]
+    assert spool.segments() == []
+    assert os.listdir(os.path.join(spool.directory, QUARANTINE_DIR)) == [os.path.basename(segment)]
+    assert spool.stats()["corrupt"] == 1
+
+
+def test_truncated_tail_is_quarantined(tmp_path):
+    spool = _spool(tmp_path, [1, 2])
+    segment = spool.segments()[0]
+    with open(segment, "r+b") as f:
+        f.truncate(os.path.getsize(segment) - 3)
+    sink = FlakySink()
+
+    SpoolReplayer(spool, sink).replay_once()
+    assert sink.written == [1]
+    assert os.path.exists(os.path.join(spool.directory, QUARANTINE_DIR, os.path.basename(segment)))
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.linear_model import LogisticRegression
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from linear_scorer import compile_scorer  # noqa: E402
+from model_artifact import MappedVectorizer, load_artifact, publish_model  # noqa: E402
+from model_compaction import prune_model  # noqa: E402
+from test_linear_scorer import CORPUS, _assert_parity, _fit  # noqa: E402
+
+
+def test_pruned_model_publishes_as_artifact(tmp_path):
+    vectorizer, model = _fit(TfidfVectorizer(ngram_range=(1, 2)), LogisticRegression())
+    pruned, compact = prune_model(vectorizer, model, min_abs_coef=0.05)
+    assert len(pruned.vocabulary_) < len(vectorizer.vocabulary_)
+
+    model_out = str(tmp_path / "ml_model.pkl")
+    artifact_out = str(tmp_path / "ml_model")
+    assert publish_model(pruned, compact, model_out, artifact_out) == artifact_out
+    assert os.path.exists(model_out)
+
+    mapped_vectorizer, mapped_model = load_artifact(artifact_out)
+    assert isinstance(mapped_vectorizer, MappedVectorizer)
+    _assert_parity(compile_scorer(mapped_vectorizer, mapped_model), pruned, compact)
+
+
+def test_failed_artifact_keeps_pickle(tmp_path):
+    vectorizer, model = _fit(TfidfVectorizer(), LogisticRegression())
+    model_out = str(tmp_path / "ml_model.pkl")
+    artifact_out = str(tmp_path / "ml_model")
+    publish_model(vectorizer, model, model_out, artifact_out)
+    with open(model_out, "rb") as f:
+        published = f.read()
+
+    # Not exportable: the served artifact and the pickle must stay as they were
+    custom = TfidfVectorizer(preprocessor=str.lower).fit(CORPUS)
+    with pytest.raises(ValueError):
+        publish_model(custom, model, model_out, artifact_out)
+    with open(model_out, "rb") as f:
+        assert f.read() == published
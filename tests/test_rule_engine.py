@@ -0,0 +1,60 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from queries_generator import generate_malicious_queries, generate_safe_queries  # noqa: E402
+from sql_parser import SQLRuleParser  # noqa: E402
+
+# Shapes the templates do not produce: comments, case, quoting, stacked statements
+EDGE_CASES = [
+    "",
+    "   ",
+    ";",
+    "-- only a comment",
+    "/* leading */ DROP TABLE film",
+    "select * from film union select * from actor",
+    "SeLeCt title FROM film WHERE title = 'DROP TABLE film'",
+    'SELECT "union" FROM film',
+    "SELECT * FROM film WHERE id = 1 /* OR 1=1 */",
+    "SELECT * FROM film WHERE id = 1 -- OR 1=1",
+    "SELECT * FROM film; DELETE FROM film",
+    "(SELECT 1) UNION (SELECT 2)",
+    "SELECT $$drop$$",
+    "SELECT E'\\'' || 'x'",
+    "WITH t AS (SELECT 1) SELECT * FROM t",
+    "  \n\tdrop table film",
+]
+
+
+def _queries(n):
+    random.seed(0)
+    return generate_safe_queries(n) + generate_malicious_queries(n) + EDGE_CASES
+
+
+@pytest.mark.parametrize("rules", [
+    {},
+    {"blocked_commands": {"SELECT"}, "blocked_tokens": set()},
+    {"blocked_commands": set(), "blocked_tokens": {"WHERE", "LIMIT"}},
+])
+def test_compiled_engine_matches_sqlparse(rules):
+    compiled = SQLRuleParser("compiled")
+    reference = SQLRuleParser("sqlparse")
+    compiled.set_rules(**rules)
+    reference.set_rules(**rules)
+
+    for sql in _queries(500):
+        assert compiled.check_query(sql) == reference.check_query(sql), sql
+
+
+def test_set_rules_bumps_version():
+    parser = SQLRuleParser()
+    version = parser.rules_version
+    assert parser.check_query("TRUNCATE TABLE film")[0] is False
+
+    parser.set_rules(blocked_commands=set())
+    assert parser.rules_version == version + 1
+    assert parser.check_query("TRUNCATE TABLE film") == (True, "Safe")
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Deployment settings (database URIs) are not in the repo; the pipeline imports them
+pytest.importorskip("config_db")
+
+from screening import ScreeningPipeline  # noqa: E402
+
+SCORES = {"SELECT * FROM film WHERE film_id = 1": 0.1, "SELECT * FROM film WHERE film_id = 2": 0.6}
+
+
+class FixedChecker:
+    generation = 0
+
+    def __init__(self):
+        self.calls = 0
+
+    def maybe_reload(self):
+        pass
+
+    def predict(self, sql, tokens=None):
+        self.calls += 1
+        score = SCORES.get(sql, 0.95)
+        return score >= 0.5, score
+
+
+class NoCounters:
+    def incr_many(self, names, amount=1):
+        pass
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    monkeypatch.setattr("screening.get_traffic_counters", NoCounters)
+    checker = FixedChecker()
+    return ScreeningPipeline(checker=checker, predict=checker.predict, log_outcomes=False)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'tester.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE film (film_id INTEGER, title TEXT)"))
+        conn.execute(text("INSERT INTO film VALUES (1, 'ACADEMY DINOSAUR'), (2, 'ACE GOLDFINGER')"))
+    return engine
+
+
+def test_verdict_per_stage(pipeline, engine):
+    assert pipeline.screen("DROP TABLE film", engine).stage == "rule"
+    assert pipeline.screen("SELECT * FROM film WHERE film_id = 3 OR 1=1", engine).stage == "ml"
+
+    verdict = pipeline.screen("SELECT * FROM film WHERE film_id = 1", engine)
+    assert (verdict.stage, verdict.status) == ("execution", "allowed")
+    assert verdict.rows == [{"film_id": 1, "title": "ACADEMY DINOSAUR"}]
+
+
+def test_fingerprint_cache_answers_repeats(pipeline, engine):
+    checker = pipeline.fingerprints.checker
+    pipeline.screen("SELECT * FROM film WHERE film_id = 3 OR 1=1", engine)
+    calls = checker.calls
+
+    verdict = pipeline.screen("SELECT * FROM film WHERE film_id = 4 OR 1=1", engine)
+    assert (verdict.stage, verdict.status) == ("fingerprint", "blocked")
+    assert checker.calls == calls
+
+
+def test_rule_change_invalidates_cache(pipeline, engine):
+    stage = pipeline.fingerprints
+    stage.check_interval = 0
+    pipeline.screen("SELECT * FROM film WHERE film_id = 1", engine)
+    stage.rule_parser.set_rules(blocked_commands={"SELECT"})
+
+    verdict = pipeline.screen("SELECT * FROM film WHERE film_id = 1", engine)
+    assert (verdict.stage, verdict.status) == ("rule", "blocked")
+
+
+def test_review_band_is_read_only(pipeline, engine):
+    SCORES["DELETE FROM film WHERE film_id = 2"] = 0.6
+    pipeline.fingerprints.rule_parser.set_rules(blocked_commands=set())
+    try:
+        verdict = pipeline.screen("DELETE FROM film WHERE film_id = 2", engine)
+    finally:
+        del SCORES["DELETE FROM film WHERE film_id = 2"]
+    assert (verdict.stage, verdict.reason) == ("execution", "error_from_db")
+
+    # The guard is undone before the connection goes back to the pool
+    with engine.connect() as conn:
+        assert conn.execute(text("PRAGMA query_only")).scalar() == 0
+
+
+def test_screens_without_engine(pipeline):
+    assert pipeline.screen("DROP TABLE film").stage == "rule"
+    verdict = pipeline.screen("SELECT * FROM film WHERE film_id = 1")
+    assert (verdict.stage, verdict.status) == ("ml", "allowed")
@@ -0,0 +1,72 @@
+import multiprocessing
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Deployment settings (database URIs) are not in the repo; the module imports them
+pytest.importorskip("config_db")
+
+from shared_counters import SharedCounters  # noqa: E402
+
+
+def test_refuses_symlinked_file(tmp_path):
+    victim = tmp_path / "victim"
+    victim.write_bytes(b"keep me")
+    path = tmp_path / "counters.bin"
+    os.symlink(victim, path)
+
+    with pytest.raises(OSError):
+        SharedCounters(("a",), path=str(path), slots=2)
+    assert victim.read_bytes() == b"keep me"
+
+
+def test_creates_missing_state_dir(tmp_path):
+    path = tmp_path / "instance" / "counters.bin"
+    counters = SharedCounters(("a",), path=str(path), slots=2)
+    counters.incr("a", 3)
+    assert counters.value("a") == 3
+    assert path.is_file()
+
+
+def _worker(path, amount, slots):
+    counters = SharedCounters(("a", "b"), path=path, slots=4)
+    counters.incr("a", amount)
+    counters.incr_many(("a", "b"))
+    slots.put(counters.slot)
+
+
+def test_processes_count_into_their_own_slots(tmp_path):
+    path = str(tmp_path / "counters.bin")
+    parent = SharedCounters(("a", "b"), path=path, slots=4)
+    parent.incr("a")
+
+    # The parent stays alive, so the children's totals add up instead of being cleared
+    context = multiprocessing.get_context("spawn")
+    slots = context.Queue()
+    workers = [context.Process(target=_worker, args=(path, amount, slots)) for amount in (10, 20)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+        assert worker.exitcode == 0
+
+    taken = {slots.get(timeout=5) for _ in workers}
+    assert parent.slot not in taken
+    assert len(taken) == 2
+    assert parent.snapshot() == {"a": 1 + 11 + 21, "b": 2}
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs os.fork")
+def test_forked_child_takes_its_own_slot(tmp_path):
+    counters = SharedCounters(("a",), path=str(tmp_path / "counters.bin"), slots=4)
+    pid = os.fork()
+    if pid == 0:
+        code = 0 if counters.slot != 0 else 1
+        counters.incr("a", 5)
+        os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert counters.slot == 0
+    assert counters.value("a") == 5
@@ -1,44 +1,72 @@
-import re
+import os
 import pickle
+from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from sqlalchemy import create_engine
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sqlalchemy import create_engine, inspect, text
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.metrics import classification_report, roc_auc_score, precision_recall_curve
 
 from config_db import ANALYTICS_DATABASE_URI
+from log_archive import read_archive
+from model_artifact import DEFAULT_PICKLE, artifact_target, publish_model
+from model_compaction import COMPACTION_ENABLED, COMPACTION_QUANTIZE, compact_model, format_report
+from sql_lexer import normalize_sql
 
+CHECKPOINT_FILE = "ml_incremental.pkl"
+# Incremental runs never touch the served model; "promote" publishes this file
+INCREMENTAL_MODEL_FILE = "ml_incremental_model.pkl"
+INCREMENTAL_CHUNK_SIZE = 10000
+HASHING_N_FEATURES = 2 ** 20
+# Compacted windows touched this recently may still be counting events
+INCREMENTAL_WINDOW_GRACE = 120
 
-def normalize_sql(sql: str) -> str:
-    s = sql.strip()
-    s = re.sub(r"'.*?'", " VAL_STR ", s)
-    s = re.sub(r'".*?"', " VAL_STR ", s)
-    s = re.sub(r"\b\d+\b", " VAL_NUM ", s)
-    s = re.sub(r"\b0x[0-9A-Fa-f]+\b", " VAL_NUM ", s)
-    s = re.sub(r"\s+", " ", s)
-    s = s.lower()
-    return s
+RAW_TRAINING_SQL = "SELECT query, status, 1 AS weight FROM attack_logs"
+COMPACTED_TRAINING_SQL = (
+    "SELECT f.sample_query AS query, w.status, SUM(w.count) AS weight "
+    "FROM attack_log_windows w JOIN query_fingerprints f ON f.id = w.fingerprint_id "
+    "GROUP BY f.id, f.sample_query, w.status"
+)
 
 
-def train_from_db(model_out="ml_model.pkl"):
+def has_compacted_logs(engine) -> bool:
+    return inspect(engine).has_table("attack_log_windows")
+
+
+def load_training_frame(archive=None):
+    if archive:
+        # Parquet archive from log_archive.py: no load on the analytics database
+        table = read_archive(archive, columns=["query", "status", "count"])
+        return table.to_pandas().rename(columns={"count": "weight"})
+
     engine = create_engine(ANALYTICS_DATABASE_URI)
+    # Compacted events come in once per fingerprint and status, weighted by count
+    sql = RAW_TRAINING_SQL
+    if has_compacted_logs(engine):
+        sql += " UNION ALL " + COMPACTED_TRAINING_SQL
+    return pd.read_sql(sql, engine)
 
-    df = pd.read_sql("SELECT query, status FROM attack_logs", engine)
+
+def train_from_db(model_out=DEFAULT_PICKLE, artifact_out=None, archive=None, compact=COMPACTION_ENABLED):
+    df = load_training_frame(archive)
 
     if df.empty:
         print("⚠ Немає даних в attack_logs. Спочатку запустіть симуляцію.")
         return {"success": False, "message": "Немає даних для навчання"}
 
-    df["label"] = df["status"].apply(lambda x: 1 if x == "blocked" else 0)
+    df["label"] = (df["status"] == "blocked").astype(int)
     df["sql_norm"] = df["query"].apply(normalize_sql)
 
     X = df["sql_norm"].tolist()
     y = df["label"].tolist()
+    w = df["weight"].astype(float).to_numpy()
 
-    X_train, X_test, y_train, y_test = train_test_split(
+    X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
         X,
         y,
+        w,
         test_size=0.2,
         random_state=42,
         stratify=y,
@@ -56,21 +84,36 @@ def train_from_db(model_out="ml_model.pkl"):
 
     param_grid = {"C": [0.01, 0.1, 1, 10]}
     grid = GridSearchCV(lr, param_grid, cv=5, scoring="f1", n_jobs=-1)
-    grid.fit(X_train_vect, y_train)
+    grid.fit(X_train_vect, y_train, sample_weight=w_train)
     best = grid.best_estimator_
 
     y_pred = best.predict(X_test_vect)
     y_prob = best.predict_proba(X_test_vect)[:, 1]
 
-    report = classification_report(y_test, y_pred, digits=4)
-    roc = roc_auc_score(y_test, y_prob)
+    report = classification_report(y_test, y_pred, digits=4, sample_weight=w_test)
+    roc = roc_auc_score(y_test, y_prob, sample_weight=w_test)
+
+    compaction = None
+    published_vect, published_model, quantize = vect, best, None
+    if compact:
+        # The pickle keeps float64 weights: quantize (and gate on it) only if an artifact is published
+        compact_vect, compact_lr, compaction = compact_model(
+            vect, best, X_test, y_test, sample_weight=w_test,
+            quantize=COMPACTION_QUANTIZE if artifact_target(model_out, artifact_out) else None,
+        )
+        print(format_report(compaction))
+        if compaction["accepted"]:
+            published_vect, published_model, quantize = compact_vect, compact_lr, compaction["quantize"]
+        else:
+            print("⚠ Стиснута модель втрачає забагато ROC AUC, зберігається повна модель")
 
-    with open(model_out, "wb") as f:
-        pickle.dump((vect, best), f)
+    artifact_out = publish_model(published_vect, published_model, model_out, artifact_out, quantize=quantize)
     print(f"Модель оновлена і збережена в {model_out}")
+    if artifact_out:
+        print(f"Модель (memmap-формат) збережена в {artifact_out}")
 
     threshold = None
-    prec, rec, thr = precision_recall_curve(y_test, y_prob)
+    prec, rec, thr = precision_recall_curve(y_test, y_prob, sample_weight=w_test)
     for p, r, t in zip(prec[::-1], rec[::-1], thr[::-1]):
         if p >= 0.9:
             threshold = float(t)
@@ -82,11 +125,216 @@ def train_from_db(model_out="ml_model.pkl"):
         "report": report,
         "roc_auc": roc,
         "threshold": threshold,
+        "compaction": compaction,
+    }
+
+
+def new_incremental_state():
+    return {
+        "last_id": 0,
+        "last_window_id": 0,
+        "rows_seen": 0,
+        "vectorizer": HashingVectorizer(
+            ngram_range=(1, 2),
+            n_features=HASHING_N_FEATURES,
+            alternate_sign=False,
+            norm="l2",
+        ),
+        "model": SGDClassifier(loss="log_loss", alpha=1e-5, random_state=42),
     }
 
 
+def load_checkpoint(checkpoint=CHECKPOINT_FILE):
+    if not os.path.exists(checkpoint):
+        return None
+    with open(checkpoint, "rb") as f:
+        return pickle.load(f)
+
+
+def save_checkpoint(state, checkpoint=CHECKPOINT_FILE):
+    tmp_path = f"{checkpoint}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(state, f)
+    os.replace(tmp_path, checkpoint)
+
+
+def iter_incremental_chunks(engine, state, chunk_size=INCREMENTAL_CHUNK_SIZE):
+    chunks = pd.read_sql(
+        text(
+            "SELECT id, query, status, 1 AS weight FROM attack_logs "
+            "WHERE id > :last_id ORDER BY id"
+        ),
+        engine,
+        params={"last_id": state["last_id"]},
+        chunksize=chunk_size,
+    )
+    for chunk in chunks:
+        if not chunk.empty:
+            yield chunk, "last_id"
+
+    if not has_compacted_logs(engine):
+        return
+
+    # Only windows that stopped growing; the cursor never passes an open one
+    with engine.connect() as conn:
+        open_id = conn.execute(text(
+            "SELECT min(id) FROM attack_log_windows "
+            "WHERE last_seen >= :cutoff AND id > :last_id"
+        ), {
+            "cutoff": datetime.now() - timedelta(seconds=INCREMENTAL_WINDOW_GRACE),
+            "last_id": state["last_window_id"],
+        }).scalar()
+
+    chunks = pd.read_sql(
+        text(
+            "SELECT w.id, f.sample_query AS query, w.status, w.count AS weight "
+            "FROM attack_log_windows w JOIN query_fingerprints f ON f.id = w.fingerprint_id "
+            "WHERE w.id > :last_id AND w.id < :open_id ORDER BY w.id"
+        ),
+        engine,
+        params={
+            "last_id": state["last_window_id"],
+            "open_id": open_id if open_id is not None else 2 ** 31 - 1,
+        },
+        chunksize=chunk_size,
+    )
+    for chunk in chunks:
+        if not chunk.empty:
+            yield chunk, "last_window_id"
+
+
+def train_incremental(
+        model_out=INCREMENTAL_MODEL_FILE,
+        checkpoint=CHECKPOINT_FILE,
+        rebuild=False,
+        chunk_size=INCREMENTAL_CHUNK_SIZE,
+):
+    engine = create_engine(ANALYTICS_DATABASE_URI)
+
+    state = None if rebuild else load_checkpoint(checkpoint)
+    if state is None:
+        state = new_incremental_state()
+
+    vect = state["vectorizer"]
+    model = state["model"]
+    # Checkpoints from before log compaction have no window cursor
+    state.setdefault("last_window_id", 0)
+    start_id = state["last_id"]
+
+    new_rows = 0
+    y_eval = []
+    p_eval = []
+    w_eval = []
+    for chunk, cursor in iter_incremental_chunks(engine, state, chunk_size):
+        y = (chunk["status"] == "blocked").astype(int).to_numpy()
+        w = chunk["weight"].astype(float).to_numpy()
+        X = vect.transform(chunk["query"].map(normalize_sql))
+
+        # Progressive validation: score rows before the model learns them
+        if state["rows_seen"] > 0:
+            y_eval.append(y)
+            p_eval.append(model.predict_proba(X)[:, 1])
+            w_eval.append(w)
+
+        model.partial_fit(X, y, classes=np.array([0, 1]), sample_weight=w)
+        state["rows_seen"] += len(chunk)
+        state[cursor] = int(chunk["id"].max())
+        new_rows += len(chunk)
+
+    if new_rows == 0:
+        return {
+            "success": True,
+            "message": "Нових записів в attack_logs немає, модель не змінено",
+            "new_rows": 0,
+            "last_id": start_id,
+            "report": "",
+            "roc_auc": None,
+        }
+
+    tmp_path = f"{model_out}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump((vect, model), f)
+    os.replace(tmp_path, model_out)
+    save_checkpoint(state, checkpoint)
+    print(f"Модель донавчена на {new_rows} нових записах і збережена в {model_out}")
+
+    report = ""
+    roc = None
+    if y_eval:
+        y_true = np.concatenate(y_eval)
+        y_prob = np.concatenate(p_eval)
+        weights = np.concatenate(w_eval)
+        report = classification_report(
+            y_true,
+            (y_prob >= 0.5).astype(int),
+            digits=4,
+            zero_division=0,
+            sample_weight=weights,
+        )
+        if len(np.unique(y_true)) == 2:
+            roc = float(roc_auc_score(y_true, y_prob, sample_weight=weights))
+
+    return {
+        "success": True,
+        "message": (
+            f"Модель донавчена на {new_rows} нових записах "
+            f"і збережена в {model_out}"
+        ),
+        "new_rows": new_rows,
+        "rows_seen": state["rows_seen"],
+        "last_id": state["last_id"],
+        "report": report,
+        "roc_auc": roc,
+    }
+
+
+def promote_incremental(model_file=INCREMENTAL_MODEL_FILE, model_out=DEFAULT_PICKLE):
+    if not os.path.exists(model_file):
+        return {"success": False, "message": "Донавченої моделі ще немає, спочатку запустіть донавчання"}
+    with open(model_file, "rb") as f:
+        vect, model = pickle.load(f)
+    publish_model(vect, model, model_out)
+    message = f"Донавчена модель {model_file} опублікована в {model_out}"
+    print(message)
+    return {"success": True, "message": message, "report": "", "roc_auc": None}
+
+
+def train_model(mode="full"):
+    if mode == "full":
+        return train_from_db()
+    if mode == "rebuild":
+        return train_incremental(rebuild=True)
+    if mode == "incremental":
+        return train_incremental()
+    if mode == "promote":
+        return promote_incremental()
+    return {"success": False, "message": f"Невідомий режим навчання: {mode}"}
+
+
 if __name__ == "__main__":
-    result = train_from_db()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--mode",
+        choices=("full", "incremental", "rebuild", "promote"),
+        default="full",
+        help="full: TF-IDF + GridSearch over all rows, published for serving; "
+             "incremental: only rows added since the checkpoint, saved to "
+             f"{INCREMENTAL_MODEL_FILE}; rebuild: incremental from scratch; "
+             "promote: publish the incremental model for serving",
+    )
+    parser.add_argument(
+        "--archive",
+        default=None,
+        help="Train the full model from a Parquet archive directory written by "
+             "log_archive.py instead of querying attack_logs",
+    )
+    args = parser.parse_args()
+
+    if args.archive and args.mode != "full":
+        parser.error("--archive is only supported with --mode full")
+    result = train_from_db(archive=args.archive) if args.archive else train_model(args.mode)
     print(result["report"] if result["success"] else result["message"])
     if result["success"]:
         print("ROC AUC:", result["roc_auc"])
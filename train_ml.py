@@ -1,35 +1,50 @@
-import re
 import os
-import pickle
+import time
+import zlib
+import random
 import argparse
+import numpy as np
 import pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.linear_model import LogisticRegression
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.model_selection import train_test_split, GridSearchCV
 from sklearn.metrics import (
     classification_report,
+    precision_recall_curve,
     roc_auc_score
 )
 
+from model_artifact import publish_model
+from sql_lexer import normalize_sql
 
-def normalize_sql(sql: str) -> str:
-    s = sql.strip()
-    s = re.sub(r"'.*?'", " VAL_STR ", s)
-    s = re.sub(r'".*?"', " VAL_STR ", s)
-    s = re.sub(r"\b\d+\b", " VAL_NUM ", s)
-    s = re.sub(r"\b0x[0-9A-Fa-f]+\b", " VAL_NUM ", s)
-    s = re.sub(r"\s+", " ", s)
-    s = s.lower()
-    return s
+try:
+    import resource
+except ImportError:
+    resource = None
 
+STREAM_CHUNK_SIZE = 50000
+# Columns read from an attack_logs archive written by log_archive.py
+ARCHIVE_COLUMNS = ["query", "status", "count"]
+STREAM_HOLDOUT_MAX = 20000
+HASHING_N_FEATURES = 2 ** 20
 
-def train(csv_path, model_out="ml_model.pkl", test_size=0.2, random_state=42):
+
+def train(
+        csv_path,
+        model_out="ml_model.pkl",
+        test_size=0.2,
+        random_state=42,
+        artifact_out=None,
+):
     if not os.path.exists(csv_path):
         raise FileNotFoundError(
             f"{csv_path} not found. CSV must contain columns 'sql' and 'label'"
         )
 
-    df = pd.read_csv(csv_path)
+    if os.path.isdir(csv_path):
+        df = pd.concat(iter_dataset_chunks(csv_path), ignore_index=True)
+    else:
+        df = pd.read_csv(csv_path)
     if "sql" not in df.columns or "label" not in df.columns:
         raise ValueError("CSV must contain columns 'sql' and 'label'")
 
@@ -38,10 +53,13 @@ def train(csv_path, model_out="ml_model.pkl", test_size=0.2, random_state=42):
 
     X = df["sql_norm"].tolist()
     y = df["label"].astype(int).tolist()
+    # Compacted archive rows stand for "count" identical events
+    weights = df["weight"].to_numpy() if "weight" in df.columns else np.ones(len(df))
 
-    X_train, X_test, y_train, y_test = train_test_split(
+    X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
         X,
         y,
+        weights,
         test_size=test_size,
         random_state=random_state,
         stratify=y,
@@ -59,40 +77,229 @@ def train(csv_path, model_out="ml_model.pkl", test_size=0.2, random_state=42):
     lr = LogisticRegression(max_iter=1000, solver="liblinear")
     param_grid = {"C": [0.01, 0.1, 1, 10]}
     grid = GridSearchCV(lr, param_grid, cv=5, scoring="f1", n_jobs=-1)
-    grid.fit(X_train_vect, y_train)
+    grid.fit(X_train_vect, y_train, sample_weight=w_train)
     best = grid.best_estimator_
 
     y_pred = best.predict(X_test_vect)
     y_prob = best.predict_proba(X_test_vect)[:, 1]
 
     print("=== Classification Report (test) ===")
-    print(classification_report(y_test, y_pred, digits=4))
-    print("ROC AUC:", roc_auc_score(y_test, y_prob))
+    print(classification_report(y_test, y_pred, digits=4, sample_weight=w_test))
+    print("ROC AUC:", roc_auc_score(y_test, y_prob, sample_weight=w_test))
 
-    with open(model_out, "wb") as f:
-        pickle.dump((vect, best), f)
+    artifact_out = publish_model(vect, best, model_out, artifact_out)
     print(f"Model saved to {model_out}")
+    if artifact_out:
+        print(f"Memory-mapped model saved to {artifact_out}")
 
-    from sklearn.metrics import precision_recall_curve
-
-    prec, rec, thr = precision_recall_curve(y_test, y_prob)
+    prec, rec, thr = precision_recall_curve(y_test, y_prob, sample_weight=w_test)
     for p, r, t in zip(prec[::-1], rec[::-1], thr[::-1]):
         if p >= 0.9:
             print("Candidate threshold for precision>=0.9 ->", t)
             break
 
 
+def peak_memory_mb():
+    if resource is None:
+        return None
+    # ru_maxrss is reported in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def archive_chunk(df):
+    return pd.DataFrame({
+        "sql": df["query"],
+        "label": (df["status"] == "blocked").astype(int),
+        "weight": df["count"].astype(float),
+    })
+
+
+def iter_dataset_chunks(path, chunk_size=STREAM_CHUNK_SIZE):
+    if os.path.isdir(path):
+        try:
+            import pyarrow.dataset as ds
+        except ImportError:
+            raise ImportError("Reading Parquet requires pyarrow (pip install pyarrow)")
+
+        # Only the projected columns are read from the date=YYYY-MM-DD files
+        dataset = ds.dataset(path, format="parquet", partitioning="hive")
+        for batch in dataset.to_batches(columns=ARCHIVE_COLUMNS, batch_size=chunk_size):
+            yield archive_chunk(batch.to_pandas())
+    elif path.endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Reading Parquet requires pyarrow (pip install pyarrow)")
+
+        parquet_file = pq.ParquetFile(path)
+        for batch in parquet_file.iter_batches(
+                batch_size=chunk_size,
+                columns=["sql", "label"],
+        ):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=["sql", "label"], chunksize=chunk_size)
+
+
+def is_holdout(sql_norm: str, test_size: float) -> bool:
+    # Split by content hash so repeated queries never straddle train/test
+    return zlib.crc32(sql_norm.encode("utf-8")) % 10000 < test_size * 10000
+
+
+def train_streaming(
+        path,
+        model_out="ml_model.pkl",
+        test_size=0.2,
+        random_state=42,
+        chunk_size=STREAM_CHUNK_SIZE,
+        holdout_max=STREAM_HOLDOUT_MAX,
+):
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found. Dataset must contain columns 'sql' and 'label'"
+        )
+
+    vect = HashingVectorizer(
+        ngram_range=(1, 2),
+        n_features=HASHING_N_FEATURES,
+        alternate_sign=False,
+        norm="l2",
+    )
+    model = SGDClassifier(loss="log_loss", alpha=1e-5, random_state=random_state)
+    classes = np.array([0, 1])
+
+    rng = random.Random(random_state)
+    holdout_sql = []
+    holdout_y = []
+    holdout_w = []
+    holdout_seen = 0
+    rows = 0
+    train_rows = 0
+    started = time.perf_counter()
+
+    for chunk in iter_dataset_chunks(path, chunk_size=chunk_size):
+        chunk = chunk.dropna(subset=["sql", "label"])
+        sql_norm = chunk["sql"].astype(str).map(normalize_sql)
+        labels = chunk["label"].astype(int).to_numpy()
+        mask = sql_norm.map(lambda s: is_holdout(s, test_size)).to_numpy(dtype=bool)
+        if "weight" in chunk.columns:
+            weights = chunk["weight"].astype(float).to_numpy()
+        else:
+            weights = np.ones(len(chunk))
+
+        # Reservoir sample of the holdout rows keeps evaluation memory bounded
+        for sql, label, weight in zip(sql_norm[mask], labels[mask], weights[mask]):
+            holdout_seen += 1
+            if len(holdout_sql) < holdout_max:
+                holdout_sql.append(sql)
+                holdout_y.append(label)
+                holdout_w.append(weight)
+            else:
+                idx = rng.randrange(holdout_seen)
+                if idx < holdout_max:
+                    holdout_sql[idx] = sql
+                    holdout_y[idx] = label
+                    holdout_w[idx] = weight
+
+        train_mask = ~mask
+        if train_mask.any():
+            X = vect.transform(sql_norm[train_mask])
+            model.partial_fit(X, labels[train_mask], classes=classes, sample_weight=weights[train_mask])
+            train_rows += int(train_mask.sum())
+
+        rows += len(chunk)
+        elapsed = time.perf_counter() - started
+        peak = peak_memory_mb()
+        print(
+            f"{rows} rows ({train_rows} train, {holdout_seen} holdout), "
+            f"{rows / elapsed:.0f} rows/s"
+            + (f", peak RSS {peak:.1f} MB" if peak is not None else "")
+        )
+
+    if train_rows == 0:
+        raise ValueError("Dataset has no training rows")
+
+    publish_model(vect, model, model_out)
+    print(f"Model saved to {model_out}")
+
+    result = {
+        "rows": rows,
+        "train_rows": train_rows,
+        "holdout_rows": holdout_seen,
+        "holdout_sample": len(holdout_sql),
+        "seconds": time.perf_counter() - started,
+        "peak_memory_mb": peak_memory_mb(),
+        "roc_auc": None,
+    }
+
+    if holdout_sql:
+        y_test = np.array(holdout_y)
+        w_test = np.array(holdout_w)
+        y_prob = model.predict_proba(vect.transform(holdout_sql))[:, 1]
+        print(f"=== Classification Report (holdout sample of {len(holdout_sql)}) ===")
+        print(classification_report(
+            y_test, (y_prob >= 0.5).astype(int), digits=4, zero_division=0, sample_weight=w_test
+        ))
+        if len(np.unique(y_test)) == 2:
+            result["roc_auc"] = roc_auc_score(y_test, y_prob, sample_weight=w_test)
+            print("ROC AUC:", result["roc_auc"])
+
+            prec, rec, thr = precision_recall_curve(y_test, y_prob, sample_weight=w_test)
+            for p, r, t in zip(prec[::-1], rec[::-1], thr[::-1]):
+                if p >= 0.9:
+                    print("Candidate threshold for precision>=0.9 ->", t)
+                    break
+
+    return result
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--csv",
         required=True,
-        help="Path to dataset CSV (columns: sql,label)",
+        help="Path to dataset CSV (columns: sql,label) or to an attack_logs "
+             "archive directory from log_archive.py; with --stream a .parquet "
+             "file is accepted too",
     )
     parser.add_argument(
         "--out",
         default="ml_model.pkl",
         help="Output pickle file (vectorizer, model)",
     )
+    parser.add_argument(
+        "--artifact-out",
+        default=None,
+        help="Also export a memory-mapped model directory (see model_artifact.py)",
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Out-of-core training: read the dataset in chunks and fit "
+             "a hashing vectorizer + SGD model with partial_fit",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=STREAM_CHUNK_SIZE,
+        help="Rows per chunk in --stream mode",
+    )
+    parser.add_argument(
+        "--holdout-max",
+        type=int,
+        default=STREAM_HOLDOUT_MAX,
+        help="Maximum size of the streamed holdout sample in --stream mode",
+    )
     args = parser.parse_args()
-    train(args.csv, model_out=args.out)
+    if args.stream and args.artifact_out:
+        # Hashing models have no vocabulary to map: only the pickle is written
+        parser.error("--artifact-out is not supported with --stream")
+    if args.stream:
+        train_streaming(
+            args.csv,
+            model_out=args.out,
+            chunk_size=args.chunk_size,
+            holdout_max=args.holdout_max,
+        )
+    else:
+        train(args.csv, model_out=args.out, artifact_out=args.artifact_out)
@@ -0,0 +1,129 @@
+import re
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+from sql_lexer import lex
+
+VERDICT_CACHE_MAX_ENTRIES = 10000
+VERDICT_CACHE_MAX_BYTES = 8 * 1024 * 1024
+VERDICT_CACHE_TTL = 300
+MODEL_CHECK_INTERVAL = 1.0
+
+# Fingerprints fold literals, case and whitespace away; queries with escaped or
+# doubled quotes, comments, identifiers quoted in other ways or multi-line
+# strings are left to the rules every time rather than trusted to that folding
+_RULE_UNSAFE = re.compile(r"""[\\`$\[#]|''|""|--|/\*""")
+
+
+def fingerprint(sql: str, tokens=None) -> str:
+    return (tokens if tokens is not None else lex(sql)).normalized
+
+
+def fingerprint_preserves_rules(sql: str) -> bool:
+    if _RULE_UNSAFE.search(sql):
+        return False
+
+    has_single = "'" in sql
+    has_double = '"' in sql
+    if has_single and has_double:
+        return False
+    if (has_single or has_double) and ("\n" in sql or "\r" in sql):
+        return False
+    return True
+
+
+def _entry_size(key, value) -> int:
+    size = sys.getsizeof(key) + sys.getsizeof(value)
+    if isinstance(value, tuple):
+        size += sum(sys.getsizeof(item) for item in value)
+    return size
+
+
+class VerdictCache:
+    def __init__(
+            self,
+            max_entries=VERDICT_CACHE_MAX_ENTRIES,
+            max_bytes=VERDICT_CACHE_MAX_BYTES,
+            ttl=VERDICT_CACHE_TTL,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, size, expires_at = entry
+            if self.ttl is not None and expires_at <= now:
+                del self._entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = _entry_size(key, value)
+        if size > self.max_bytes:
+            return
+
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[1]
+
+            self._entries[key] = (value, size, expires_at)
+            self.bytes += size
+
+            while (
+                    len(self._entries) > self.max_entries
+                    or self.bytes > self.max_bytes
+            ):
+                _, (_, old_size, _) = self._entries.popitem(last=False)
+                self.bytes -= old_size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.invalidations += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+            }